@@ -10,11 +10,35 @@ a = Analysis(
         'load_data',
         'utils',
         'migrate',
+        'journal',
+        'sync',
+        'alerts',
+        'batch_entry',
+        'simulate',
+        'returns',
+        'backtest',
+        'ticks',
         'stocks_reader',
         'planner',
         'settings',
         'filter_trades',
+        'trade_query',
+        'query_cache',
+        'replica',
+        'serve',
         'menu',
+        'dashboard',
+        'valuation',
+        'paging',
+        'profiler',
+        'repository',
+        'funds_query',
+        'consolidated',
+        'session',
+        'snapshot',
+        'rollup',
+        'archive',
+        'fx_rates',
         'calculator',
         'pandas',
         'openpyxl',
@@ -1,12 +1,13 @@
 -- Schema For TraderCLI application in SQLite
+-- Money is stored in integer units: prices in 1/10000 of a dollar, amounts in cents (src/repository.py)
 
 CREATE TABLE FUNDS (
     ID INTEGER PRIMARY KEY AUTOINCREMENT,
     opr TEXT NOT NULL CHECK (opr IN ('deposit', 'withdraw')),
     fund_date TEXT NOT NULL,
     source TEXT NOT NULL,
-    amount_SAR REAL NOT NULL,
-    amount_USD REAL NOT NULL,
+    amount_SAR INTEGER NOT NULL,
+    amount_USD INTEGER NOT NULL,
     rate_exchange REAL NOT NULL
 );
 
@@ -16,12 +17,208 @@ CREATE TABLE TRADES (
     symbol TEXT NOT NULL,
     opr TEXT NOT NULL CHECK (opr IN ('buy', 'sell')),
     filled_qty INTEGER NOT NULL,
-    price REAL NOT NULL,
-    fees REAL NOT NULL,
-    vat REAL NOT NULL,
-    cost_value REAL,
-    profit_loss REAL,   
+    price INTEGER NOT NULL,
+    fees INTEGER NOT NULL,
+    vat INTEGER NOT NULL,
+    cost_value INTEGER,
+    profit_loss INTEGER,
     is_position_open INTEGER,
-    closed_position_price REAL,
-    closed_position_amount REAL
+    closed_position_price INTEGER,
+    closed_position_amount INTEGER
 );
+
+CREATE INDEX IF NOT EXISTS idx_trades_price ON TRADES (price);
+CREATE INDEX IF NOT EXISTS idx_trades_symbol_opr_price ON TRADES (symbol, opr, price);
+CREATE INDEX IF NOT EXISTS idx_trades_open_symbol ON TRADES (is_position_open, symbol);
+CREATE INDEX IF NOT EXISTS idx_trades_date ON TRADES ((SUBSTR(trade_date, 7, 4) || SUBSTR(trade_date, 4, 2) || SUBSTR(trade_date, 1, 2)));
+CREATE INDEX IF NOT EXISTS idx_funds_date ON FUNDS ((SUBSTR(fund_date, 7, 4) || SUBSTR(fund_date, 4, 2) || SUBSTR(fund_date, 1, 2)));
+CREATE INDEX IF NOT EXISTS idx_funds_source ON FUNDS (source COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS FX_RATES (
+    rate_date INTEGER PRIMARY KEY,
+    rate REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS JOURNAL (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    created TEXT NOT NULL,
+    action TEXT NOT NULL,
+    ref INTEGER,
+    changes TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS JOURNAL_SNAPSHOTS (
+    seq INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    stacks TEXT NOT NULL,
+    state BLOB NOT NULL
+);
+
+-- Rows of each snapshot in chunks of IDs, a chunk written again only when the journal tail touched it
+CREATE TABLE IF NOT EXISTS JOURNAL_SNAPSHOT_CHUNKS (
+    tbl TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    columns TEXT NOT NULL,
+    rows BLOB NOT NULL,
+    PRIMARY KEY (tbl, chunk, seq)
+);
+
+-- Changeset sync with other machines, see src/sync.py
+CREATE TABLE IF NOT EXISTS SYNC_PEERS (
+    peer TEXT PRIMARY KEY,
+    acked_seq INTEGER NOT NULL DEFAULT 0,
+    imported_seq INTEGER NOT NULL DEFAULT 0,
+    synced TEXT
+);
+
+-- Local journal entries that came from a peer, never exported back to it
+CREATE TABLE IF NOT EXISTS SYNC_APPLIED (
+    seq INTEGER PRIMARY KEY,
+    peer TEXT NOT NULL,
+    peer_seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sync_applied_peer ON SYNC_APPLIED (peer, seq);
+
+-- Peer rows given a new local ID because both machines inserted under the same one
+CREATE TABLE IF NOT EXISTS SYNC_IDS (
+    peer TEXT NOT NULL,
+    family TEXT NOT NULL,
+    peer_id INTEGER NOT NULL,
+    local_id INTEGER NOT NULL,
+    PRIMARY KEY (peer, family, peer_id)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sync_ids_local ON SYNC_IDS (peer, family, local_id);
+
+-- Price alerts on planner levels, see src/alerts.py. price and fired_price in 1/10000 dollar,
+-- above = 1 when the level was above the price when set (fires when a quote reaches it from below)
+CREATE TABLE IF NOT EXISTS ALERTS (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol TEXT NOT NULL,
+    label TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    above INTEGER NOT NULL,
+    created TEXT NOT NULL,
+    fired TEXT,
+    fired_price INTEGER,
+    dismissed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_pending ON ALERTS (symbol, price) WHERE fired IS NULL;
+CREATE INDEX IF NOT EXISTS idx_alerts_fired ON ALERTS (fired) WHERE fired IS NOT NULL AND dismissed = 0;
+
+-- Dividends received, for the money-weighted returns in src/returns.py. amount_USD in cents
+CREATE TABLE IF NOT EXISTS DIVIDENDS (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    pay_date TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    amount_USD INTEGER NOT NULL
+);
+
+-- Daily price bars cached by src/backtest.py, prices in 1/10000 dollars
+CREATE TABLE IF NOT EXISTS PRICE_BARS (
+    symbol TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    open INTEGER NOT NULL,
+    high INTEGER NOT NULL,
+    low INTEGER NOT NULL,
+    close INTEGER NOT NULL,
+    PRIMARY KEY (symbol, day)
+) WITHOUT ROWID;
+
+-- Symbol ids of the binary quote journal (<account>.ticks) and the daily bars compacted from it, see src/ticks.py
+CREATE TABLE IF NOT EXISTS QUOTE_SYMBOLS (
+    ID INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS QUOTE_BARS (
+    symbol TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    open INTEGER NOT NULL,
+    high INTEGER NOT NULL,
+    low INTEGER NOT NULL,
+    close INTEGER NOT NULL,
+    ticks INTEGER NOT NULL,
+    PRIMARY KEY (symbol, day)
+) WITHOUT ROWID;
+
+-- Closed trades moved out of TRADES by src/archive.py, IDs are kept
+CREATE TABLE IF NOT EXISTS TRADES_ARCHIVE (
+    ID INTEGER PRIMARY KEY,
+    trade_date TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    opr TEXT NOT NULL CHECK (opr IN ('buy', 'sell')),
+    filled_qty INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    fees INTEGER NOT NULL,
+    vat INTEGER NOT NULL,
+    cost_value INTEGER,
+    profit_loss INTEGER,
+    is_position_open INTEGER,
+    closed_position_price INTEGER,
+    closed_position_amount INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_trades_archive_symbol_opr_price ON TRADES_ARCHIVE (symbol, opr, price);
+CREATE INDEX IF NOT EXISTS idx_trades_archive_date ON TRADES_ARCHIVE ((SUBSTR(trade_date, 7, 4) || SUBSTR(trade_date, 4, 2) || SUBSTR(trade_date, 1, 2)));
+
+-- Kept up to date by the trades_rollup_* and trades_archive_rollup_* triggers generated in src/rollup.py
+CREATE TABLE IF NOT EXISTS SYMBOL_ROLLUP (
+    symbol TEXT NOT NULL,
+    buy_count INTEGER NOT NULL DEFAULT 0,
+    sell_count INTEGER NOT NULL DEFAULT 0,
+    buy_qty INTEGER NOT NULL DEFAULT 0,
+    sell_qty INTEGER NOT NULL DEFAULT 0,
+    buy_cost INTEGER NOT NULL DEFAULT 0,
+    sell_cost INTEGER NOT NULL DEFAULT 0,
+    realized_pl INTEGER NOT NULL DEFAULT 0,
+    fees INTEGER NOT NULL DEFAULT 0,
+    vat INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (symbol)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS MONTH_ROLLUP (
+    month INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    buy_count INTEGER NOT NULL DEFAULT 0,
+    sell_count INTEGER NOT NULL DEFAULT 0,
+    buy_qty INTEGER NOT NULL DEFAULT 0,
+    sell_qty INTEGER NOT NULL DEFAULT 0,
+    buy_cost INTEGER NOT NULL DEFAULT 0,
+    sell_cost INTEGER NOT NULL DEFAULT 0,
+    realized_pl INTEGER NOT NULL DEFAULT 0,
+    fees INTEGER NOT NULL DEFAULT 0,
+    vat INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, symbol)
+) WITHOUT ROWID;
+
+-- Live trades only, per trade day, for conversion at each day's exchange rate
+CREATE TABLE IF NOT EXISTS DAY_ROLLUP (
+    day INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    buy_count INTEGER NOT NULL DEFAULT 0,
+    sell_count INTEGER NOT NULL DEFAULT 0,
+    buy_qty INTEGER NOT NULL DEFAULT 0,
+    sell_qty INTEGER NOT NULL DEFAULT 0,
+    buy_cost INTEGER NOT NULL DEFAULT 0,
+    sell_cost INTEGER NOT NULL DEFAULT 0,
+    realized_pl INTEGER NOT NULL DEFAULT 0,
+    fees INTEGER NOT NULL DEFAULT 0,
+    vat INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, symbol)
+) WITHOUT ROWID;
+
+-- Archived trades only, per trade day, for conversion at each day's exchange rate
+CREATE TABLE IF NOT EXISTS ARCHIVE_ROLLUP (
+    day INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    buy_count INTEGER NOT NULL DEFAULT 0,
+    sell_count INTEGER NOT NULL DEFAULT 0,
+    buy_qty INTEGER NOT NULL DEFAULT 0,
+    sell_qty INTEGER NOT NULL DEFAULT 0,
+    buy_cost INTEGER NOT NULL DEFAULT 0,
+    sell_cost INTEGER NOT NULL DEFAULT 0,
+    realized_pl INTEGER NOT NULL DEFAULT 0,
+    fees INTEGER NOT NULL DEFAULT 0,
+    vat INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, symbol)
+) WITHOUT ROWID;
@@ -0,0 +1,136 @@
+"""
+Price alerts on the levels the planner computes (supports, resistance, all-time high, exit
+prices). ALERTS keeps every alert; fired ones hold the time and the quote that reached them
+and stay on the dashboard until dismissed.
+
+An alert remembers which side of the price it was set on, so it fires when a quote reaches
+its level from that side. AlertBook holds the pending alerts of an account as two sorted
+price arrays per symbol, levels above the price and levels below it. Every pending level
+above lies beyond the previous quote, so the levels a new quote crossed are a prefix of the
+above array and a suffix of the below one, found by binary search: a quote update costs
+log(alerts of the symbol) plus the alerts that fire.
+"""
+from __future__ import annotations
+import sqlite3
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+from repository import projection, select, to_price
+
+@dataclass(slots=True)
+class Alert:
+    ID: int
+    symbol: str
+    label: str
+    price: float
+    above: int
+    created: str
+    fired: str | None = None
+    fired_price: float | None = None
+    dismissed: int = 0
+
+    def describe(self) -> str:
+        return f"{self.symbol} {'rose to' if self.above else 'fell to'} ${self.price:,.2f} ({self.label.replace('_', ' ')})"
+
+ALERT_SQL = f"SELECT {projection(Alert)} FROM ALERTS"
+
+class AlertBook:
+    """
+    Pending alerts per symbol: sorted levels in price units with their alert IDs alongside.
+    """
+    def __init__(self):
+        self.above = {}
+        self.below = {}
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection) -> AlertBook:
+        book = cls()
+        for alert_id, symbol, price, above in conn.execute("SELECT ID, symbol, price, above FROM ALERTS WHERE fired IS NULL ORDER BY symbol, price"):
+            levels, ids = (book.above if above else book.below).setdefault(symbol, ([], []))
+            levels.append(price)
+            ids.append(alert_id)
+        return book
+
+    def __len__(self) -> int:
+        return sum(len(levels) for side in (self.above, self.below) for levels, _ in side.values())
+
+    def add(self, alert_id: int, symbol: str, price: int, above: bool):
+        levels, ids = (self.above if above else self.below).setdefault(symbol, ([], []))
+        index = bisect_right(levels, price)
+        levels.insert(index, price)
+        ids.insert(index, alert_id)
+
+    def crossed(self, symbol: str, price: int) -> list[int]:
+        """
+        Takes the alerts a quote (in price units) reached out of the book and returns their IDs.
+        """
+        fired = []
+        if symbol in self.above:
+            levels, ids = self.above[symbol]
+            end = bisect_right(levels, price)
+            fired += ids[:end]
+            del levels[:end], ids[:end]
+        if symbol in self.below:
+            levels, ids = self.below[symbol]
+            start = bisect_left(levels, price)
+            fired += ids[start:]
+            del levels[start:], ids[start:]
+        return fired
+
+def add_alert(conn: sqlite3.Connection, symbol: str, label: str, price: float, current_price: float | None) -> int:
+    """
+    Stores an alert on a level, firing when a quote reaches it from the side current_price
+    is on (from below when unknown). Returns its ID. The caller commits.
+    """
+    above = current_price is None or price >= current_price
+    cursor = conn.execute("INSERT INTO ALERTS (symbol, label, price, above, created) VALUES (?, ?, ?, ?, ?)",
+                          (symbol, label, to_price(price), int(above), datetime.now().isoformat(timespec='seconds')))
+    return cursor.lastrowid
+
+def add_levels(conn: sqlite3.Connection, symbol: str, levels: dict, current_price: float) -> int:
+    """
+    An alert for each planner level with a positive price. Returns the number added. The caller commits.
+    """
+    added = 0
+    for label, price in levels.items():
+        if label != 'current_price' and price > 0:
+            add_alert(conn, symbol, label, price, current_price)
+            added += 1
+    return added
+
+def check_quote(conn: sqlite3.Connection, book: AlertBook, symbol: str, price: float) -> list[Alert]:
+    """
+    Fires and persists the pending alerts a new quote reached. Returns them.
+    """
+    alert_ids = book.crossed(symbol, to_price(price))
+    if not alert_ids:
+        return []
+    placeholders = ", ".join("?" * len(alert_ids))
+    conn.execute(f"UPDATE ALERTS SET fired = ?, fired_price = ? WHERE ID IN ({placeholders})",
+                 [datetime.now().isoformat(timespec='seconds'), to_price(price), *alert_ids])
+    conn.commit()
+    return _alerts(conn, f"WHERE ID IN ({placeholders}) ORDER BY price", alert_ids)
+
+def _alerts(conn: sqlite3.Connection, where: str, params=()) -> list[Alert]:
+    return list(select(conn, Alert, f"{ALERT_SQL} {where}", params))
+
+def fired(conn: sqlite3.Connection, limit: int = -1) -> list[Alert]:
+    """
+    Fired alerts not dismissed yet, newest first, as the dashboard shows them.
+    """
+    return _alerts(conn, "WHERE fired IS NOT NULL AND dismissed = 0 ORDER BY fired DESC, ID DESC LIMIT ?", (limit,))
+
+def fired_count(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM ALERTS WHERE fired IS NOT NULL AND dismissed = 0").fetchone()[0]
+
+def pending(conn: sqlite3.Connection) -> list[Alert]:
+    return _alerts(conn, "WHERE fired IS NULL ORDER BY symbol, price")
+
+def dismiss(conn: sqlite3.Connection) -> int:
+    """
+    Hides every fired alert from the dashboard, they stay in ALERTS. The caller commits.
+    """
+    return conn.execute("UPDATE ALERTS SET dismissed = 1 WHERE fired IS NOT NULL AND dismissed = 0").rowcount
+
+def delete(conn: sqlite3.Connection, alert_id: int) -> bool:
+    return conn.execute("DELETE FROM ALERTS WHERE ID = ?", (alert_id,)).rowcount > 0
@@ -0,0 +1,72 @@
+"""
+Archive of closed trades. archive_closed() moves closed buys and sells dated before a
+cutoff from TRADES to TRADES_ARCHIVE, keeping their IDs, as one journal entry so undo
+brings them back. The rollups sum both tables (see rollup.py), so the moved trades carry
+their contribution forward in the symbol, month and per day archive rollup rows and the
+dashboard totals, holdings and monthly report do not change.
+
+TRADES stays the size of the recent and open book. Filtered trade lists only read the
+archive when the filter asks for history, see resolve().
+"""
+from __future__ import annotations
+import sqlite3
+import journal
+from repository import Trade, amount_sql, columns
+from trade_query import TradeFilter
+from utils import date_key_sql
+
+COLUMNS = ", ".join(columns(Trade))
+
+# Closed trades dated before a YYYYMMDD key, the rows archive_closed() moves
+CLOSED_BEFORE = f"COALESCE(is_position_open, 0) = 0 AND {date_key_sql('trade_date')} < ?"
+
+def archived_until(conn: sqlite3.Connection) -> str | None:
+    """
+    YYYYMMDD key of the latest archived trade, None when the archive is empty.
+    """
+    return conn.execute(f"SELECT MAX({date_key_sql('trade_date')}) FROM TRADES_ARCHIVE").fetchone()[0]
+
+def reaches_archive(trade_filter: TradeFilter, until: str | None) -> bool:
+    """
+    True when a filter's date range starts on or before the latest archived trade.
+    """
+    return until is not None and trade_filter.has_date() and (trade_filter.date_from is None or trade_filter.date_from <= until)
+
+def resolve(conn: sqlite3.Connection, trade_filter: TradeFilter) -> TradeFilter:
+    """
+    The filter with history turned on when its date range reaches archived trades.
+    """
+    if trade_filter.history or not reaches_archive(trade_filter, archived_until(conn)):
+        return trade_filter
+    return trade_filter.update(history=True)
+
+def preview(conn: sqlite3.Connection, before: str) -> tuple[int, float]:
+    """
+    Number and realized P/L of the trades archive_closed(before) would move.
+    """
+    return conn.execute(f"SELECT COUNT(*), {amount_sql('COALESCE(SUM(profit_loss), 0)')} FROM TRADES WHERE {CLOSED_BEFORE}", (before,)).fetchone()
+
+def archive_closed(conn: sqlite3.Connection, before: str) -> int:
+    """
+    Moves closed trades dated before the YYYYMMDD key into TRADES_ARCHIVE and journals the
+    move as one 'archive' entry. Returns the number of trades moved. The caller commits.
+    """
+    cursor = conn.execute(f"SELECT * FROM TRADES WHERE {CLOSED_BEFORE} ORDER BY ID", (before,))
+    names = [column[0] for column in cursor.description]
+    rows = [dict(zip(names, values)) for values in cursor]
+    if not rows:
+        return 0
+    conn.execute(f"INSERT INTO TRADES_ARCHIVE ({COLUMNS}) SELECT {COLUMNS} FROM TRADES WHERE {CLOSED_BEFORE}", (before,))
+    conn.execute(f"DELETE FROM TRADES WHERE {CLOSED_BEFORE}", (before,))
+    changes = []
+    for row in rows:
+        changes.append(journal.Change('TRADES', row['ID'], row, None))
+        changes.append(journal.Change('TRADES_ARCHIVE', row['ID'], None, row))
+    journal.record(conn, 'archive', changes)
+    return len(rows)
+
+def counts(conn: sqlite3.Connection) -> tuple[int, int]:
+    """
+    Trades in TRADES and in TRADES_ARCHIVE.
+    """
+    return conn.execute("SELECT (SELECT COUNT(*) FROM TRADES), (SELECT COUNT(*) FROM TRADES_ARCHIVE)").fetchone()
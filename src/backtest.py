@@ -0,0 +1,348 @@
+"""
+Backtest of the planner's exit rules on our own entries, against daily bars cached in PRICE_BARS.
+
+Every buy in TRADES and TRADES_ARCHIVE is an entry. Sells are matched to the buys first in,
+first out, closed lots before open ones, which splits the buys into pieces with an actual exit
+(a sell's price and date) or none (still held, valued at the last cached close). The rules
+then watch each piece from the day after its entry until the day before its actual exit:
+
+- stop: the planner's "stop below key support 1", sell everything once a day's low reaches
+  the level stop% under the reference, filled at that level or the open when it gapped below.
+- cut: its "cut 50% on weekly close below key support 2", sell cut_fraction of the piece
+  at the first weekly close under cut% below the reference.
+
+The reference is the entry price, or with trailing the highest close since the entry. A piece
+the rules leave alone exits as it actually did, so each cell of the sweep compares the rules'
+realized P/L with what actually happened, on prices, before fees.
+
+The first day a rule fires is found by binary search on the running minimum of low (or
+weekly close) over the reference, for every stop and cut level at once; the stop x cut grid
+then follows by broadcasting. Symbols are replayed in a process pool.
+"""
+from __future__ import annotations
+import csv
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+import profiler
+from repository import price_sql, to_price
+from returns import key_days
+from settings import Settings
+from simulate import parse_values
+from utils import date_key_sql, get_db_path
+
+# A level 100% under the reference is never reached: the rule is off
+OFF = 1.0
+CUT_FRACTION = 0.5
+
+@dataclass
+class Bars:
+    """
+    Daily bars of one symbol in date order, prices in dollars.
+    """
+    days: np.ndarray
+    open: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+
+    @property
+    def weekly(self) -> np.ndarray:
+        """
+        True on the last bar of each week (Monday to Sunday), the weekly close.
+        """
+        weeks = (key_days(self.days) + 3) // 7
+        return np.r_[weeks[1:] != weeks[:-1], True] if len(weeks) else np.zeros(0, dtype=bool)
+
+@dataclass
+class Pieces:
+    """
+    Entries of one symbol, split where sells closed part of a buy. exit_day is 0 for shares still held.
+    """
+    entry_day: np.ndarray
+    entry_price: np.ndarray
+    qty: np.ndarray
+    exit_day: np.ndarray
+    exit_price: np.ndarray
+
+@dataclass
+class Sweep:
+    """
+    Rule P/L per symbol and (stop, cut) cell, next to the actual P/L of the same pieces.
+    """
+    stops: np.ndarray
+    cuts: np.ndarray
+    trailing: bool
+    symbols: list = field(default_factory=list)
+    actual: np.ndarray = None
+    rule: np.ndarray = None
+    stopped: np.ndarray = None
+    cut: np.ndarray = None
+    missing: list = field(default_factory=list)
+
+    def gain(self) -> np.ndarray:
+        """
+        Rule P/L minus actual P/L over all symbols, per (stop, cut) cell.
+        """
+        return self.rule.sum(axis=0) - self.actual.sum()
+
+    def best(self) -> tuple[int, int]:
+        return np.unravel_index(int(np.argmax(self.gain())), self.gain().shape)
+
+def load_bars(conn: sqlite3.Connection, symbol: str) -> Bars:
+    rows = conn.execute(f"SELECT day, {price_sql('open')}, {price_sql('low')}, {price_sql('close')} FROM PRICE_BARS WHERE symbol = ? ORDER BY day", (symbol,)).fetchall()
+    days, opens, lows, closes = (np.asarray(column) for column in zip(*rows)) if rows else (np.zeros(0, dtype=np.int64),) + (np.zeros(0),) * 3
+    return Bars(days.astype(np.int64), opens, lows, closes)
+
+def save_bars(conn: sqlite3.Connection, symbol: str, rows) -> int:
+    """
+    Stores (YYYYMMDD, open, high, low, close) rows in dollars, replacing cached days. The caller commits.
+    """
+    rows = [(symbol, int(day), to_price(o), to_price(h), to_price(l), to_price(c)) for day, o, h, l, c in rows]
+    conn.executemany("INSERT OR REPLACE INTO PRICE_BARS (symbol, day, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+def cached(conn: sqlite3.Connection) -> list[tuple]:
+    """
+    (symbol, first day, last day, bars) per cached symbol.
+    """
+    return conn.execute("SELECT symbol, MIN(day), MAX(day), COUNT(*) FROM PRICE_BARS GROUP BY symbol ORDER BY symbol").fetchall()
+
+def traded_symbols(conn: sqlite3.Connection) -> list[tuple]:
+    """
+    (symbol, first trade day) of every symbol bought, archived trades included.
+    """
+    return conn.execute(f"""
+        SELECT symbol, MIN(day) FROM (
+            SELECT symbol, CAST({date_key_sql('trade_date')} AS INTEGER) AS day FROM TRADES WHERE opr = 'buy'
+            UNION ALL
+            SELECT symbol, day FROM ARCHIVE_ROLLUP WHERE buy_count > 0
+        ) GROUP BY symbol ORDER BY symbol
+    """).fetchall()
+
+def fetch_bars(conn: sqlite3.Connection, symbol: str, first_day: int) -> int:
+    """
+    Daily bars from Yahoo Finance since the last cached day, or first_day for a new symbol.
+    Returns the number of bars stored. The caller commits.
+    """
+    # Imported here so the replay workers do not load it
+    import yfinance as yf
+    last = conn.execute("SELECT MAX(day) FROM PRICE_BARS WHERE symbol = ?", (symbol,)).fetchone()[0]
+    start = datetime.strptime(str(last or first_day), "%Y%m%d").date() + timedelta(days=1 if last else 0)
+    if start > date.today():
+        return 0
+    history = yf.Ticker(symbol.replace("$", "")).history(start=start.isoformat(), interval="1d", auto_adjust=False)
+    days = history.index.strftime("%Y%m%d").astype(int)
+    return save_bars(conn, symbol, zip(days, history['Open'], history['High'], history['Low'], history['Close']))
+
+def import_csv(conn: sqlite3.Connection, symbol: str, path: str) -> int:
+    """
+    Bars from a CSV with Date (YYYY-MM-DD), Open, High, Low and Close columns, as Yahoo Finance
+    exports them. The caller commits.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [(row['Date'][:10].replace('-', ''), float(row['Open']), float(row['High']), float(row['Low']), float(row['Close']))
+                for row in csv.DictReader(f) if row.get('Close') not in (None, '', 'null')]
+    return save_bars(conn, symbol, rows)
+
+def load_pieces(conn: sqlite3.Connection) -> dict:
+    """
+    Pieces per symbol from every buy and sell, sells matched first in, first out to the
+    closed buys and then to the open ones.
+    """
+    rows = conn.execute(f"""
+        SELECT symbol, CAST({date_key_sql('trade_date')} AS INTEGER) AS day, opr, filled_qty, {price_sql('price')}, is_position_open, ID FROM TRADES
+        UNION ALL
+        SELECT symbol, CAST({date_key_sql('trade_date')} AS INTEGER), opr, filled_qty, {price_sql('price')}, 0, ID FROM TRADES_ARCHIVE
+        ORDER BY 1, 2, 7
+    """).fetchall()
+    lots = {}
+    for symbol, day, opr, qty, price, is_open, _ in rows:
+        closed, held, done = lots.setdefault(symbol, ([], [], []))
+        if opr == 'buy':
+            (held if is_open else closed).append([day, price, qty])
+            continue
+        for queue in (closed, held):
+            while qty > 0 and queue:
+                lot = queue[0]
+                sold = min(qty, lot[2])
+                done.append((lot[0], lot[1], sold, day, price))
+                lot[2] -= sold
+                qty -= sold
+                if lot[2] == 0:
+                    queue.pop(0)
+    pieces = {}
+    for symbol, (closed, held, done) in lots.items():
+        # Shares of a closed buy that no sell accounts for are taken as still held
+        entries = done + [(day, price, qty, 0, 0.0) for day, price, qty in closed + held]
+        if entries:
+            pieces[symbol] = Pieces(*(np.asarray(column) for column in zip(*sorted(entries))))
+    return pieces
+
+def _first(running_min: np.ndarray, levels: np.ndarray, strict: bool) -> np.ndarray:
+    """
+    Index of the first bar whose running minimum is at (or, strict, under) each level, len() when none.
+    """
+    return np.searchsorted(-running_min, -levels, side='right' if strict else 'left')
+
+def replay(bars: Bars, pieces: Pieces, stops: np.ndarray, cuts: np.ndarray, trailing: bool = False,
+           cut_fraction: float = CUT_FRACTION) -> tuple[float, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Actual P/L of the pieces and, per (stop, cut) cell, the rules' P/L and how many pieces each rule sold.
+    """
+    stop_levels, cut_levels = 1.0 - stops, 1.0 - cuts
+    weekly = bars.weekly
+    last_close = bars.close[-1]
+    starts = np.searchsorted(bars.days, pieces.entry_day, side='right')
+    ends = np.where(pieces.exit_day > 0, np.searchsorted(bars.days, pieces.exit_day, side='left'), len(bars.days))
+    exit_prices = np.where(pieces.exit_day > 0, pieces.exit_price, last_close)
+    actual = float(np.sum(pieces.qty * (exit_prices - pieces.entry_price)))
+    rule = np.zeros((len(stops), len(cuts)))
+    stopped = np.zeros(rule.shape, dtype=np.int64)
+    cut_count = np.zeros(rule.shape, dtype=np.int64)
+    for start, end, entry, qty, exit_price in zip(starts.tolist(), ends.tolist(), pieces.entry_price.tolist(), pieces.qty.tolist(), exit_prices.tolist()):
+        if end <= start:
+            # Sold before the next bar, or no bars after the entry
+            rule += qty * (exit_price - entry)
+            continue
+        low, close, opens = bars.low[start:end], bars.close[start:end], bars.open[start:end]
+        if trailing:
+            reference = np.maximum.accumulate(np.r_[entry, close[:-1]])
+        else:
+            reference = np.full(end - start, entry)
+        stop_at = _first(np.minimum.accumulate(low / reference), stop_levels, strict=False)
+        weekly_ratio = np.where(weekly[start:end], close / reference, np.inf)
+        cut_at = _first(np.minimum.accumulate(weekly_ratio), cut_levels, strict=True)
+        n = end - start
+        hit = stop_at < n
+        index = np.minimum(stop_at, n - 1)
+        rest = np.where(hit, np.minimum(opens[index], reference[index] * stop_levels), exit_price)
+        cut_price = close[np.minimum(cut_at, n - 1)]
+        cut_first = cut_at[None, :] < stop_at[:, None]
+        value = np.where(cut_first, cut_fraction * cut_price[None, :] + (1 - cut_fraction) * rest[:, None], rest[:, None])
+        rule += qty * (value - entry)
+        stopped += hit[:, None]
+        cut_count += cut_first
+    return actual, rule, stopped, cut_count
+
+def _replay_job(job: tuple) -> tuple:
+    symbol, bars, pieces, stops, cuts, trailing = job
+    return (symbol,) + replay(bars, pieces, stops, cuts, trailing)
+
+def sweep(conn: sqlite3.Connection, stops, cuts, trailing: bool = False, symbols: list | None = None, workers: int | None = None) -> Sweep:
+    """
+    Replays every symbol with cached bars over the stop x cut grid (fractions, OFF disables a rule).
+    workers processes replay the symbols, one runs them in this process.
+    """
+    result = Sweep(np.asarray(stops, dtype=np.float64), np.asarray(cuts, dtype=np.float64), trailing)
+    jobs = []
+    for symbol, pieces in sorted(load_pieces(conn).items()):
+        if symbols is not None and symbol not in symbols:
+            continue
+        bars = load_bars(conn, symbol)
+        if not len(bars.days):
+            result.missing.append(symbol)
+            continue
+        jobs.append((symbol, bars, pieces, result.stops, result.cuts, trailing))
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(_replay_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        outcomes = [_replay_job(job) for job in jobs]
+    shape = (len(result.stops), len(result.cuts))
+    result.symbols = [outcome[0] for outcome in outcomes]
+    result.actual = np.asarray([outcome[1] for outcome in outcomes], dtype=np.float64)
+    result.rule = np.asarray([outcome[2] for outcome in outcomes]).reshape(len(outcomes), *shape)
+    result.stopped = sum((outcome[3] for outcome in outcomes), np.zeros(shape, dtype=np.int64))
+    result.cut = sum((outcome[4] for outcome in outcomes), np.zeros(shape, dtype=np.int64))
+    return result
+
+def level_text(level: float) -> str:
+    return "off" if level >= OFF else f"{level * 100:g}%"
+
+def money_text(value: float) -> str:
+    return f"[red]${value:,.2f}[/red]" if value < 0 else f"[green]${value:,.2f}[/green]"
+
+def sweep_table(result: Sweep) -> Table:
+    reference = "trailing high" if result.trailing else "entry"
+    table = Table(title=f"Rule P/L minus actual P/L, stop (rows) x cut {CUT_FRACTION:.0%} on weekly close (columns) below the {reference}")
+    table.add_column("Stop", style="yellow", justify="right")
+    for cut in result.cuts.tolist():
+        table.add_column(level_text(cut), justify="right")
+    gain = result.gain()
+    best = result.best()
+    for row, stop in enumerate(result.stops.tolist()):
+        cells = []
+        for column in range(len(result.cuts)):
+            text = money_text(gain[row, column])
+            cells.append(f"[bold]{text}[/bold] *" if (row, column) == best else text)
+        table.add_row(level_text(stop), *cells)
+    return table
+
+def symbols_table(result: Sweep, row: int, column: int) -> Table:
+    table = Table(title=f"Per symbol at stop {level_text(result.stops[row])}, cut {level_text(result.cuts[column])}")
+    table.add_column("Symbol", style="cyan")
+    table.add_column("Actual P/L", justify="right")
+    table.add_column("Rule P/L", justify="right")
+    table.add_column("Difference", justify="right")
+    rule = result.rule[:, row, column]
+    for index in np.argsort(result.actual - rule):
+        table.add_row(result.symbols[index], money_text(result.actual[index]), money_text(rule[index]), money_text(rule[index] - result.actual[index]))
+    table.add_row("Total", money_text(result.actual.sum()), money_text(rule.sum()), money_text(rule.sum() - result.actual.sum()))
+    return table
+
+def backtest_menu(settings: Settings = Settings()):
+    console = Console()
+    conn = profiler.connect(get_db_path(settings.default_account))
+    try:
+        table = Table(title=f"Cached Daily Bars ({settings.default_account})")
+        table.add_column("Symbol", style="cyan")
+        table.add_column("From")
+        table.add_column("To")
+        table.add_column("Bars", justify="right")
+        for symbol, first, last, count in cached(conn):
+            table.add_row(symbol, str(first), str(last), str(count))
+        console.print(table)
+        console.print("[blue]Backtest:[/blue] F[dim]etch bars from Yahoo Finance[/dim], L[dim]oad bars from CSV[/dim], R[dim]un exit rule sweep[/dim] or Enter [dim]to go back[/dim]")
+        choice = input("Enter choice: ").strip().lower()
+        if choice == 'f':
+            for symbol, first_day in traded_symbols(conn):
+                try:
+                    console.print(f"{symbol}: {fetch_bars(conn, symbol, first_day)} bars")
+                    conn.commit()
+                except Exception as e:
+                    console.print(f"[red]Failed to fetch bars for {symbol}: {e}[/red]")
+        elif choice == 'l':
+            symbol = input("Enter ticker symbol: ").strip().upper()
+            count = import_csv(conn, symbol, input("Enter CSV path: ").strip())
+            conn.commit()
+            console.print(f"[green]{count} bars loaded for {symbol}.[/green]")
+        elif choice == 'r':
+            stops = parse_values(input("Stop % below the reference, e.g. 5-25:5 (default 10,20): ").strip() or "10,20") / 100
+            cuts = parse_values(input("Cut % below the reference, e.g. 10,20,30 (default 20): ").strip() or "20") / 100
+            trailing = input("Reference, E for the entry price or T for the trailing high (default E): ").strip().lower() == 't'
+            result = sweep(conn, np.r_[OFF, stops], np.r_[OFF, cuts], trailing)
+            if not result.symbols:
+                console.print("[yellow]No traded symbol has cached bars, fetch or load them first.[/yellow]")
+            else:
+                console.print(sweep_table(result))
+                row, column = result.best()
+                console.print(symbols_table(result, row, column))
+                console.print(f"[dim]{len(result.symbols)} symbols replayed, * marks the best cell where the stop sold {result.stopped[row, column]} pieces and the cut {result.cut[row, column]}. Prices only, fees not included.[/dim]")
+            if result.missing:
+                console.print(f"[yellow]No bars for {', '.join(result.missing)}.[/yellow]")
+        else:
+            return
+    except (OSError, ValueError, KeyError) as e:
+        console.print(f"[red]Error: {e}[/red]")
+    except sqlite3.Error as e:
+        conn.rollback()
+        console.print(f"[red]Error: {e}[/red]")
+    finally:
+        conn.close()
+    input("Press Enter to continue...")
@@ -0,0 +1,239 @@
+"""
+Batch trade entry: many fills pasted as lines or read from a file, one per line as
+
+    SIDE SYMBOL QTY PRICE [FEES VAT DATE] [#ID]
+
+e.g. "buy $TSLA 10 250.5" or "S $AAPL 5 190 1.8 0.27 28/02/2025 #123". A sell ending in #ID
+closes that open buy lot, as the sell menu's "Close Position Buy ID" does; any other # starts
+a comment. Lines are validated together against cash, shares and open lots, confirmed once and
+written in a single transaction.
+"""
+from __future__ import annotations
+import re
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from rich.console import Console
+from rich.table import Table
+import journal
+import profiler
+from repository import Holding, Lot, to_amount, to_price
+from settings import Settings
+from trade import buy_cost, can_afford, can_sell, sell_proceeds
+from utils import get_db_path
+
+DEFAULT_FEES = 1.8
+DEFAULT_VAT = 0.27
+SIDES = {'b': 'buy', 'buy': 'buy', 's': 'sell', 'sell': 'sell'}
+# A # not followed by a lot ID
+COMMENT = re.compile(r"#(?!\d)")
+
+@dataclass
+class BatchTrade:
+    line_no: int
+    opr: str
+    symbol: str
+    filled_qty: int
+    price: float
+    fees: float
+    vat: float
+    trade_date: str
+    profit_loss: float = 0.0
+    close_position: int | None = None
+
+    @property
+    def is_buy(self) -> bool:
+        return self.opr == 'buy'
+
+    @property
+    def cost_value(self) -> float:
+        """
+        Cash paid for a buy, or received for a sell, after fees and VAT.
+        """
+        if self.is_buy:
+            return buy_cost(self.filled_qty, self.price, self.fees, self.vat)
+        return sell_proceeds(self.filled_qty, self.price, self.fees, self.vat)
+
+def parse_line(text: str, line_no: int, today: str, fees: float = DEFAULT_FEES, vat: float = DEFAULT_VAT) -> BatchTrade:
+    """
+    Parses one line, raising ValueError with a message naming the problem.
+    fees and vat apply when the line has none.
+    """
+    parts = text.split()
+    close_position = int(parts.pop()[1:]) if parts and parts[-1].startswith('#') else None
+    if not 4 <= len(parts) <= 7:
+        raise ValueError("expected SIDE SYMBOL QTY PRICE [FEES VAT DATE] [#ID]")
+    opr = SIDES.get(parts[0].lower())
+    if opr is None:
+        raise ValueError(f"side must be buy or sell, got '{parts[0]}'")
+    if close_position is not None and opr == 'buy':
+        raise ValueError("only a sell closes a buy lot")
+    filled_qty = int(parts[2])
+    price = float(parts[3])
+    if filled_qty <= 0 or price <= 0:
+        raise ValueError("quantity and price must be positive")
+    fees = float(parts[4]) if len(parts) > 4 else fees
+    vat = float(parts[5]) if len(parts) > 5 else vat
+    # Stored zero-padded, the date keys read fixed SUBSTR offsets
+    trade_date = datetime.strptime(parts[6], "%d/%m/%Y").strftime("%d/%m/%Y") if len(parts) > 6 else today
+    return BatchTrade(line_no, opr, parts[1].upper(), filled_qty, price, fees, vat, trade_date, close_position=close_position)
+
+def parse_batch(lines: list[str], today: str | None = None, fees: float = DEFAULT_FEES, vat: float = DEFAULT_VAT) -> tuple[list[BatchTrade], list[str]]:
+    """
+    Parses every non-empty line (# not followed by a lot ID starts a comment) and returns the trades and the errors.
+    """
+    today = today or datetime.today().strftime("%d/%m/%Y")
+    trades = []
+    errors = []
+    for line_no, line in enumerate(lines, start=1):
+        text = COMMENT.split(line, 1)[0].strip()
+        if not text:
+            continue
+        try:
+            trades.append(parse_line(text, line_no, today, fees, vat))
+        except ValueError as e:
+            errors.append(f"Line {line_no}: {e}")
+    return trades, errors
+
+def close_error(trade: BatchTrade, lot: Lot | None, held: int) -> str | None:
+    """
+    Why a sell cannot close the lot it names: the lot is not an open buy, or not all of its shares.
+    """
+    if lot is None:
+        return f"Line {trade.line_no}: #{trade.close_position} is not an open buy lot"
+    if lot.symbol != trade.symbol or lot.filled_qty != trade.filled_qty:
+        return f"Line {trade.line_no}: #{lot.ID} is {lot.filled_qty} {lot.symbol}, the sell is {trade.filled_qty} {trade.symbol}"
+    if not can_sell(trade.filled_qty, held):
+        return f"Line {trade.line_no}: sells {trade.filled_qty} {trade.symbol}, {held} held"
+    return None
+
+def validate(trades: list[BatchTrade], total_cash: float, holdings: list[Holding], lots: list[Lot] = ()) -> tuple[float, list[str]]:
+    """
+    Applies the trades in order to the cash and the shares held, without touching the database.
+    A sell closing a lot (#ID) must sell all of that open buy lot and gets its P/L against the
+    lot's cost value, as in the sell menu. Other sells leave the lots open and get their P/L
+    against the average buy cost (cost of every buy over the shares bought, the batch's buys included).
+    Returns the cash left and the errors.
+    """
+    shares = {holding.symbol: holding.net_shares for holding in holdings}
+    bought = {holding.symbol: (holding.buy_qty, holding.buy_cost) for holding in holdings}
+    open_lots = {lot.ID: lot for lot in lots if lot.is_buy}
+    cash = total_cash
+    errors = []
+    for trade in trades:
+        held = shares.get(trade.symbol, 0)
+        if trade.close_position is not None:
+            lot = open_lots.get(trade.close_position)
+            error = close_error(trade, lot, held)
+            if error:
+                errors.append(error)
+                continue
+            del open_lots[lot.ID]
+            trade.profit_loss = trade.cost_value - lot.cost_value
+            cash += trade.cost_value
+            shares[trade.symbol] = held - trade.filled_qty
+        elif trade.is_buy:
+            if not can_afford(trade.cost_value, cash):
+                errors.append(f"Line {trade.line_no}: needs ${trade.cost_value:,.2f}, cash available ${cash:,.2f}")
+                continue
+            cash -= trade.cost_value
+            shares[trade.symbol] = held + trade.filled_qty
+            buy_qty, buy_cost = bought.get(trade.symbol, (0, 0.0))
+            bought[trade.symbol] = (buy_qty + trade.filled_qty, buy_cost + trade.cost_value)
+        else:
+            if not can_sell(trade.filled_qty, held):
+                errors.append(f"Line {trade.line_no}: sells {trade.filled_qty} {trade.symbol}, {held} held")
+                continue
+            buy_qty, buy_cost = bought[trade.symbol]
+            trade.profit_loss = trade.cost_value - buy_cost / buy_qty * trade.filled_qty
+            cash += trade.cost_value
+            shares[trade.symbol] = held - trade.filled_qty
+    return cash, errors
+
+def write_batch(trades: list[BatchTrade], settings: Settings = Settings()) -> int:
+    """
+    Inserts all trades and closes the lots they name in one transaction as one journal entry,
+    so undo reverts the whole batch.
+    Returns the journal seq.
+    """
+    conn = profiler.connect(get_db_path(settings.default_account))
+    try:
+        with conn:
+            cursor = conn.cursor()
+            changes = []
+            for trade in trades:
+                cursor.execute("""
+                    INSERT INTO TRADES (trade_date, symbol, opr, filled_qty, price, fees, vat, cost_value, profit_loss, is_position_open)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (trade.trade_date, trade.symbol, trade.opr, trade.filled_qty, to_price(trade.price), to_amount(trade.fees), to_amount(trade.vat),
+                      to_amount(trade.cost_value), to_amount(trade.profit_loss), 1 if trade.is_buy else 0))
+                changes.append(journal.change(conn, 'TRADES', cursor.lastrowid))
+                if trade.close_position is not None:
+                    before = journal.row(conn, 'TRADES', trade.close_position)
+                    cursor.execute("UPDATE TRADES SET is_position_open = 0 WHERE ID = ? AND opr = 'buy'", (trade.close_position,))
+                    changes.append(journal.change(conn, 'TRADES', trade.close_position, before))
+            return journal.record(conn, 'batch', changes)
+    finally:
+        conn.close()
+
+def read_lines(console: Console) -> list[str]:
+    """
+    Lines pasted until an empty line, or the lines of a file given as @path.
+    """
+    console.print("[blue]Batch entry:[/blue] [dim]one trade per line as[/dim] SIDE SYMBOL QTY PRICE [FEES VAT DATE] \\[#ID][dim] (#ID closes that buy lot), an empty line to finish, or[/dim] @file [dim]to read a file[/dim]")
+    lines = []
+    while True:
+        line = input("> " if not lines else "").rstrip("\n")
+        if not line.strip():
+            return lines
+        if not lines and line.strip().startswith('@'):
+            with open(line.strip()[1:].strip(), encoding="utf-8") as batch_file:
+                return batch_file.read().splitlines()
+        lines.append(line)
+
+def batch_table(trades: list[BatchTrade], total_cash: float, cash_left: float, settings: Settings) -> Table:
+    account = settings.get_account()
+    table = Table(title=f"Confirm {len(trades)} Trades")
+    table.add_column("Line", style="dim", justify="right")
+    table.add_column("Date", style="dim")
+    table.add_column("Symbol", style="cyan")
+    table.add_column("Operation", justify="center")
+    table.add_column("Qty", justify="right")
+    table.add_column("Price", justify="right", style="yellow")
+    table.add_column("Fees + VAT", justify="right")
+    table.add_column("Cost Value", justify="right")
+    table.add_column("Profit/Loss", justify="right")
+    for trade in trades:
+        opr_text = "[green]buy[/green]" if trade.is_buy else "[red]sell[/red]" if trade.close_position is None else f"[red]sell[/red] #{trade.close_position}"
+        pl_text = "" if trade.is_buy else f"[red]${trade.profit_loss:,.2f}[/red]" if trade.profit_loss < 0 else f"[green]${trade.profit_loss:,.2f}[/green]"
+        table.add_row(str(trade.line_no), trade.trade_date, trade.symbol, opr_text, str(trade.filled_qty), f"${trade.price:,.2f}", f"${trade.fees + trade.vat:,.2f}", f"${trade.cost_value:,.2f}", pl_text)
+    table.add_row("---", "---", "---", "---", "---", "---", "---", "---", "---")
+    table.add_row("Cash", "", "", "", "", "", "", f"${total_cash:,.2f} -> ${cash_left:,.2f}", "")
+    table.add_row(account.exchange_rate_label, "", "", "", "", "", "", f"{cash_left * account.exchange_rate:,.2f}", "")
+    return table
+
+def batch_menu(ticker_data: list[Holding], lots: list[Lot], total_cash: float, settings: Settings = Settings()):
+    console = Console()
+    try:
+        trades, errors = parse_batch(read_lines(console))
+        if not errors:
+            cash_left, errors = validate(trades, total_cash, ticker_data, lots)
+        if errors:
+            for error in errors:
+                console.print(f"[red]{error}[/red]")
+            console.print("[red]Batch not saved, nothing was written.[/red]")
+        elif not trades:
+            console.print("[yellow]No trades entered.[/yellow]")
+        else:
+            console.print(batch_table(trades, total_cash, cash_left, settings))
+            console.print(f"[red]No[/red] [dim]to cancel[/dim], Enter to [green]confirm[/green]...")
+            if input("").strip().lower() == 'no':
+                console.print("[red]Batch cancelled.[/red]")
+            else:
+                write_batch(trades, settings)
+                console.print(f"[green]{len(trades)} trades saved in one transaction.[/green]")
+    except (OSError, sqlite3.Error) as e:
+        console.print(f"[red]Error: {e}[/red]")
+    except KeyboardInterrupt:
+        console.print("\n[red]Batch entry cancelled by user.[/red]")
+    input("Press Enter to continue...")
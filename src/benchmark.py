@@ -0,0 +1,700 @@
+"""
+Offline benchmark for the hot paths: dashboard queries and rendering, trade filters,
+funds history, planner calculations, the in-memory replica, the JSON serve mode, price alerts, the
+what-if simulator, XIRR, integer money columns against REAL ones, the journal, changeset sync, archived trades and the Excel
+row importer.
+
+Generates a synthetic account database with the real migrate schema, times each
+operation and writes the results as JSON so runs can be compared. Each area is a
+bench_* function registered in BENCHMARKS; a new area adds its own entry there:
+
+    python src/benchmark.py --trades 200000 --out bench.json
+    python src/benchmark.py --trades 200000 --compare bench.json
+    python src/benchmark.py --only journal sync
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from dataclasses import dataclass
+from datetime import date, timedelta
+from io import StringIO
+import numpy as np
+import pandas as pd
+from rich.console import Console
+import alerts
+import archive
+import backtest
+import journal
+import migrate
+import query_cache
+import replica
+import repository
+import returns
+import serve
+import sync
+import ticks
+from batch_entry import parse_batch
+from dashboard import get_ticker_data, open_positions_table, holdings_table, totals_table
+from filter_trades import open_pager, print_trades_page
+from funds_query import FundsFilter, FundsPager, aggregate as aggregate_funds
+from simulate import Scenario
+from planner import get_open_positions, calculate_position_summary, calculate_risk_levels
+from settings import Settings, Account
+from session import sessions
+from snapshot import Snapshot, load_snapshot
+from stocks_reader import read_and_print_rows
+from trade import update_trade
+from trade_query import TradeFilter, aggregate, fetch_page
+from utils import get_db_path
+
+FUND_SOURCES = ["Bank Transfer", "Salary", "Bonus", "Savings", "Dividends"]
+SYNC_EDITS = 20
+ALERTS = 5_000
+ALERT_QUOTES = 1_000
+WHATIF_TRADES = 100
+WHATIF_GRID = 100
+BACKTEST_SYMBOLS = 10
+QUOTE_TICKS = 1_000_000
+QUOTE_DAYS = 30
+
+def generate_account(db_path: str, symbols: int = 50, trades: int = 100_000, funds: int = 1_000, open_lots: int = 2_000, years: int = 10, seed: int = 1):
+    """
+    Creates a database at db_path filled with random but plausible funds and trades.
+    Prices follow a random walk per symbol, buys are 60% of trades and open_lots of them stay open.
+    """
+    rng = random.Random(seed)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    migrate.create_schema(conn)
+
+    start = date.today() - timedelta(days=365 * years)
+    days = 365 * years
+
+    fund_rows = []
+    for _ in range(funds):
+        fund_date = (start + timedelta(days=rng.randrange(days))).strftime("%d/%m/%Y")
+        opr = 'withdraw' if rng.random() < 0.1 else 'deposit'
+        amount_usd = round(rng.uniform(500, 20_000), 2)
+        rate = round(rng.uniform(3.74, 3.76), 4)
+        fund_rows.append((opr, fund_date, rng.choice(FUND_SOURCES), repository.to_amount(amount_usd * rate), repository.to_amount(amount_usd), rate))
+    conn.executemany("INSERT INTO FUNDS (opr, fund_date, source, amount_SAR, amount_USD, rate_exchange) VALUES (?, ?, ?, ?, ?, ?)", fund_rows)
+
+    prices = {f"$SYM{i}": rng.uniform(10, 500) for i in range(symbols)}
+    trade_days = sorted(rng.randrange(days) for _ in range(trades))
+    trade_rows = []
+    buy_indexes = []
+    for day in trade_days:
+        symbol = rng.choice(list(prices))
+        prices[symbol] = max(1.0, prices[symbol] * rng.uniform(0.98, 1.02))
+        price = round(prices[symbol], 2)
+        qty = rng.randint(1, 100)
+        fees, vat = 1.8, 0.27
+        trade_date = (start + timedelta(days=day)).strftime("%d/%m/%Y")
+        if rng.random() < 0.6:
+            buy_indexes.append(len(trade_rows))
+            trade_rows.append([trade_date, symbol, 'buy', qty, price, fees, vat, round(qty * price + fees + vat, 2), 0, 0])
+        else:
+            profit_loss = round(qty * price * rng.uniform(-0.1, 0.15), 2)
+            trade_rows.append([trade_date, symbol, 'sell', qty, price, fees, vat, round(qty * price - fees - vat, 2), profit_loss, 0])
+    for index in rng.sample(buy_indexes, min(open_lots, len(buy_indexes))):
+        trade_rows[index][9] = 1
+    for row in trade_rows:
+        row[4] = repository.to_price(row[4])
+        row[5:9] = [repository.to_amount(value) for value in row[5:9]]
+    conn.executemany("""
+        INSERT INTO TRADES (trade_date, symbol, opr, filled_qty, price, fees, vat, cost_value, profit_loss, is_position_open)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, trade_rows)
+    journal.snapshot(conn)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+def generate_bars(conn: sqlite3.Connection, years: int = 10, seed: int = 1) -> int:
+    """
+    Weekday bars for every traded symbol over the last years, a random walk from its first trade price.
+    """
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=365 * years)
+    days = [start + timedelta(days=day) for day in range(365 * years + 1)]
+    days = [int(day.strftime("%Y%m%d")) for day in days if day.weekday() < 5]
+    count = 0
+    for symbol, price in conn.execute("SELECT symbol, price FROM TRADES WHERE ID IN (SELECT MIN(ID) FROM TRADES GROUP BY symbol)").fetchall():
+        close = price / repository.PRICE_SCALE
+        rows = []
+        for day in days:
+            open_price = close * rng.uniform(0.99, 1.01)
+            close = max(1.0, close * rng.uniform(0.98, 1.02))
+            rows.append((day, open_price, max(open_price, close) * 1.005, min(open_price, close) * 0.995, close))
+        count += backtest.save_bars(conn, symbol, rows)
+    conn.commit()
+    return count
+
+def generate_ticks(conn: sqlite3.Connection, account_name: str, prices: dict, count: int = QUOTE_TICKS, days: int = QUOTE_DAYS, seed: int = 1):
+    """
+    Writes a quote journal of count quotes of the symbols over the last days, prices within 10% of prices.
+    """
+    rng = np.random.default_rng(seed)
+    ids = ticks.symbol_ids(conn, prices)
+    conn.commit()
+    picks = rng.integers(0, len(prices), count)
+    records = np.zeros(count, dtype=ticks.TICK)
+    records['time'] = np.sort(int(time.time()) - rng.integers(0, days * ticks.DAY, count))
+    records['symbol'] = np.asarray([ids[symbol] for symbol in prices])[picks]
+    records['price'] = np.rint(np.asarray(list(prices.values()))[picks] * rng.uniform(0.9, 1.1, count) * repository.PRICE_SCALE)
+    with open(ticks.journal_path(account_name), 'wb') as f:
+        f.write(ticks.HEADER + records.tobytes())
+
+def legacy_money_copy(db_path: str, legacy_path: str):
+    """
+    A copy of an account's FUNDS and TRADES with money as REAL dollars, the layout
+    migrate.migrate_money() upgrades, with a journal snapshot in dollars too.
+    """
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+    conn = sqlite3.connect(legacy_path)
+    conn.execute("ATTACH DATABASE ? AS src", (db_path,))
+    conn.execute(f"CREATE TABLE FUNDS AS SELECT {repository.projection(repository.Fund)} FROM src.FUNDS")
+    conn.execute(f"CREATE TABLE TRADES AS SELECT {repository.projection(repository.Trade)} FROM src.TRADES")
+    conn.execute("CREATE TABLE TRADES_ARCHIVE AS SELECT * FROM TRADES WHERE 0")
+    conn.executescript(migrate.schema_journal_sql)
+    journal.snapshot(conn)
+    conn.commit()
+    conn.execute("DETACH DATABASE src")
+    conn.close()
+
+def time_call(fn, repeat: int, setup=None) -> dict:
+    """
+    Runs fn repeat times and returns timing statistics in milliseconds.
+    setup, when given, runs untimed before each call.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'runs': repeat,
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+    }
+
+def excel_frame(rows: int, seed: int) -> pd.DataFrame:
+    """
+    A DataFrame shaped like load_data.load_excel_data output for buy rows (all values as str).
+    """
+    rng = random.Random(seed)
+    data = []
+    for _ in range(rows):
+        qty = rng.randint(1, 100)
+        price = round(rng.uniform(10, 500), 2)
+        data.append(['1', None, f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024", f"$SYM{rng.randrange(50)}", str(qty), str(price), '1.8', '0.27', None, str(round(qty * price + 2.07, 2)), None])
+    return pd.DataFrame(data, dtype=str)
+
+@dataclass
+class Bench:
+    """
+    What the benchmark areas share: the generated account, an open connection to it and its
+    dashboard snapshot at the highest buy prices.
+    """
+    settings: Settings
+    repeat: int
+    import_rows: int
+    seed: int
+    conn: sqlite3.Connection
+    snapshot: Snapshot
+    current_prices: dict
+    top_symbol: str
+    render_console: Console
+
+    @property
+    def db_path(self) -> str:
+        return get_db_path(self.settings.default_account)
+
+    @property
+    def filters(self) -> dict:
+        this_year = str(date.today().year)
+        return {
+            'all': TradeFilter(),
+            'buy': TradeFilter(opr='buy'),
+            'year': TradeFilter(date_from=this_year + "0101", date_to=this_year + "1231"),
+            'symbol_open': TradeFilter(symbol=self.top_symbol, is_open=True),
+            'loss': TradeFilter(pl_sign=-1),
+        }
+
+    def write_trade(self):
+        """
+        One journaled write through the trade menu's update.
+        """
+        with redirect_stdout(StringIO()):
+            update_trade(self.snapshot.trades[0].ID, price=100.0 + random.random(), settings=self.settings)
+
+    def journal_edits(self, trade_ids, profit_loss: str = "profit_loss + 1"):
+        for trade_id in trade_ids:
+            before = journal.row(self.conn, 'TRADES', trade_id)
+            self.conn.execute(f"UPDATE TRADES SET profit_loss = {profit_loss} WHERE ID = ?", (trade_id,))
+            journal.record(self.conn, 'update', [journal.change(self.conn, 'TRADES', trade_id, before)])
+        self.conn.commit()
+
+def bench_dashboard(bench: Bench) -> dict:
+    results = {}
+    repeat, snapshot, current_prices, settings = bench.repeat, bench.snapshot, bench.current_prices, bench.settings
+    results['dashboard.load_snapshot'] = time_call(lambda: load_snapshot(bench.conn.cursor(), 3.75), repeat)
+    results['dashboard.value_lots'] = time_call(lambda: snapshot.lot_book.value(current_prices, 2.08, 3.75), repeat)
+    def render_dashboard():
+        ticker_data = get_ticker_data(snapshot, current_prices)
+        trades_table = open_positions_table(snapshot, current_prices, settings)
+        if trades_table:
+            bench.render_console.print(trades_table)
+        bench.render_console.print(holdings_table(snapshot, ticker_data, settings))
+        bench.render_console.print(totals_table(snapshot, ticker_data, settings))
+    results['dashboard.render'] = time_call(render_dashboard, repeat)
+    return results
+
+def bench_filters(bench: Bench) -> dict:
+    results = {}
+    repeat, db_path, current_prices = bench.repeat, bench.db_path, bench.current_prices
+    for name, trade_filter in bench.filters.items():
+        def cold():
+            query_cache.filter_cache.clear()
+            open_pager(db_path, trade_filter, current_prices, 3.75)
+        results[f'filter.{name}.cold'] = time_call(cold, repeat)
+        results[f'filter.{name}.warm'] = time_call(lambda: open_pager(db_path, trade_filter, current_prices, 3.75), repeat)
+    pager, totals, fx = open_pager(db_path, TradeFilter(), current_prices, 3.75)
+    results['filter.render'] = time_call(lambda: print_trades_page(pager, totals, fx, current_prices, bench.settings, bench.render_console), repeat)
+    query_cache.close_connection(db_path)
+    return results
+
+def bench_funds(bench: Bench) -> dict:
+    funds_filter = FundsFilter(source="Sal")
+    cursor = bench.conn.cursor()
+    def funds_page():
+        pager = FundsPager(funds_filter)
+        pager.load(cursor)
+        aggregate_funds(cursor, funds_filter)
+    return {'funds.page_and_totals': time_call(funds_page, bench.repeat)}
+
+def bench_planner(bench: Bench) -> dict:
+    top_symbol = bench.top_symbol
+    def planner_calculations():
+        positions = get_open_positions(top_symbol, bench.settings.default_account)
+        shares, avg_cost = calculate_position_summary(positions)
+        current_price = bench.current_prices.get(top_symbol, avg_cost)
+        levels = {
+            'current_price': current_price,
+            'all_time_high': current_price * 1.2,
+            'current_resistance': current_price * 1.1,
+            'key_support1': current_price * 0.9,
+            'key_support2': current_price * 0.8,
+            'deeper_support': avg_cost,
+        }
+        calculate_risk_levels(shares, avg_cost, levels)
+    return {'planner.calculations': time_call(planner_calculations, bench.repeat)}
+
+def bench_replica(bench: Bench) -> dict:
+    """
+    The same reads on the file, on the file through mmap and on the in-memory replica.
+    """
+    results = {}
+    repeat, db_path, current_prices = bench.repeat, bench.db_path, bench.current_prices
+    mmap_conn = sqlite3.connect(db_path)
+    mmap_conn.execute("PRAGMA mmap_size = 268435456")
+    def replica_load():
+        copy = replica.Replica(db_path)
+        copy.load()
+        copy.close()
+    results['replica.load'] = time_call(replica_load, repeat)
+    memory = replica.Replica(db_path)
+    memory.load()
+    filters = bench.filters
+    read_filters = {name: filters[name] for name in ('all', 'year', 'symbol_open')}
+    funds_filter = FundsFilter(source="Sal")
+    for label, read_conn in (('disk', bench.conn), ('mmap', mmap_conn), ('memory', memory.conn)):
+        for name, trade_filter in read_filters.items():
+            def reads():
+                fetch_page(read_conn.cursor(), trade_filter, current_prices)
+                aggregate(read_conn.cursor(), trade_filter, current_prices)
+            results[f'replica.filter_{name}.{label}'] = time_call(reads, repeat)
+        def funds_reads():
+            pager = FundsPager(funds_filter)
+            pager.load(read_conn.cursor())
+            aggregate_funds(read_conn.cursor(), funds_filter)
+        results[f'replica.funds.{label}'] = time_call(funds_reads, repeat)
+        results[f'replica.planner.{label}'] = time_call(lambda: repository.open_lots(read_conn, [bench.top_symbol], 'buy'), repeat)
+    # A journaled write on the file, then the replica catching up with it
+    results['replica.sync_one_write'] = time_call(memory.sync, repeat, setup=bench.write_trade)
+    memory.close()
+    mmap_conn.close()
+    return results
+
+def bench_serve(bench: Bench) -> dict:
+    """
+    Serve mode: a poll between writes returns the encoded body, a poll after one rebuilds it.
+    """
+    account = bench.settings.default_account
+    api = serve.PortfolioApi(bench.settings)
+    results = {
+        'serve.positions.cached': time_call(lambda: api.body(account, 'positions'), bench.repeat),
+        'serve.positions.after_write': time_call(lambda: api.body(account, 'positions'), bench.repeat, setup=bench.write_trade),
+    }
+    sessions.close(account)
+    return results
+
+def bench_alerts(bench: Bench) -> dict:
+    """
+    Quote updates checked against thousands of pending alerts around the current prices.
+    """
+    results = {}
+    conn, current_prices = bench.conn, bench.current_prices
+    rng = random.Random(bench.seed)
+    alert_symbols = sorted(current_prices)
+    for _ in range(ALERTS):
+        symbol = rng.choice(alert_symbols)
+        alerts.add_alert(conn, symbol, 'bench', current_prices[symbol] * rng.uniform(0.5, 1.5), current_prices[symbol])
+    conn.commit()
+    results['alerts.load'] = time_call(lambda: alerts.AlertBook.load(conn), bench.repeat)
+    book = alerts.AlertBook.load(conn)
+    quotes = [(symbol, repository.to_price(current_prices[symbol] * rng.uniform(0.95, 1.05))) for symbol in rng.choices(alert_symbols, k=ALERT_QUOTES)]
+    def check_quotes():
+        return sum(len(book.crossed(symbol, price)) for symbol, price in quotes)
+    results[f'alerts.check_{ALERT_QUOTES}_quotes'] = time_call(check_quotes, bench.repeat)
+    results[f'alerts.check_{ALERT_QUOTES}_quotes']['fired'] = len(alerts.AlertBook.load(conn)) - len(book)
+    return results
+
+def bench_simulate(bench: Bench) -> dict:
+    """
+    What-if trades and a grid of sizes and prices on a copy of the snapshot, the database untouched.
+    """
+    results = {}
+    snapshot, current_prices, top_symbol = bench.snapshot, bench.current_prices, bench.top_symbol
+    rng = random.Random(bench.seed)
+    lines = [f"{rng.choice(('buy', 'sell'))} {holding.symbol} {rng.randint(1, 20)} {holding.price * rng.uniform(0.9, 1.1):.2f}"
+             for holding in rng.choices(snapshot.tickers, k=WHATIF_TRADES)]
+    whatif_trades, _ = parse_batch(lines, fees=2.08, vat=0.0)
+    def whatif_apply():
+        scenario = Scenario(snapshot, current_prices, 2.08)
+        for trade in whatif_trades:
+            scenario.apply(trade)
+        return scenario.snapshot()
+    results[f'simulate.apply_{WHATIF_TRADES}_trades'] = time_call(whatif_apply, bench.repeat)
+    scenario = Scenario(snapshot, current_prices, 2.08)
+    grid_price = current_prices[top_symbol]
+    quantities = range(1, WHATIF_GRID + 1)
+    prices = [grid_price * (0.8 + 0.4 * i / WHATIF_GRID) for i in range(WHATIF_GRID)]
+    results[f'simulate.grid_{WHATIF_GRID}x{WHATIF_GRID}'] = time_call(lambda: scenario.grid('sell', top_symbol, quantities, prices), bench.repeat)
+    return results
+
+def bench_returns(bench: Bench) -> dict:
+    """
+    Money-weighted returns: building the cash flows, then one solve for every symbol.
+    """
+    results = {}
+    conn, current_prices, repeat = bench.conn, bench.current_prices, bench.repeat
+    results['returns.account'] = time_call(lambda: returns.account_flows(conn, bench.settings.default_account, current_prices).xirr(), repeat)
+    results['returns.years'] = time_call(lambda: returns.year_flows(conn)[0].xirr(), repeat)
+    results['returns.symbol_flows'] = time_call(lambda: returns.symbol_flows(conn, current_prices), repeat)
+    symbol_flows = returns.symbol_flows(conn, current_prices)
+    results['returns.symbols_xirr'] = time_call(symbol_flows.xirr, repeat)
+    results['returns.symbols_xirr']['series'] = len(symbol_flows.names)
+    return results
+
+def bench_backtest(bench: Bench) -> dict:
+    """
+    Backtest of the exit rules: matching sells to buys, then a stop x cut sweep in and out of process.
+    """
+    results = {}
+    conn, repeat = bench.conn, bench.repeat
+    bars = generate_bars(conn)
+    results['backtest.load_pieces'] = time_call(lambda: backtest.load_pieces(conn), repeat)
+    bar_symbols = [symbol for symbol, _, _, _ in backtest.cached(conn)][:BACKTEST_SYMBOLS]
+    stops = [backtest.OFF, 0.05, 0.1, 0.15, 0.2, 0.25]
+    cuts = [backtest.OFF, 0.1, 0.2, 0.3, 0.4]
+    results['backtest.sweep'] = time_call(lambda: backtest.sweep(conn, stops, cuts, symbols=bar_symbols, workers=1), repeat)
+    results['backtest.sweep_pool'] = time_call(lambda: backtest.sweep(conn, stops, cuts, symbols=bar_symbols, workers=4), repeat)
+    for key in ('backtest.sweep', 'backtest.sweep_pool'):
+        results[key].update(symbols=len(bar_symbols), cells=len(stops) * len(cuts), bars=bars)
+    return results
+
+def bench_ticks(bench: Bench) -> dict:
+    """
+    Quote journal: one refresh appended, lookups on the mapped journal, compaction into daily bars.
+    """
+    results = {}
+    conn, account, current_prices, repeat = bench.conn, bench.settings.default_account, bench.current_prices, bench.repeat
+    generate_ticks(conn, account, current_prices, seed=bench.seed)
+    results['ticks.last_prices'] = time_call(lambda: ticks.last_prices(conn, account), repeat)
+    results['ticks.today_series'] = time_call(lambda: ticks.today_series(conn, account, current_prices), repeat)
+    results['ticks.append'] = time_call(lambda: ticks.append(conn, account, current_prices), repeat)
+    results['ticks.compact'] = time_call(lambda: ticks.compact(conn, account), repeat, setup=lambda: generate_ticks(conn, account, current_prices, seed=bench.seed))
+    for key in ('ticks.last_prices', 'ticks.today_series', 'ticks.compact'):
+        results[key]['ticks'] = QUOTE_TICKS
+    os.remove(ticks.journal_path(account))
+    return results
+
+def bench_money(bench: Bench) -> dict:
+    """
+    The same sums over REAL dollars and over integer units, and the migration between them.
+    """
+    results = {}
+    repeat = bench.repeat
+    legacy_path = get_db_path(bench.settings.default_account + "_legacy")
+    legacy_money_copy(bench.db_path, legacy_path)
+    legacy_conn = sqlite3.connect(legacy_path)
+    sums_sql = "SELECT SUM(cost_value), SUM(profit_loss), SUM(fees), SUM(vat), SUM(filled_qty * price) FROM TRADES"
+    results['money.sums.real'] = time_call(lambda: legacy_conn.execute(sums_sql).fetchone(), repeat)
+    results['money.sums.integer'] = time_call(lambda: bench.conn.execute(sums_sql).fetchone(), repeat)
+    legacy_conn.close()
+    migrated = {}
+    def legacy_copy():
+        legacy_money_copy(bench.db_path, legacy_path)
+        migrated['conn'] = sqlite3.connect(legacy_path)
+    def migrate_copy():
+        migrated['totals'] = migrate.migrate_money(migrated['conn'])
+        migrated['conn'].close()
+    results['money.migrate'] = time_call(migrate_copy, max(1, repeat // 2), setup=legacy_copy)
+    results['money.migrate']['max_difference'] = max(abs(new - old) for old, new in migrated['totals'].values())
+    os.remove(legacy_path)
+    return results
+
+def bench_journal(bench: Bench) -> dict:
+    """
+    A full journal tail (one short of the next snapshot) on top of the generated history.
+    """
+    results = {}
+    conn, repeat = bench.conn, bench.repeat
+    lot_ids = [lot.ID for lot in bench.snapshot.trades[:journal.SNAPSHOT_EVERY - 1]]
+    bench.journal_edits(lot_ids, profit_loss="1")
+    results['journal.replay'] = time_call(lambda: journal.replay(conn, rows=True), repeat)
+    def undo_redo():
+        journal.undo(conn)
+        journal.redo(conn)
+    results['journal.undo_redo'] = time_call(undo_redo, repeat)
+    results['journal.record'] = time_call(lambda: bench.journal_edits(lot_ids[:1]), repeat)
+    def journal_snapshot():
+        journal.snapshot(conn)
+        conn.commit()
+    results['journal.snapshot'] = time_call(journal_snapshot, repeat, setup=lambda: bench.journal_edits(lot_ids[:1]))
+    return results
+
+def bench_sync(bench: Bench) -> dict:
+    """
+    Changesets between the database and a copy of it, the steady state after the first round trip.
+    """
+    results = {}
+    conn, account, repeat = bench.conn, bench.settings.default_account, bench.repeat
+    peer_path = get_db_path(account + "_peer")
+    shutil.copy(bench.db_path, peer_path)
+    peer_conn = sqlite3.connect(peer_path)
+    node = os.environ.get('TRADECLI_NODE')
+    def on(name, fn):
+        os.environ['TRADECLI_NODE'] = name
+        return fn()
+    def export(): return on('bench', lambda: sync.export_changes(conn, account, 'peer', 'to_peer.json'))
+    def peer_import(): return on('peer', lambda: sync.import_changes(peer_conn, account, sync.read_changeset('to_peer.json')))
+    def round_trip():
+        export()
+        peer_import()
+        on('peer', lambda: sync.export_changes(peer_conn, account, 'bench', 'to_bench.json'))
+        on('bench', lambda: sync.import_changes(conn, account, sync.read_changeset('to_bench.json')))
+    edit_ids = [lot.ID for lot in bench.snapshot.trades[:SYNC_EDITS]]
+    def edit_after_round_trip():
+        round_trip()
+        bench.journal_edits(edit_ids)
+    results['sync.export'] = time_call(export, repeat, setup=edit_after_round_trip)
+    results['sync.export']['entries'] = export()
+    def edit_and_export():
+        bench.journal_edits(edit_ids)
+        export()
+    results['sync.import'] = time_call(peer_import, repeat, setup=edit_and_export)
+    if node is None:
+        os.environ.pop('TRADECLI_NODE', None)
+    else:
+        os.environ['TRADECLI_NODE'] = node
+    peer_conn.close()
+    os.remove(peer_path)
+    return results
+
+def bench_archive(bench: Bench) -> dict:
+    """
+    Closed trades older than three years moved out of TRADES, live filters no longer read them.
+    """
+    results = {}
+    conn, db_path, current_prices = bench.conn, bench.db_path, bench.current_prices
+    archive.archive_closed(conn, str(date.today().year - 3) + "0101")
+    conn.commit()
+    results['archive.load_snapshot'] = time_call(lambda: load_snapshot(conn.cursor(), 3.75), bench.repeat)
+    archived_filters = {
+        'all': TradeFilter(),
+        'history': TradeFilter(date_from=str(date.today().year - 5) + "0101"),
+    }
+    for name, trade_filter in archived_filters.items():
+        def cold():
+            query_cache.filter_cache.clear()
+            open_pager(db_path, trade_filter, current_prices, 3.75)
+        results[f'archive.filter_{name}.cold'] = time_call(cold, bench.repeat)
+    query_cache.close_connection(db_path)
+    return results
+
+def bench_importer(bench: Bench) -> dict:
+    """
+    The importer writes, so it runs against its own scratch account.
+    """
+    name = bench.settings.default_account + "_import"
+    import_settings = Settings(default_account=name, accounts=[Account(name=name)])
+    import_path = get_db_path(name)
+    frame = excel_frame(bench.import_rows, bench.seed)
+    def import_rows_run():
+        import_conn = sqlite3.connect(import_path)
+        import_conn.execute("DELETE FROM TRADES")
+        import_conn.commit()
+        import_conn.close()
+        read_and_print_rows(frame, 'buy', list(range(1, bench.import_rows + 1)), True, import_settings)
+    import_conn = sqlite3.connect(import_path)
+    migrate.create_schema(import_conn)
+    import_conn.close()
+    results = {f'stocks_reader.import_{bench.import_rows}_rows': time_call(import_rows_run, max(1, bench.repeat // 2))}
+    os.remove(import_path)
+    return results
+
+# Benchmark areas in the order they run. Later areas see the writes of earlier ones (alerts,
+# journal edits, archived trades), so new areas go before archive unless they need it.
+BENCHMARKS = {
+    'dashboard': bench_dashboard,
+    'filter': bench_filters,
+    'funds': bench_funds,
+    'planner': bench_planner,
+    'replica': bench_replica,
+    'serve': bench_serve,
+    'alerts': bench_alerts,
+    'simulate': bench_simulate,
+    'returns': bench_returns,
+    'backtest': bench_backtest,
+    'ticks': bench_ticks,
+    'money': bench_money,
+    'journal': bench_journal,
+    'sync': bench_sync,
+    'archive': bench_archive,
+    'importer': bench_importer,
+}
+
+def run_benchmarks(settings: Settings, repeat: int, import_rows: int, seed: int, areas=None) -> dict:
+    """
+    Runs the areas of BENCHMARKS (all by default) against the generated account.
+    """
+    conn = sqlite3.connect(get_db_path(settings.default_account))
+    try:
+        snapshot = load_snapshot(conn.cursor(), 3.75)
+        bench = Bench(
+            settings=settings,
+            repeat=repeat,
+            import_rows=import_rows,
+            seed=seed,
+            conn=conn,
+            snapshot=snapshot,
+            current_prices={holding.symbol: holding.price for holding in snapshot.tickers},
+            top_symbol=max(snapshot.tickers, key=lambda holding: holding.net_shares).symbol if snapshot.tickers else "$SYM0",
+            render_console=Console(file=StringIO(), width=160),
+        )
+        results = {}
+        for name, run in BENCHMARKS.items():
+            if areas is None or name in areas:
+                results.update(run(bench))
+        return results
+    finally:
+        conn.close()
+
+def compare(results: dict, baseline_path: str, threshold: float, min_ms: float = 1.0) -> list:
+    """
+    Prints median timings against a previous JSON run and returns the names that regressed.
+    Timings under min_ms are too noisy to count as regressions.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    print(f"{'benchmark':40} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:40} {'-':>12} {result['median_ms']:>12.3f}")
+            continue
+        before = baseline[name]['median_ms']
+        ratio = result['median_ms'] / before if before else float('inf')
+        regressed = ratio > threshold and result['median_ms'] >= min_ms
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:40} {before:>12.3f} {result['median_ms']:>12.3f} {ratio:>7.2f}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark TraderCLI hot paths on a generated account.")
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--trades", type=int, default=100_000)
+    parser.add_argument("--funds", type=int, default=1_000)
+    parser.add_argument("--open-lots", type=int, default=2_000)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--import-rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Run only these benchmark areas")
+    parser.add_argument("--dir", help="Directory for the generated databases (default: a temporary directory)")
+    parser.add_argument("--out", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Compare against a previous JSON result file")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Median ratio that counts as a regression")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="Ignore regressions in timings below this many ms")
+    args = parser.parse_args(argv)
+
+    work_dir = args.dir or tempfile.mkdtemp(prefix="tradecli-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    previous_dir = os.getcwd()
+    out_path = os.path.abspath(args.out) if args.out else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    os.chdir(work_dir)
+    try:
+        settings = Settings(default_account="bench", accounts=[Account(name="bench")])
+        start = time.perf_counter()
+        generate_account(get_db_path(settings.default_account), args.symbols, args.trades, args.funds, args.open_lots, args.years, args.seed)
+        generate_seconds = time.perf_counter() - start
+        results = run_benchmarks(settings, args.repeat, args.import_rows, args.seed, args.only)
+    finally:
+        os.chdir(previous_dir)
+
+    report = {
+        'meta': {
+            'symbols': args.symbols,
+            'trades': args.trades,
+            'funds': args.funds,
+            'open_lots': args.open_lots,
+            'years': args.years,
+            'seed': args.seed,
+            'generate_seconds': round(generate_seconds, 3),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    if out_path:
+        with open(out_path, 'w') as f:
+            json.dump(report, f, indent=4)
+    if compare_path:
+        regressions = compare(results, compare_path, args.threshold, args.min_ms)
+        if regressions:
+            sys.exit(1)
+    elif not out_path:
+        print(json.dumps(report, indent=4))
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
 
 from settings import Settings
 from rich.console import Console
+from fx_rates import FxRates, account_fx
+from utils import parse_date_key
 
 def calc_menu(settings: Settings=Settings()):
     console = Console()    
     try:
         account = settings.get_account()
         secondary_currency = account.exchange_rate_label
-        exchange_rate = account.exchange_rate
+        fx = account_fx(settings)
         
         while True:
             console.print("\n[bold blue]Calculator Menu[/bold blue]")
@@ -18,7 +20,7 @@ def calc_menu(settings: Settings=Settings()):
             if choice == "1":
                 percentage_calculation(console)
             elif choice == "2":
-                currency_conversion(console, secondary_currency, exchange_rate)
+                currency_conversion(console, secondary_currency, fx)
             else:
                 break
     except KeyboardInterrupt:
@@ -61,9 +63,17 @@ def percentage_calculation(console: Console):
     except ValueError:
         console.print("[red]Invalid input. Please enter valid numbers.[/red]")
 
-def currency_conversion(console: Console, secondary_currency: str, exchange_rate: float):
+def currency_conversion(console: Console, secondary_currency: str, fx: FxRates):
     console.print(f"\n[bold cyan]Currency Conversion (USD ↔ {secondary_currency})[/bold cyan]")
-    console.print(f"Current exchange rate: 1 USD = {exchange_rate} {secondary_currency}")
+    console.print(f"Current exchange rate: 1 USD = {fx.latest()} {secondary_currency}")
+    date_str = input("Enter date for the rate (DD/MM/YYYY) or Enter for latest: ").strip()
+    try:
+        exchange_rate = float(fx.rate_at([int(parse_date_key(date_str))])[0]) if date_str else fx.latest()
+    except ValueError as e:
+        console.print(f"[red]Invalid date: {e}[/red]")
+        return
+    if date_str:
+        console.print(f"Exchange rate on {date_str}: 1 USD = {exchange_rate} {secondary_currency}")
     console.print(f"1. USD to {secondary_currency}")
     console.print(f"2. {secondary_currency} to USD")
     
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import migrate
+import profiler
+from rich.console import Console
+from rich.table import Table
+from repository import amount_sql, price_sql
+from settings import Settings
+from trade_query import prices_cte
+from utils import get_db_path
+
+# Per account totals from the trigger-maintained rollup (see rollup.py). Sums are taken in
+# stored units (see repository.py) and converted once, px carries prices in price units too
+ACCOUNT_TOTALS_SQL = f"""
+SELECT ? AS account, ? AS label, ? AS rate,
+(SELECT {amount_sql("COALESCE(SUM(CASE WHEN opr='deposit' THEN amount_USD ELSE -amount_USD END), 0)")} FROM {{schema}}.FUNDS) AS funds,
+(SELECT {amount_sql('COALESCE(SUM(buy_cost - sell_cost), 0)')} FROM {{schema}}.SYMBOL_ROLLUP) AS cost,
+(SELECT {amount_sql('COALESCE(SUM(realized_pl), 0)')} FROM {{schema}}.SYMBOL_ROLLUP) AS realized,
+(SELECT {amount_sql('COALESCE(SUM(fees), 0)')} FROM {{schema}}.SYMBOL_ROLLUP) AS fees,
+(SELECT {amount_sql('COALESCE(SUM(vat), 0)')} FROM {{schema}}.SYMBOL_ROLLUP) AS vat,
+(SELECT {price_sql('COALESCE(SUM(h.net_shares * COALESCE(px.price, h.last_price)), 0)')} FROM (
+    SELECT symbol,
+    buy_qty - sell_qty AS net_shares,
+    (SELECT price FROM {{schema}}.TRADES t2 WHERE t2.symbol = r.symbol AND opr = 'buy' ORDER BY price DESC LIMIT 1) AS last_price
+    FROM {{schema}}.SYMBOL_ROLLUP r
+    WHERE buy_qty - sell_qty != 0
+) h LEFT JOIN px ON px.symbol = h.symbol) AS market_value
+"""
+
+def attach_accounts(conn: sqlite3.Connection, settings: Settings) -> tuple[list, list]:
+    """
+    Attaches every account database that exists on disk as acc0, acc1, ...
+    Each is brought to the current schema first, so accounts not opened in a while get their
+    rollups and integer amounts (see migrate.py).
+    Returns the attached (schema, account) pairs and the names of accounts that were skipped.
+    """
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    attached = []
+    skipped = []
+    for account in settings.accounts:
+        db_path = get_db_path(account.name)
+        if not os.path.exists(db_path) or len(attached) >= limit:
+            skipped.append(account.name)
+            continue
+        migrate.ensure_schema(account.name)
+        schema = f"acc{len(attached)}"
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (db_path,))
+        attached.append((schema, account))
+    return attached, skipped
+
+def load_consolidated(conn: sqlite3.Connection, attached: list, current_prices: dict) -> list:
+    """
+    Per account, per currency and combined totals for all attached accounts in one query.
+    Rows are (level, account, label, funds, cash, fees, vat, realized, unrealized, market_value, net_worth),
+    level 0 being one account, 1 the accounts sharing a secondary currency and 2 everything in USD.
+    Level 0 and 1 amounts are converted with each account's exchange rate.
+    """
+    cte, params = prices_cte(current_prices)
+    branches = []
+    for schema, account in attached:
+        branches.append(ACCOUNT_TOTALS_SQL.format(schema=schema))
+        params.extend((account.name, account.exchange_rate_label, account.exchange_rate))
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        {cte}, per AS ({' UNION ALL '.join(branches)}),
+        calc AS (
+            SELECT account, label, rate, funds, funds - cost AS cash, fees, vat, realized,
+            market_value - cost AS unrealized, market_value, market_value + funds - cost AS net_worth
+            FROM per
+        )
+        SELECT 0, account, label, funds * rate, cash * rate, fees * rate, vat * rate, realized * rate, unrealized * rate, market_value * rate, net_worth * rate
+        FROM calc
+        UNION ALL
+        SELECT 1, 'All accounts', label, SUM(funds * rate), SUM(cash * rate), SUM(fees * rate), SUM(vat * rate), SUM(realized * rate), SUM(unrealized * rate), SUM(market_value * rate), SUM(net_worth * rate)
+        FROM calc GROUP BY label
+        UNION ALL
+        SELECT 2, 'All accounts', 'USD', SUM(funds), SUM(cash), SUM(fees), SUM(vat), SUM(realized), SUM(unrealized), SUM(market_value), SUM(net_worth)
+        FROM calc
+        ORDER BY 1, 2
+    """, params)
+    return cursor.fetchall()
+
+def consolidated_menu(settings: Settings, current_prices: dict = {}):
+    """
+    Shows every account side by side with combined totals. Only the active
+    account's prices are known, other holdings use their highest buy price.
+    """
+    console = Console()
+    conn = profiler.connect(":memory:")
+    try:
+        attached, skipped = attach_accounts(conn, settings)
+        if not attached:
+            console.print("[red]No account databases found.[/red]")
+            input("Press Enter to continue...")
+            return
+        rows = load_consolidated(conn, attached, current_prices)
+    except sqlite3.Error as e:
+        console.print(f"[red]Error loading accounts: {e}[/red]")
+        input("Press Enter to continue...")
+        return
+    finally:
+        conn.close()
+
+    table = Table(title="Consolidated Accounts")
+    table.add_column("Account", style="cyan")
+    table.add_column("Currency", style="dim")
+    table.add_column("Funds", justify="right")
+    table.add_column("Cash", justify="right", style="magenta")
+    table.add_column("Fees + VAT", justify="right")
+    table.add_column("Realized P/L", justify="right")
+    table.add_column("Unrealized P/L", justify="right")
+    table.add_column("Market Value", justify="right", style="yellow")
+    table.add_column("Net Worth", justify="right", style="green")
+    previous_level = 0
+    for level, account, label, funds, cash, fees, vat, realized, unrealized, market_value, net_worth in rows:
+        if level != previous_level:
+            table.add_row("---", "---", "---", "---", "---", "---", "---", "---", "---")
+            previous_level = level
+        realized_text = f"[red]{realized:,.2f}[/red]" if realized < 0 else f"{realized:,.2f}"
+        unrealized_text = f"[red]{unrealized:,.2f}[/red]" if unrealized < 0 else f"{unrealized:,.2f}"
+        account_text = f"[bold]{account}[/bold]" if level == 2 else account
+        table.add_row(account_text, label, f"{funds:,.2f}", f"{cash:,.2f}", f"{fees + vat:,.2f}", realized_text, unrealized_text, f"{market_value:,.2f}", f"{net_worth:,.2f}")
+    console.print(table)
+    if skipped:
+        console.print(f"[yellow]Skipped accounts (no database or attach limit reached): {', '.join(skipped)}[/yellow]")
+    input("Press Enter to continue...")
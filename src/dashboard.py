@@ -0,0 +1,146 @@
+from dataclasses import replace
+import numpy as np
+from rich.table import Table
+from alerts import Alert
+from paging import PageWindow
+from settings import Settings
+from snapshot import Snapshot
+from valuation import LotValues, value_holdings
+
+OPEN_POSITIONS_PAGE_SIZE = 25
+ALERTS_SHOWN = 10
+
+def qty_text(qty: float) -> str:
+    return str(int(qty)) if float(qty).is_integer() else str(qty)
+
+def get_ticker_data(snapshot: Snapshot, current_prices: dict) -> list:
+    """
+    Holdings priced at the current prices.
+    """
+    return [replace(holding, price=current_prices.get(holding.symbol, 0)) for holding in snapshot.tickers]
+
+def lot_order(snapshot: Snapshot, current_prices: dict, settings: Settings, window: PageWindow) -> tuple[LotValues, np.ndarray]:
+    """
+    Values every open lot and returns them with the lot indexes in the window's sort order.
+    """
+    values = snapshot.lot_book.value(current_prices, settings.get_account().fees_usd, snapshot.fx.latest())
+    return values, snapshot.lot_book.order(values, window.sort)
+
+def jump_to_lot(snapshot: Snapshot, current_prices: dict, settings: Settings, window: PageWindow, trade_id: int) -> bool:
+    """
+    Moves the window to the page holding the open lot with this ID.
+    """
+    _, order = lot_order(snapshot, current_prices, settings, window)
+    positions = np.flatnonzero(snapshot.lot_book.ids[order] == trade_id)
+    if not len(positions):
+        return False
+    window.show_position(int(positions[0]), trade_id)
+    return True
+
+def open_positions_table(snapshot: Snapshot, current_prices: dict, settings: Settings, window: PageWindow | None = None) -> Table | None:
+    """
+    One page of open lots in the window's sort order. Totals cover all open lots.
+    """
+    if not snapshot.trades:
+        return None
+    window = window or PageWindow(OPEN_POSITIONS_PAGE_SIZE)
+    account = settings.get_account()
+    values, order = lot_order(snapshot, current_prices, settings, window)
+    start, end = window.bounds(len(order))
+    title = "Open Positions"
+    if window.pages(len(order)) > 1 or window.sort.column != 'price' or window.sort.descending:
+        title += f" ({window.sort.describe()}) Page {window.page + 1} of {window.pages(len(order))}"
+    trades_table = Table(title=title)
+    trades_table.add_column("#", style="yellow")
+    trades_table.add_column("Date", style="dim")
+    trades_table.add_column("Ticker", style="cyan")
+    trades_table.add_column("Operation", justify="left")
+    trades_table.add_column("Qty", justify="right")
+    trades_table.add_column("Price", justify="right", style="yellow")
+    trades_table.add_column("Cost Value", justify="right")
+    trades_table.add_column("Cost Price", justify="right", style="yellow")
+    trades_table.add_column("Profit/Loss", justify="right")
+    trades_table.add_column(f" {account.exchange_rate_label} ", justify="right")
+
+    visible = order[start:end]
+    lots = [snapshot.trades[index] for index in visible.tolist()]
+    rows = zip(lots, values.pl[visible].tolist(), values.pl_percent[visible].tolist(), values.pl_sec[visible].tolist(), values.cost_price[visible].tolist())
+    for counter, (lot, pl, pl_percent, pl_sec, cost_price) in enumerate(rows, start=start + 1):
+        pl_text = f"[red]${pl:,.2f}[/red]" if pl < 0 else f"${pl:,.2f}"
+        pl_text_sar = f"[red]{pl_sec:,.2f}[/red]" if pl < 0 else f"{pl_sec:,.2f}"
+        opr_text = f"[green]{lot.opr}[/green]" if lot.is_buy else f"[red]{lot.opr}[/red]"
+        trades_table.add_row(str(counter), str(lot.trade_date), lot.symbol, f"{opr_text} #{str(lot.ID)}", str(lot.filled_qty), f"${lot.price:,.2f}", f"${lot.cost_value:,.2f}", f"{cost_price:,.2f}", F"{pl_text} [dim]{pl_percent:.2%}[/dim]", pl_text_sar, style="reverse" if lot.ID == window.highlight else None)
+
+    # Totals row covers every open lot, not just this page
+    sub_pl = values.total_pl
+    trades_table.add_row("---", "---", "---", "---", "---", "---", "---", "---", "---")
+    pl_text_total = f"[red]${sub_pl:,.2f}[/red]" if sub_pl < 0 else f"${sub_pl:,.2f}"
+    pl_text_sar_total = f"[red]{values.total_pl_sec:,.2f}[/red]" if sub_pl < 0 else f"{values.total_pl_sec:,.2f}"
+    trades_table.add_row("Total", "", "", "", qty_text(values.total_qty), f"{values.avg_price:,.2f}", f"${values.total_cost_value:,.2f}", "", f"{pl_text_total} [dim]{values.total_pl_percent:.2%}[/dim]", pl_text_sar_total)
+    return trades_table
+
+def holdings_table(snapshot: Snapshot, ticker_data: list, settings: Settings) -> Table:
+    label = settings.get_account().exchange_rate_label
+    rate = snapshot.fx.latest()
+    table = Table(title="Summary of Holdings (Version 0.1.1)")
+    table.add_column("Ticker", style="cyan")
+    table.add_column("Shares", justify="right")
+    table.add_column("Total Cost", justify="right")
+    table.add_column("Market Value", justify="right", style="yellow")
+    table.add_column("Unrealized P/L", justify="right")
+    table.add_column("Realized P/L", justify="right")
+    table.add_column("%, avg", justify="right")
+
+    values = value_holdings(ticker_data, snapshot.total_funds, rate, snapshot.realized_sec)
+    rows = zip(ticker_data, values.market_value.tolist(), values.unrealized_pl.tolist(), values.funds_percent.tolist(), values.realized_sec.tolist(), values.avg_cost.tolist())
+    for holding, market_value, unrealized_pl, funds_percent, profit_sar, avg_cost in rows:
+        total_cost, profit = holding.total_cost, holding.profit
+        unrealized_text = f"[red]${unrealized_pl:,.2f}[/red]" if unrealized_pl < 0 else f"${unrealized_pl:,.2f}"
+        unrealized_text_sar = f"[red]{label} {unrealized_pl * rate:,.2f}[/red]" if unrealized_pl < 0 else f"{label} {unrealized_pl * rate:,.2f}"
+        profit_text = f"[red]${profit:,.2f}[/red]" if profit < 0 else f"${profit:,.2f}"
+        profit_text_sar = f"[red]{label} {profit_sar:,.2f}[/red]" if profit_sar < 0 else f"{label} {profit_sar:,.2f}"
+        table.add_row(holding.symbol, str(holding.net_shares), f"${total_cost:,.2f}", f"${market_value:,.2f}", unrealized_text, profit_text, f"{funds_percent:.2%}")
+        table.add_row(f"[magenta]{holding.price}[/magenta]", "", f"{label} {total_cost * rate:,.2f}", f"{label} {market_value * rate:,.2f}", unrealized_text_sar, profit_text_sar, f"{avg_cost:.2f}")
+    return table
+
+def totals_table(snapshot: Snapshot, ticker_data: list, settings: Settings) -> Table:
+    label = settings.get_account().exchange_rate_label
+    rate = snapshot.fx.latest()
+    total_cash = snapshot.total_cash
+    total_market_value = value_holdings(ticker_data, snapshot.total_funds, rate, snapshot.realized_sec).total_market_value
+    if total_market_value == 0:
+        cash_ratio = 0
+    else:
+        cash_ratio = total_cash / total_market_value
+
+    # Account Totals table
+    totals_table = Table(title=f"Account Totals ({settings.default_account})")
+    totals_table.add_column("Funds", justify="right")
+    totals_table.add_column(f"Cash [dim]{cash_ratio:.2%}[/dim]", justify="right", style="magenta")
+    totals_table.add_column("Fees", justify="right")
+    totals_table.add_column("VAT", justify="right")
+    totals_table.add_column("Net Worth", justify="right", style="green")
+    totals_table.add_column("Trades", justify="left")
+
+    totals_table.add_row(f"${snapshot.total_funds:,.2f}", f"${total_cash:,.2f}", f"${snapshot.total_fees:,.2f}", f"${snapshot.total_vat:,.2f}", f"${total_market_value + total_cash:,.2f}", f"{snapshot.total_buy_trades} buy")
+    totals_table.add_row(f"{label} {snapshot.total_funds_sar:,.2f}", f"{label} {total_cash * rate:,.2f}", f"{label} {snapshot.total_fees_sec:,.2f}", f"{label} {snapshot.total_vat_sec:,.2f}", f"{label} {(total_market_value + total_cash) * rate:,.2f}", f"{snapshot.total_sell_trades} sell")
+    return totals_table
+
+def alerts_table(fired: list[Alert], count: int) -> Table | None:
+    """
+    The latest fired alerts not dismissed yet, out of count, None when there are none.
+    """
+    if not fired:
+        return None
+    title = "Alerts (dismiss from Menu, N)" if count <= len(fired) else f"Alerts, latest {len(fired)} of {count} (dismiss from Menu, N)"
+    table = Table(title=title)
+    table.add_column("#", style="yellow")
+    table.add_column("Fired", style="dim")
+    table.add_column("Ticker", style="cyan")
+    table.add_column("Level", justify="left")
+    table.add_column("Price", justify="right", style="yellow")
+    table.add_column("Quote", justify="right")
+    for alert in fired:
+        direction = "[green]rose to[/green]" if alert.above else "[red]fell to[/red]"
+        table.add_row(str(alert.ID), alert.fired, alert.symbol, f"{direction} {alert.label.replace('_', ' ')}", f"${alert.price:,.2f}", f"${alert.fired_price:,.2f}")
+    return table
@@ -1,102 +1,216 @@
 
-from utils import get_db_path
+from utils import get_db_path, parse_date_key
 from settings import Settings
 from rich.console import Console
 from rich.table import Table
-from datetime import datetime
+from trade_query import SORT_EXPRESSIONS, TradeFilter, TradePager, aggregate, fetch_page, locate, prices_key, total_pl, value_rows
+from paging import SortOrder, parse_jump, prompt_sort
+from fx_rates import FxRates, load_fx
+import numpy as np
+import archive
+import query_cache
+import rollup
 
-import sqlite3
+PAGE_SIZE = 50
 
-def filter_menu(settings: Settings=Settings(), current_prices={}):
-    console = Console()
-    while True:
-        # Connect to database
-        conn = sqlite3.connect(get_db_path( settings.default_account ))
-        cursor = conn.cursor()
-        
-        # filter trades by operation type
-        console.print("[blue]Filter Trades by:[/blue] B[dim]uy[/dim], S[dim]ell[/dim], P[dim]rice[/dim], D[dim]ate[/dim], A[dim]ll[/dim] or Enter to skip")
-        opr_filter = input("Enter choice: ").strip().lower()
+def prompt_filter(opr_filter: str, trade_filter: TradeFilter, console: Console) -> TradeFilter | None:
+    """
+    Applies one menu choice on top of the current filter.
+    Returns None when the input was invalid and the filter stays unchanged.
+    """
+    try:
         if opr_filter == 'b':
-            cursor.execute("SELECT ID, trade_date, symbol, opr, filled_qty, price, cost_value, profit_loss, is_position_open FROM TRADES WHERE opr='buy' ORDER BY price")
+            return trade_filter.update(opr='buy')
         elif opr_filter == 's':
-            cursor.execute("SELECT ID, trade_date, symbol, opr, filled_qty, price, cost_value, profit_loss, is_position_open FROM TRADES WHERE opr='sell' ORDER BY price")
+            return trade_filter.update(opr='sell')
+        elif opr_filter == 'y':
+            symbol = input("Enter symbol to filter (Enter to clear): ").strip().upper()
+            return trade_filter.update(symbol=symbol or None)
         elif opr_filter == 'p':
-            try:
-                price_start = float(input("Enter price start range to filter (e.g., 100.00): ").strip())
-                price_end = float(input("Enter price end range to filter (e.g., 200.00): ").strip())
-            except ValueError:
-                console.print(f"[red]Invalid price range input.[/red]")
-                input("Press Enter to continue...")
-                continue
-            cursor.execute("SELECT ID, trade_date, symbol, opr, filled_qty, price, cost_value, profit_loss, is_position_open FROM TRADES WHERE price >= ? AND price <= ? ORDER BY price", (price_start, price_end))
+            price_start = float(input("Enter price start range to filter (e.g., 100.00): ").strip())
+            price_end = float(input("Enter price end range to filter (e.g., 200.00): ").strip())
+            return trade_filter.update(price_min=price_start, price_max=price_end)
         elif opr_filter == 'd':
             month_year_str = input("Enter month and year to filter (MM/YYYY) or (YYYY): ").strip()
-            try:
-                if month_year_str and len(month_year_str) == 4:
-                    cursor.execute("SELECT ID, trade_date, symbol, opr, filled_qty, price, cost_value, profit_loss, is_position_open FROM TRADES WHERE SUBSTR(trade_date, 7, 4) = ? ORDER BY price", (month_year_str,))
-                else:
-                    month_year = datetime.strptime(month_year_str, "%m/%Y")
-                    month_year_str = month_year.strftime("%m/%Y")
-                    cursor.execute("SELECT ID, trade_date, symbol, opr, filled_qty, price, cost_value, profit_loss, is_position_open FROM TRADES WHERE SUBSTR(trade_date, 4, 7) = ? ORDER BY price", (month_year_str,))
-            except ValueError:
-                console.print(f"[red]Invalid month/year format.[/red]")
-                input("Press Enter to continue...")
+            return trade_filter.update(date_from=parse_date_key(month_year_str), date_to=parse_date_key(month_year_str, end=True))
+        elif opr_filter == 'r':
+            date_from = input("Enter start date (DD/MM/YYYY, MM/YYYY or YYYY, Enter for none): ").strip()
+            date_to = input("Enter end date (DD/MM/YYYY, MM/YYYY or YYYY, Enter for none): ").strip()
+            return trade_filter.update(date_from=parse_date_key(date_from) if date_from else None, date_to=parse_date_key(date_to, end=True) if date_to else None)
+        elif opr_filter == 'o':
+            position = input("Show (O)pen, (C)losed or Enter for both: ").strip().lower()
+            return trade_filter.update(is_open=True if position == 'o' else False if position == 'c' else None)
+        elif opr_filter == 'l':
+            sign = input("Show (P)rofit, (L)oss or Enter for both: ").strip().lower()
+            return trade_filter.update(pl_sign=1 if sign == 'p' else -1 if sign == 'l' else None)
+    except ValueError as e:
+        console.print(f"[red]Invalid input: {e}[/red]")
+        input("Press Enter to continue...")
+    return None
+
+def converted_totals(totals: dict, trade_filter: TradeFilter, current_prices: dict, fx: FxRates) -> tuple[float, float]:
+    """
+    Cost value and P/L totals in the secondary currency. Realized amounts convert at
+    the rate of their trade dates, open P/L at the latest rate.
+    """
+    if not totals['by_date']:
+        return 0.0, 0.0
+    date_keys, costs, closed = zip(*totals['by_date'])
+    rates = fx.rate_at(date_keys)
+    cost_sec = float(np.dot(np.asarray(costs, dtype=np.float64), rates))
+    closed_sec = float(np.dot(np.asarray(closed, dtype=np.float64), rates))
+    open_pl = total_pl(totals, trade_filter, current_prices) - totals['closed_pl']
+    return cost_sec, closed_sec + open_pl * fx.latest()
+
+def open_pager(db_path: str, trade_filter: TradeFilter, current_prices: dict, default_rate: float = 1.0, sort: SortOrder = SortOrder()) -> tuple[TradePager, dict, FxRates]:
+    """
+    Opens a pager and the totals for a filter. Pages and totals are cached under the
+    filter, the database data_version and (only for P/L sign filters) the current prices,
+    so flipping between recent filters does not touch the database. Totals do not
+    depend on the sort order, pages do. A date range reaching archived trades reads
+    the archive too (see archive.resolve).
+    """
+    conn = query_cache.get_connection(db_path)
+    version = query_cache.data_version(conn)
+    trade_filter = archive.resolve(conn, trade_filter)
+    key = (db_path, version, trade_filter, prices_key(trade_filter, current_prices))
+
+    def fetch(after, page_size):
+        return query_cache.filter_cache.get_or_load(key + ('page', sort, after, page_size), lambda: fetch_page(conn.cursor(), trade_filter, current_prices, after, page_size, sort))
+
+    totals = query_cache.filter_cache.get_or_load(key + ('totals',), lambda: aggregate(conn.cursor(), trade_filter, current_prices))
+    fx = query_cache.filter_cache.get_or_load((db_path, version, 'fx', default_rate), lambda: load_fx(conn, default_rate))
+    pager = TradePager(trade_filter, fetch, PAGE_SIZE, sort)
+    pager.load()
+    return pager, totals, fx
+
+def jump_to_trade(db_path: str, pager: TradePager, current_prices: dict, trade_id: int) -> bool:
+    """
+    Moves the pager to the page holding trade_id, False when the trade is not in the filtered list.
+    """
+    conn = query_cache.get_connection(db_path)
+    starts = locate(conn.cursor(), pager.trade_filter, current_prices, trade_id, pager.page_size, pager.sort)
+    if starts is None:
+        return False
+    pager.jump(starts, trade_id)
+    return True
+
+def print_trades_page(pager: TradePager, totals: dict, fx: FxRates, current_prices: dict, settings: Settings, console: Console):
+    if not pager.rows:
+        console.print("No trades found.")
+        return
+    account = settings.get_account()
+    total_pages = max(1, -(-totals['count'] // pager.page_size))
+    query_table = Table(title=f"Filtered Trades Sorted by {pager.sort.describe()} ({pager.trade_filter.describe()}) Page {pager.page} of {total_pages}")
+    query_table.add_column("#", style="yellow")
+    query_table.add_column("Date", style="dim")
+    query_table.add_column("Symbol", style="cyan")
+    query_table.add_column("Operation", justify="center")
+    query_table.add_column("Qty", justify="right")
+    query_table.add_column("Price", justify="right", style="yellow")
+    query_table.add_column("Cost Value", justify="right")
+    query_table.add_column("Profit/Loss", justify="right")
+    query_table.add_column("Position", justify="center")
+
+    counter = (pager.page - 1) * pager.page_size + 1
+    # Only open positions depend on prices, they are valued here rather than cached
+    for trade in value_rows(pager.rows, current_prices):
+        profit_loss = trade.profit_loss
+        pl_text = f"[red]${profit_loss:,.2f}[/red]" if profit_loss and profit_loss < 0 else f"[green]${profit_loss:,.2f}[/green]" if profit_loss > 0 else "-"
+        opr_text = f"[green]{trade.opr} [/green]" if trade.is_buy else f"[red]{trade.opr}[/red]"
+        is_position_open_text = "OPEN" if trade.is_open else " "
+        query_table.add_row(str(counter), str(trade.trade_date), trade.symbol, f"{opr_text} #{str(trade.ID)}", str(trade.filled_qty), f"${trade.price:,.2f}", f"${trade.cost_value:,.2f}", pl_text, is_position_open_text, style="reverse" if trade.ID == pager.highlight else None)
+        counter += 1
+
+    # Totals cover the whole filtered result, not just this page
+    total_trades_qty = totals['qty']
+    total_trades_cost_value = totals['cost_value']
+    total_trades_pl = total_pl(totals, pager.trade_filter, current_prices)
+    query_table.add_row("---", "---", "---", "---", "---", "---", "---", "---", "---")
+    pl_text_total = f"[red]${total_trades_pl:,.2f}[/red]" if total_trades_pl < 0 else f"[green]${total_trades_pl:,.2f}[/green]" if total_trades_pl > 0 else "-"
+    avg_price = total_trades_cost_value / total_trades_qty if total_trades_qty else 0
+    query_table.add_row("Total", f"{totals['count']} trades", "", "", str(total_trades_qty), f"${avg_price:.2f}", f"${total_trades_cost_value:,.2f}", pl_text_total, str(totals['open_qty']))
+    cost_sec, pl_sec = converted_totals(totals, pager.trade_filter, current_prices, fx)
+    query_table.add_row(account.exchange_rate_label, "", "", "", "", "", f"{cost_sec:,.2f}", f"{pl_sec:,.2f}","")
+
+    console.print(query_table)
+
+def print_monthly_report(db_path: str, trade_filter: TradeFilter, console: Console):
+    """
+    Realized P/L per month from the month rollup, for the filter's symbol and date range.
+    """
+    conn = query_cache.get_connection(db_path)
+    months = rollup.monthly(conn, trade_filter.symbol, trade_filter.date_from, trade_filter.date_to)
+    if not months:
+        console.print("No trades found.")
+        return
+    scope = ", ".join(part for part in (trade_filter.symbol, trade_filter.has_date() and f"{trade_filter.date_from or '...'}-{trade_filter.date_to or '...'}") if part)
+    table = Table(title=f"Monthly Report ({scope or 'all trades'})")
+    table.add_column("Month", style="dim")
+    table.add_column("Buys", justify="right")
+    table.add_column("Sells", justify="right")
+    table.add_column("Bought", justify="right")
+    table.add_column("Sold", justify="right")
+    table.add_column("Realized P/L", justify="right")
+    table.add_column("Fees + VAT", justify="right")
+    totals = [0, 0, 0.0, 0.0, 0.0, 0.0]
+    for month, buys, sells, buy_cost, sell_cost, realized_pl, fees, vat in months:
+        pl_text = f"[red]${realized_pl:,.2f}[/red]" if realized_pl < 0 else f"[green]${realized_pl:,.2f}[/green]"
+        table.add_row(f"{month % 100:02d}/{month // 100}", str(buys), str(sells), f"${buy_cost:,.2f}", f"${sell_cost:,.2f}", pl_text, f"${fees + vat:,.2f}")
+        totals = [total + value for total, value in zip(totals, (buys, sells, buy_cost, sell_cost, realized_pl, fees + vat))]
+    table.add_row("---", "---", "---", "---", "---", "---", "---")
+    table.add_row("Total", str(totals[0]), str(totals[1]), f"${totals[2]:,.2f}", f"${totals[3]:,.2f}", f"${totals[4]:,.2f}", f"${totals[5]:,.2f}")
+    console.print(table)
+
+def filter_menu(settings: Settings=Settings(), current_prices={}):
+    console = Console()
+    trade_filter = TradeFilter()
+    sort = SortOrder()
+    pager = None
+    totals = None
+    fx = None
+    while True:
+        # filters combine, A resets back to all trades
+        console.print(f"[blue]Filter Trades by:[/blue] B[dim]uy[/dim], S[dim]ell[/dim], Y [dim]symbol[/dim], P[dim]rice[/dim], D[dim]ate[/dim], R[dim]ange of dates[/dim], O[dim]pen/closed[/dim], L [dim]profit/loss[/dim], H[dim]istory (archived trades)[/dim], A[dim]ll[/dim], > [dim]next page[/dim], < [dim]previous page[/dim], ^ [dim]sort[/dim], #[dim]ID jump[/dim], M[dim]onthly report[/dim] or Enter to skip")
+        console.print(f"[dim]Current filter: {trade_filter.describe()}[/dim]")
+        opr_filter = input("Enter choice: ").strip().lower()
+        db_path = get_db_path( settings.default_account )
+
+        if opr_filter.startswith('#'):
+            if pager is None:
+                pager, totals, fx = open_pager(db_path, trade_filter, current_prices, settings.get_account().exchange_rate, sort)
+            trade_id = parse_jump(opr_filter)
+            if trade_id is None or not jump_to_trade(db_path, pager, current_prices, trade_id):
+                console.print(f"[yellow]Trade #{trade_id} is not in the filtered trades.[/yellow]")
+            opr_filter = '#'
+        elif opr_filter == 'm':
+            # Per month sums come from the rollup, the trade list is left as it was
+            print_monthly_report(db_path, trade_filter, console)
+            continue
+        elif opr_filter == '^':
+            new_sort = prompt_sort(sort, list(SORT_EXPRESSIONS), console)
+            if new_sort is None:
+                continue
+            sort = new_sort
+        elif opr_filter in ('>', '<'):
+            if pager is None:
+                continue
+            moved = pager.next() if opr_filter == '>' else pager.previous()
+            if not moved:
+                console.print("[yellow]No more pages.[/yellow]")
+        elif opr_filter == 'h':
+            trade_filter = trade_filter.update(history=not trade_filter.history)
         elif opr_filter == 'a':
-            # Fetch all trades sorted by price descending
-            cursor.execute("SELECT ID, trade_date, symbol, opr, filled_qty, price, cost_value, profit_loss, is_position_open FROM TRADES ORDER BY price")
+            trade_filter = TradeFilter()
+        elif opr_filter in ('b', 's', 'y', 'p', 'd', 'r', 'o', 'l'):
+            new_filter = prompt_filter(opr_filter, trade_filter, console)
+            if new_filter is None:
+                continue
+            trade_filter = new_filter
         else:
-            conn.close()
             break  # Exit filter menu
-            
-        all_trades = cursor.fetchall()
-        conn.close()
-
-        if all_trades:
-            query_table = Table(title="Filtered Trades Sorted by Price (Descending)")
-            query_table.add_column("#", style="yellow")
-            query_table.add_column("Date", style="dim")
-            query_table.add_column("Symbol", style="cyan")
-            query_table.add_column("Operation", justify="center")
-            query_table.add_column("Qty", justify="right")
-            query_table.add_column("Price", justify="right", style="yellow")
-            query_table.add_column("Cost Value", justify="right")
-            query_table.add_column("Profit/Loss", justify="right")
-            query_table.add_column("Position", justify="center")
-
-            counter = 1
-            total_trades_qty = 0
-            total_trades_cost_value = 0
-            total_trades_pl = 0
-            total_open_qty = 0
-            for trade in all_trades:
-                ID, trade_date, symbol, opr, filled_qty, price, cost_value, profit_loss, is_position_open = trade
-                if is_position_open and is_position_open == 1:
-                    profit_loss = filled_qty * (current_prices.get(symbol, price) - price)
-                pl_text = f"[red]${profit_loss:,.2f}[/red]" if profit_loss and profit_loss < 0 else f"[green]${profit_loss:,.2f}[/green]" if profit_loss > 0 else "-"
-                opr_text = f"[green]{opr} [/green]" if opr.lower() == 'buy' else f"[red]{opr}[/red]"
-                is_position_open_text = "OPEN" if is_position_open == 1 else " "
-                query_table.add_row(str(counter), str(trade_date), symbol, f"{opr_text} #{str(ID)}", str(filled_qty), f"${price:,.2f}", f"${cost_value:,.2f}", pl_text, is_position_open_text)
-                counter += 1
-                if opr.lower() == 'buy':                        
-                    total_trades_qty += filled_qty
-                    total_trades_cost_value += cost_value
-                    if is_position_open and is_position_open == 1:
-                        total_open_qty += filled_qty
-                else:
-                    total_trades_qty -= filled_qty
-                    total_trades_cost_value -= cost_value
-                if opr_filter == 'd':
-                    if not is_position_open or is_position_open == 0:
-                        total_trades_pl += profit_loss
-                else:
-                    total_trades_pl += profit_loss
-            # Add totals row
-            query_table.add_row("---", "---", "---", "---", "---", "---", "---", "---", "---")
-            pl_text_total = f"[red]${total_trades_pl:,.2f}[/red]" if total_trades_pl < 0 else f"[green]${total_trades_pl:,.2f}[/green]" if total_trades_pl > 0 else "-"
-            query_table.add_row("Total", "", "", "", str(total_trades_qty), f"${total_trades_cost_value / total_trades_qty:.2f}", f"${total_trades_cost_value:,.2f}", pl_text_total, str(total_open_qty))
-            query_table.add_row(settings.get_account().exchange_rate_label, "", "", "", "", "", f"{total_trades_cost_value * settings.get_account().exchange_rate:,.2f}", f"{total_trades_pl * settings.get_account().exchange_rate:,.2f}","") 
-
-            console.print(query_table)
-        else:
-            console.print("No trades found.")    
\ No newline at end of file
+
+        if opr_filter not in ('>', '<', '#'):
+            pager, totals, fx = open_pager(db_path, trade_filter, current_prices, settings.get_account().exchange_rate, sort)
+
+        print_trades_page(pager, totals, fx, current_prices, settings, console)
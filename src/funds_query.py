@@ -0,0 +1,128 @@
+from __future__ import annotations
+from dataclasses import dataclass, replace
+from repository import Fund, amount_sql, projection, select
+from utils import date_key_sql
+
+FUND_DATE_KEY = date_key_sql('f.fund_date')
+
+FUND_COLUMNS = projection(Fund, 'f')
+
+@dataclass(frozen=True)
+class FundsFilter:
+    """
+    Combinable FUNDS predicates. Dates are YYYYMMDD keys (see utils.parse_date_key).
+    source matches as a case-insensitive prefix, which the source index can serve;
+    a source starting with '*' matches anywhere in the text instead.
+    """
+    date_from: str | None = None
+    date_to: str | None = None
+    source: str | None = None
+    opr: str | None = None
+
+    def update(self, **changes) -> FundsFilter:
+        return replace(self, **changes)
+
+    def describe(self) -> str:
+        parts = []
+        if self.date_from is not None or self.date_to is not None:
+            parts.append(f"date={self.date_from or '...'}-{self.date_to or '...'}")
+        if self.source:
+            parts.append(f"source={self.source}")
+        if self.opr:
+            parts.append(f"opr={self.opr}")
+        return ", ".join(parts) or "all funds"
+
+def _like_pattern(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def build_where(funds_filter: FundsFilter) -> tuple[str, list]:
+    """
+    Translates a FundsFilter into a WHERE clause (without the WHERE keyword) and its parameters.
+    """
+    clauses = []
+    params = []
+    if funds_filter.date_from is not None:
+        clauses.append(f"{FUND_DATE_KEY} >= ?")
+        params.append(funds_filter.date_from)
+    if funds_filter.date_to is not None:
+        clauses.append(f"{FUND_DATE_KEY} <= ?")
+        params.append(funds_filter.date_to)
+    if funds_filter.source:
+        if funds_filter.source.startswith('*'):
+            clauses.append("f.source LIKE ? ESCAPE '\\'")
+            params.append(f"%{_like_pattern(funds_filter.source[1:])}%")
+        else:
+            clauses.append("f.source LIKE ? ESCAPE '\\'")
+            params.append(f"{_like_pattern(funds_filter.source)}%")
+    if funds_filter.opr:
+        clauses.append("f.opr = ?")
+        params.append(funds_filter.opr)
+    return " AND ".join(clauses) or "1", params
+
+def fetch_page(cursor, funds_filter: FundsFilter, after_id: int | None = None, page_size: int = 50) -> list:
+    """
+    Returns one page of Fund records ordered by ID, starting after the given ID.
+    """
+    where, params = build_where(funds_filter)
+    if after_id is not None:
+        where += " AND f.ID > ?"
+        params.append(after_id)
+    params.append(page_size)
+    return select(cursor.connection, Fund, f"SELECT {FUND_COLUMNS} FROM FUNDS f WHERE {where} ORDER BY f.ID LIMIT ?", params).fetchall()
+
+def aggregate(cursor, funds_filter: FundsFilter) -> dict:
+    """
+    Deposit and withdrawal totals for the filter in one grouped query.
+    """
+    where, params = build_where(funds_filter)
+    cursor.execute(f"""
+        SELECT f.opr, COUNT(*), {amount_sql('COALESCE(SUM(f.amount_SAR), 0)')}, {amount_sql('COALESCE(SUM(f.amount_USD), 0)')}
+        FROM FUNDS f
+        WHERE {where}
+        GROUP BY f.opr
+    """, params)
+    totals = {
+        'count': 0,
+        'deposit_sar': 0.0, 'deposit_usd': 0.0,
+        'withdraw_sar': 0.0, 'withdraw_usd': 0.0,
+    }
+    for opr, count, amount_sar, amount_usd in cursor.fetchall():
+        totals['count'] += count
+        totals[f'{opr}_sar'] = amount_sar
+        totals[f'{opr}_usd'] = amount_usd
+    return totals
+
+class FundsPager:
+    """
+    Keyset pagination over filtered FUNDS rows, keeping the ID each visited page started after.
+    """
+    def __init__(self, funds_filter: FundsFilter, page_size: int = 50):
+        self.funds_filter = funds_filter
+        self.page_size = page_size
+        self.starts = [None]
+        self.rows = []
+
+    @property
+    def page(self) -> int:
+        return len(self.starts)
+
+    def load(self, cursor) -> list:
+        self.rows = fetch_page(cursor, self.funds_filter, self.starts[-1], self.page_size)
+        return self.rows
+
+    def next(self, cursor) -> bool:
+        if len(self.rows) < self.page_size:
+            return False
+        self.starts.append(self.rows[-1].ID)
+        if not self.load(cursor):
+            self.starts.pop()
+            self.load(cursor)
+            return False
+        return True
+
+    def previous(self, cursor) -> bool:
+        if len(self.starts) == 1:
+            return False
+        self.starts.pop()
+        self.load(cursor)
+        return True
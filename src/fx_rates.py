@@ -0,0 +1,115 @@
+from __future__ import annotations
+import csv
+import os
+import sqlite3
+import profiler
+import numpy as np
+from migrate import schema_fx_sql
+from utils import date_key_sql, get_db_path, parse_date_key
+
+class FxRates:
+    """
+    USD to secondary currency rates as a sorted time series.
+    Dates are YYYYMMDD integers, lookups return the rate in effect on (or before) each date.
+    """
+    def __init__(self, dates=None, rates=None, default_rate: float = 1.0):
+        self.dates = np.asarray(dates if dates is not None else [], dtype=np.int64)
+        self.rates = np.asarray(rates if rates is not None else [], dtype=np.float64)
+        self.default_rate = default_rate
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, default_rate: float) -> FxRates:
+        rows = conn.execute("SELECT rate_date, rate FROM FX_RATES ORDER BY rate_date").fetchall()
+        if not rows:
+            return cls(default_rate=default_rate)
+        dates, rates = zip(*rows)
+        return cls(dates, rates, default_rate)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def latest(self) -> float:
+        return float(self.rates[-1]) if len(self.rates) else self.default_rate
+
+    def rate_at(self, date_keys) -> np.ndarray:
+        """
+        As-of rates for an array of YYYYMMDD keys, one binary search over the whole column.
+        Dates before the first known rate use the first rate.
+        """
+        keys = np.asarray(date_keys, dtype=np.int64)
+        if not len(self.dates):
+            return np.full(keys.shape, self.default_rate, dtype=np.float64)
+        idx = np.searchsorted(self.dates, keys, side='right') - 1
+        return self.rates[np.clip(idx, 0, len(self.rates) - 1)]
+
+    def convert(self, amounts, date_keys) -> np.ndarray:
+        """
+        Converts USD amounts at the rate of their own dates.
+        """
+        return np.asarray(amounts, dtype=np.float64) * self.rate_at(date_keys)
+
+def ensure_table(conn: sqlite3.Connection):
+    conn.executescript(schema_fx_sql)
+
+def load_fx(conn: sqlite3.Connection, default_rate: float) -> FxRates:
+    ensure_table(conn)
+    return FxRates.load(conn, default_rate)
+
+def import_csv(conn: sqlite3.Connection, path: str) -> int:
+    """
+    Bulk loads date,rate lines (DD/MM/YYYY or YYYY-MM-DD dates, header optional) in one transaction.
+    Existing rates for the same date are replaced. Returns the number of rates loaded.
+    """
+    rows = []
+    with open(path, newline='') as f:
+        for line_no, record in enumerate(csv.reader(f), start=1):
+            if not record or not record[0].strip():
+                continue
+            date_str, rate_str = record[0].strip(), record[1].strip()
+            try:
+                if '-' in date_str:
+                    year, month, day = date_str.split('-')
+                    date_str = f"{day}/{month}/{year}"
+                rows.append((int(parse_date_key(date_str)), float(rate_str)))
+            except ValueError:
+                if line_no == 1:
+                    continue  # header
+                raise ValueError(f"Invalid rate on line {line_no}: {','.join(record)}")
+    ensure_table(conn)
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO FX_RATES (rate_date, rate) VALUES (?, ?)", rows)
+    return len(rows)
+
+def seed_from_funds(conn: sqlite3.Connection) -> int:
+    """
+    Adds the rates recorded on FUNDS rows for dates that have no rate yet.
+    """
+    ensure_table(conn)
+    with conn:
+        cursor = conn.execute(f"""
+            INSERT OR IGNORE INTO FX_RATES (rate_date, rate)
+            SELECT CAST({date_key_sql('fund_date')} AS INTEGER), AVG(rate_exchange)
+            FROM FUNDS
+            WHERE rate_exchange > 0
+            GROUP BY 1
+        """)
+    return cursor.rowcount
+
+def add_rate(conn: sqlite3.Connection, date_str: str, rate: float):
+    ensure_table(conn)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO FX_RATES (rate_date, rate) VALUES (?, ?)", (int(parse_date_key(date_str)), rate))
+
+def account_fx(settings) -> FxRates:
+    """
+    Loads the rate series of the default account, falling back to its configured exchange_rate.
+    """
+    account = settings.get_account()
+    db_path = get_db_path(settings.default_account)
+    if not os.path.exists(db_path):
+        return FxRates(default_rate=account.exchange_rate)
+    conn = profiler.connect(db_path)
+    try:
+        return load_fx(conn, account.exchange_rate)
+    finally:
+        conn.close()
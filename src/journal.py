@@ -0,0 +1,326 @@
+"""
+Append-only journal of every write to TRADES, FUNDS and TRADES_ARCHIVE, with state snapshots.
+
+Each journal entry is one user operation (buy, sell and close, update, delete, fund
+deposit/withdraw, import, archive) holding the before and after image of every row it touched.
+Undo and redo are journaled too, as entries that apply the inverse or the original
+images again, so the journal always replays forward:
+
+    state = latest snapshot + every entry after it
+
+Snapshots are taken on start once the tail has SNAPSHOT_EVERY entries, and from the journal
+menu, never inside a write. A snapshot keeps each table's rows in chunks of CHUNK_ROWS IDs and
+writes again only the chunks the tail touched, so its cost follows the tail rather than the history.
+"""
+from __future__ import annotations
+import json
+import sqlite3
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+
+TABLES = ('TRADES', 'FUNDS', 'TRADES_ARCHIVE')
+SNAPSHOT_EVERY = 200
+SNAPSHOTS_KEPT = 3
+CHUNK_ROWS = 1000
+DESCRIBE_ROWS = 6
+
+class JournalError(Exception):
+    pass
+
+@dataclass
+class Change:
+    """
+    One row of a journaled table before and after an operation, None when it did not exist.
+    """
+    table: str
+    row_id: int
+    before: dict | None
+    after: dict | None
+
+    def inverse(self) -> Change:
+        return Change(self.table, self.row_id, self.after, self.before)
+
+@dataclass
+class Entry:
+    seq: int
+    created: str
+    action: str
+    ref: int | None
+    changes: list[Change]
+
+    def describe(self) -> str:
+        """
+        The rows touched, counted per table and verb when there are more than DESCRIBE_ROWS.
+        """
+        verbs = [("insert" if change.before is None else "delete" if change.after is None else "update", change.table, change.row_id) for change in self.changes]
+        if len(verbs) <= DESCRIBE_ROWS:
+            return ", ".join(f"{verb} {table} #{row_id}" for verb, table, row_id in verbs)
+        counts = Counter((verb, table) for verb, table, _ in verbs)
+        return ", ".join(f"{verb} {count} {table}" for (verb, table), count in counts.items())
+
+@dataclass
+class State:
+    """
+    Rows of every journaled table by ID, and the undo/redo stacks (journal seqs).
+    """
+    rows: dict = field(default_factory=lambda: {table: {} for table in TABLES})
+    done: list = field(default_factory=list)
+    undone: list = field(default_factory=list)
+    seq: int = 0
+
+    def apply(self, entry: Entry):
+        for change in entry.changes:
+            if change.after is None:
+                self.rows[change.table].pop(change.row_id, None)
+            else:
+                self.rows[change.table][change.row_id] = change.after
+        if entry.action == 'undo':
+            self.done.remove(entry.ref)
+            self.undone.append(entry.ref)
+        elif entry.action == 'redo':
+            self.undone.remove(entry.ref)
+            self.done.append(entry.ref)
+        else:
+            self.done.append(entry.seq)
+            self.undone.clear()
+        self.seq = entry.seq
+
+def _columns(conn: sqlite3.Connection, table: str) -> list[str]:
+    return [info[1] for info in conn.execute(f"PRAGMA table_info({table})")]
+
+def row(conn: sqlite3.Connection, table: str, row_id: int) -> dict | None:
+    """
+    The current image of a row, as journaled.
+    """
+    cursor = conn.execute(f"SELECT * FROM {table} WHERE ID = ?", (row_id,))
+    values = cursor.fetchone()
+    if values is None:
+        return None
+    return dict(zip((column[0] for column in cursor.description), values))
+
+def change(conn: sqlite3.Connection, table: str, row_id: int, before: dict | None = None) -> Change:
+    """
+    Change of a row already written in this transaction, before being its image from row().
+    """
+    return Change(table, row_id, before, row(conn, table, row_id))
+
+def record(conn: sqlite3.Connection, action: str, changes: list[Change], ref: int | None = None) -> int:
+    """
+    Appends an entry in the caller's transaction and returns its seq. The caller commits.
+    """
+    changes = [c for c in changes if c.before != c.after]
+    if not changes:
+        return 0
+    cursor = conn.execute("INSERT INTO JOURNAL (created, action, ref, changes) VALUES (?, ?, ?, ?)",
+                          (datetime.now().isoformat(timespec='seconds'), action, ref, _payload(changes)))
+    return cursor.lastrowid
+
+def _payload(changes: list[Change]) -> str:
+    return json.dumps([[c.table, c.row_id, c.before, c.after] for c in changes])
+
+def _last_snapshot_seq(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(seq), -1) FROM JOURNAL_SNAPSHOTS").fetchone()[0]
+
+def _entry(values) -> Entry:
+    seq, created, action, ref, changes = values
+    return Entry(seq, created, action, ref, [Change(*c) for c in json.loads(changes)])
+
+def entries(conn: sqlite3.Connection, after: int = 0, limit: int | None = None, newest_first: bool = False) -> list[Entry]:
+    sql = f"SELECT seq, created, action, ref, changes FROM JOURNAL WHERE seq > ? ORDER BY seq {'DESC' if newest_first else ''} LIMIT ?"
+    return [_entry(values) for values in conn.execute(sql, (after, -1 if limit is None else limit))]
+
+def snapshot(conn: sqlite3.Connection) -> int:
+    """
+    Stores the state (rows and undo stacks) as of the latest journal entry, pruning all but the
+    newest SNAPSHOTS_KEPT snapshots. Only the chunks the journal tail touched, or whose table
+    changed columns, are written again; the others are shared with the previous snapshot.
+    The caller commits.
+    """
+    state = replay(conn)
+    seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM JOURNAL").fetchone()[0]
+    previous = conn.execute("SELECT seq, LENGTH(state) FROM JOURNAL_SNAPSHOTS ORDER BY seq DESC LIMIT 1").fetchone()
+    # Without a chunked snapshot to build on (none yet, or a whole-state one), every chunk is written
+    full = previous is None or previous[1] > 0
+    if full:
+        conn.execute("DELETE FROM JOURNAL_SNAPSHOT_CHUNKS")
+    else:
+        touched = {(c.table, c.row_id // CHUNK_ROWS) for entry in entries(conn, after=previous[0]) for c in entry.changes}
+    for table in TABLES:
+        columns = _columns(conn, table)
+        names = json.dumps(columns)
+        if full:
+            chunks = {chunk for (chunk,) in conn.execute(f"SELECT DISTINCT ID / ? FROM {table}", (CHUNK_ROWS,))}
+        else:
+            chunks = {chunk for touched_table, chunk in touched if touched_table == table}
+            chunks.update(chunk for (chunk,) in conn.execute("SELECT chunk FROM JOURNAL_SNAPSHOT_CHUNKS WHERE tbl = ? AND columns != ?", (table, names)))
+        for chunk in sorted(chunks):
+            rows = conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE ID >= ? AND ID < ? ORDER BY ID",
+                                (chunk * CHUNK_ROWS, (chunk + 1) * CHUNK_ROWS)).fetchall()
+            conn.execute("INSERT OR REPLACE INTO JOURNAL_SNAPSHOT_CHUNKS (tbl, chunk, seq, columns, rows) VALUES (?, ?, ?, ?, ?)",
+                         (table, chunk, seq, names, zlib.compress(json.dumps(rows).encode())))
+    stacks = json.dumps({'done': state.done, 'undone': state.undone})
+    conn.execute("INSERT OR REPLACE INTO JOURNAL_SNAPSHOTS (seq, created, stacks, state) VALUES (?, ?, ?, ?)",
+                 (seq, datetime.now().isoformat(timespec='seconds'), stacks, b''))
+    conn.execute("DELETE FROM JOURNAL_SNAPSHOTS WHERE seq NOT IN (SELECT seq FROM JOURNAL_SNAPSHOTS ORDER BY seq DESC LIMIT ?)", (SNAPSHOTS_KEPT,))
+    # Chunk versions older than the one the oldest kept snapshot reads are not needed any more
+    oldest = conn.execute("SELECT MIN(seq) FROM JOURNAL_SNAPSHOTS").fetchone()[0]
+    conn.execute("""
+        DELETE FROM JOURNAL_SNAPSHOT_CHUNKS WHERE seq < (
+            SELECT MAX(kept.seq) FROM JOURNAL_SNAPSHOT_CHUNKS AS kept
+            WHERE kept.tbl = JOURNAL_SNAPSHOT_CHUNKS.tbl AND kept.chunk = JOURNAL_SNAPSHOT_CHUNKS.chunk AND kept.seq <= ?)
+    """, (oldest,))
+    return seq
+
+def _snapshot_tables(conn: sqlite3.Connection, seq: int):
+    """
+    (table, columns, rows) of the snapshot at seq: its whole-state blob when it was taken
+    before the chunks, else the newest version of every chunk up to seq.
+    """
+    blob = conn.execute("SELECT state FROM JOURNAL_SNAPSHOTS WHERE seq = ?", (seq,)).fetchone()[0]
+    if blob:
+        for table, data in json.loads(zlib.decompress(blob)).items():
+            yield table, data['columns'], data['rows']
+        return
+    for table, columns, rows in conn.execute("""
+        SELECT tbl, columns, rows FROM JOURNAL_SNAPSHOT_CHUNKS AS chunks
+        WHERE seq = (SELECT MAX(seq) FROM JOURNAL_SNAPSHOT_CHUNKS WHERE tbl = chunks.tbl AND chunk = chunks.chunk AND seq <= ?)
+    """, (seq,)):
+        yield table, json.loads(columns), json.loads(zlib.decompress(rows))
+
+def rescale(conn: sqlite3.Connection, table: str, convert) -> int:
+    """
+    Rewrites every image of table's rows, in the entries and the snapshots, as convert(row),
+    for migrations that change how a column is stored. Returns the entries rewritten. The caller commits.
+    """
+    rewritten = 0
+    for entry in entries(conn):
+        if not any(c.table == table for c in entry.changes):
+            continue
+        changes = [Change(c.table, c.row_id, *(image if image is None else convert(image) for image in (c.before, c.after))) if c.table == table else c
+                   for c in entry.changes]
+        conn.execute("UPDATE JOURNAL SET changes = ? WHERE seq = ?", (_payload(changes), entry.seq))
+        rewritten += 1
+    for seq, blob in conn.execute("SELECT seq, state FROM JOURNAL_SNAPSHOTS WHERE LENGTH(state) > 0").fetchall():
+        tables = json.loads(zlib.decompress(blob))
+        if table not in tables:
+            continue
+        data = tables[table]
+        images = (convert(dict(zip(data['columns'], values))) for values in data['rows'])
+        data['rows'] = [[image[column] for column in data['columns']] for image in images]
+        conn.execute("UPDATE JOURNAL_SNAPSHOTS SET state = ? WHERE seq = ?", (zlib.compress(json.dumps(tables).encode()), seq))
+    for chunk, seq, columns, blob in conn.execute("SELECT chunk, seq, columns, rows FROM JOURNAL_SNAPSHOT_CHUNKS WHERE tbl = ?", (table,)).fetchall():
+        columns = json.loads(columns)
+        images = (convert(dict(zip(columns, values))) for values in json.loads(zlib.decompress(blob)))
+        rows = [[image[column] for column in columns] for image in images]
+        conn.execute("UPDATE JOURNAL_SNAPSHOT_CHUNKS SET rows = ? WHERE tbl = ? AND chunk = ? AND seq = ?",
+                     (zlib.compress(json.dumps(rows).encode()), table, chunk, seq))
+    return rewritten
+
+def ensure_snapshot(conn: sqlite3.Connection):
+    """
+    Takes a snapshot when the database has none, so the rows written before the journal
+    existed are part of the replayed state, or when the tail has reached SNAPSHOT_EVERY entries.
+    Run on start, outside any write.
+    """
+    last = _last_snapshot_seq(conn)
+    if last < 0 or conn.execute("SELECT COUNT(*) FROM JOURNAL WHERE seq > ?", (last,)).fetchone()[0] >= SNAPSHOT_EVERY:
+        snapshot(conn)
+        conn.commit()
+
+def replay(conn: sqlite3.Connection, rows: bool = False) -> State:
+    """
+    State as of the latest entry: the latest snapshot plus the journal tail.
+    The rows are only decoded when asked for, the undo stacks always are.
+    """
+    state = State()
+    found = conn.execute("SELECT seq, stacks FROM JOURNAL_SNAPSHOTS ORDER BY seq DESC LIMIT 1").fetchone()
+    if found is not None:
+        state.seq, stacks = found
+        stacks = json.loads(stacks)
+        state.done, state.undone = stacks['done'], stacks['undone']
+        if rows:
+            for table, columns, table_rows in _snapshot_tables(conn, state.seq):
+                id_index = columns.index('ID')
+                state.rows[table].update((values[id_index], dict(zip(columns, values))) for values in table_rows)
+    elif rows and conn.execute("SELECT 1 FROM JOURNAL LIMIT 1").fetchone():
+        raise JournalError("No snapshot to rebuild from")
+    if rows:
+        tail = entries(conn, after=state.seq)
+    else:
+        # The undo stacks only need the actions of the tail
+        tail = [Entry(seq, '', action, ref, []) for seq, action, ref in conn.execute("SELECT seq, action, ref FROM JOURNAL WHERE seq > ? ORDER BY seq", (state.seq,))]
+    for entry in tail:
+        state.apply(entry)
+    return state
+
+def write_changes(conn: sqlite3.Connection, changes: list[Change]):
+    """
+    Applies changes to the tables, refusing when a row is not in the expected before state
+    (it was changed outside the journal).
+    """
+    for c in changes:
+        if row(conn, c.table, c.row_id) != c.before:
+            raise JournalError(f"{c.table} #{c.row_id} was changed outside the journal")
+        conn.execute(f"DELETE FROM {c.table} WHERE ID = ?", (c.row_id,))
+        if c.after is not None:
+            columns = list(c.after)
+            conn.execute(f"INSERT INTO {c.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", [c.after[column] for column in columns])
+
+def undo(conn: sqlite3.Connection) -> Entry | None:
+    """
+    Reverts the latest operation that is not undone yet. Returns the entry it reverted.
+    """
+    state = replay(conn)
+    if not state.done:
+        return None
+    target = entries(conn, after=state.done[-1] - 1, limit=1)[0]
+    changes = [c.inverse() for c in reversed(target.changes)]
+    write_changes(conn, changes)
+    record(conn, 'undo', changes, ref=target.seq)
+    conn.commit()
+    return target
+
+def redo(conn: sqlite3.Connection) -> Entry | None:
+    """
+    Applies the most recently undone operation again. Returns the entry it re-applied.
+    """
+    state = replay(conn)
+    if not state.undone:
+        return None
+    target = entries(conn, after=state.undone[-1] - 1, limit=1)[0]
+    write_changes(conn, target.changes)
+    record(conn, 'redo', target.changes, ref=target.seq)
+    conn.commit()
+    return target
+
+def verify(conn: sqlite3.Connection) -> list[str]:
+    """
+    Rows whose replayed state differs from the table, as 'TABLE #ID' strings.
+    """
+    state = replay(conn, rows=True)
+    differences = []
+    for table in TABLES:
+        replayed = state.rows[table]
+        current = {values['ID']: values for values in (dict(zip(_columns(conn, table), r)) for r in conn.execute(f"SELECT * FROM {table}"))}
+        for row_id in sorted(replayed.keys() | current.keys()):
+            if replayed.get(row_id) != current.get(row_id):
+                differences.append(f"{table} #{row_id}")
+    return differences
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """
+    Rewrites the journaled tables from the latest snapshot and the journal tail.
+    Returns the number of rows written.
+    """
+    state = replay(conn, rows=True)
+    written = 0
+    for table in TABLES:
+        columns = _columns(conn, table)
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                         [[values.get(column) for column in columns] for values in state.rows[table].values()])
+        written += len(state.rows[table])
+    conn.commit()
+    return written
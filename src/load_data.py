@@ -1,6 +1,8 @@
 import pandas as pd
 from openpyxl import load_workbook
-from stocks_reader import read_and_print_rows
+import journal
+import profiler
+from stocks_reader import import_rows, read_and_print_rows
 from utils import get_db_path, get_exec_path
 from settings import Settings
 
@@ -77,26 +79,34 @@ def scan_for_markers(df, settings=Settings()):
         print("Found the following markers:")
         for marker, row_num in sections.items():
             print(f"Marker: '{marker}' at row {row_num}")
-        if '#FDB' in sections and '#FDE' in sections:
-            print("Funding deposit marker found. loading fund data...")
-            row_indices = list(range(sections['#FDB'] + 1, sections['#FDE']))
-            print("Loading fund data rows:", row_indices)
-            read_and_print_rows(df, 'deposit', row_indices, True, settings)
-        if '#FWB' in sections and '#FWE' in sections:
-            print("Funding withdraw marker found. loading fund data...")
-            row_indices = list(range(sections['#FWB'] + 1, sections['#FWE']))
-            print("Loading fund data rows:", row_indices)
-            read_and_print_rows(df, 'withdraw', row_indices, True, settings)
-        if '#TBB' in sections and '#TBE' in sections:
-            print("Trade buy marker found. loading trade data...")
-            row_indices = list(range(sections['#TBB'] + 1, sections['#TBE']))
-            print("Loading trade buy data rows:", row_indices)
-            read_and_print_rows(df, 'buy', row_indices, True, settings)
-        if '#TSB' in sections and '#TSE' in sections:
-            print("Trade sell marker found. loading trade data...")
-            row_indices = list(range(sections['#TSB'] + 1, sections['#TSE']))
-            print("Loading trade sell data rows:", row_indices)
-            read_and_print_rows(df, 'sell', row_indices, True, settings)
+        # All sections in one transaction, as one journal entry
+        conn = profiler.connect(get_db_path(settings.default_account))
+        try:
+            with conn:
+                changes = []
+                if '#FDB' in sections and '#FDE' in sections:
+                    print("Funding deposit marker found. loading fund data...")
+                    row_indices = list(range(sections['#FDB'] + 1, sections['#FDE']))
+                    print("Loading fund data rows:", row_indices)
+                    changes += import_rows(conn, df, 'deposit', row_indices, True)
+                if '#FWB' in sections and '#FWE' in sections:
+                    print("Funding withdraw marker found. loading fund data...")
+                    row_indices = list(range(sections['#FWB'] + 1, sections['#FWE']))
+                    print("Loading fund data rows:", row_indices)
+                    changes += import_rows(conn, df, 'withdraw', row_indices, True)
+                if '#TBB' in sections and '#TBE' in sections:
+                    print("Trade buy marker found. loading trade data...")
+                    row_indices = list(range(sections['#TBB'] + 1, sections['#TBE']))
+                    print("Loading trade buy data rows:", row_indices)
+                    changes += import_rows(conn, df, 'buy', row_indices, True)
+                if '#TSB' in sections and '#TSE' in sections:
+                    print("Trade sell marker found. loading trade data...")
+                    row_indices = list(range(sections['#TSB'] + 1, sections['#TSE']))
+                    print("Loading trade sell data rows:", row_indices)
+                    changes += import_rows(conn, df, 'sell', row_indices, True)
+                journal.record(conn, 'import', changes)
+        finally:
+            conn.close()
         
     else:
         print("No markers found in the first column.")            
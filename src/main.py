@@ -1,251 +1,167 @@
-import sqlite3
+import sys
+import multiprocessing
 from datetime import datetime
 from rich.console import Console
-from rich.table import Table
 from filter_trades import filter_menu
 from calculator import calc_menu
-from trade import buy_menu, sell_menu, delete_trade, delete_trade_menu
+from trade import buy_menu, sell_menu, delete_trade_menu
+from batch_entry import batch_menu
 from planner import plan_menu
+from simulate import simulate_menu
 from menu import main_menu
-from utils import get_db_path, get_exec_path
-import migrate
+from utils import get_exec_path
 from settings import load_settings
+from session import sessions
+from dashboard import ALERTS_SHOWN, get_ticker_data, open_positions_table, holdings_table, totals_table, alerts_table, jump_to_lot
+from paging import prompt_sort, parse_jump
+from valuation import LotBook
+import alerts
+import profiler
+import replica
+import serve
+import ticks
 import yfinance as yf   
 
 def main():
     
+    argv = replica.configure(profiler.configure(sys.argv[1:]))
     console = Console()    
     
     try:
         
         settings_path = get_exec_path( 'settings.json' )    
         
-        selected_price = None     
-        
-        current_prices = {}        
-        
         settings = load_settings(settings_path)
-            
-        selected_ticker = settings.get_account().selected_ticker
-            
-        migrate.check_and_migrate( settings )    
+
+        if argv[:1] == ['serve']:
+            serve.main(argv[1:], settings)
+            return
         
         while True:    
         
-            # Connect to database
-            conn = sqlite3.connect(get_db_path( settings.default_account ))
-            cursor = conn.cursor()
-
-            # Total Funds USD
-            cursor.execute("SELECT COALESCE(SUM(CASE WHEN opr='deposit' THEN amount_USD ELSE -amount_USD END), 0) FROM FUNDS")
-            total_funds = cursor.fetchone()[0]
-            
-            # Total Funds SAR
-            cursor.execute("SELECT COALESCE(SUM(CASE WHEN opr='deposit' THEN amount_SAR ELSE -amount_SAR END), 0) FROM FUNDS")
-            total_funds_sar = cursor.fetchone()[0]
-
-            # Total Net Profit (realized amount)
-            cursor.execute("SELECT COALESCE(SUM(profit_loss), 0) FROM TRADES")
-            all_net_profit = cursor.fetchone()[0]                
-            
-            # Total Cash = Total buy cost value - Total sell cost value
-            cursor.execute("SELECT COALESCE(SUM(CASE WHEN opr='buy' THEN cost_value ELSE -cost_value END), 0) FROM TRADES")
-            total_cost = cursor.fetchone()[0]
-            total_cash = total_funds - total_cost        
-            
-            # Total Fees, VAT
-            cursor.execute("SELECT SUM(fees), SUM(vat) FROM TRADES")
-            fees_vat = cursor.fetchone()
-            total_fees = fees_vat[0] if fees_vat[0] else 0
-            total_vat = fees_vat[1] if fees_vat[1] else 0
-            
-            # Total Trades buy count
-            cursor.execute("SELECT COUNT(*) FROM TRADES WHERE opr='buy'")
-            trade_buy_counts = cursor.fetchall()
-            total_buy_trades = trade_buy_counts[0][0] if trade_buy_counts else 0
-            
-            # Total Trades sell count
-            cursor.execute("SELECT COUNT(*) FROM TRADES WHERE opr='sell'")
-            trade_sell_counts = cursor.fetchall()
-            total_sell_trades = trade_sell_counts[0][0] if trade_sell_counts else 0
-
-            # Ticker data
-            cursor.execute("""
-            SELECT symbol,
-            SUM(CASE WHEN opr='buy' THEN filled_qty ELSE -filled_qty END) as net_shares,
-            SUM(CASE WHEN opr='buy' THEN cost_value ELSE -cost_value END) as total_cost,
-            COALESCE(SUM(profit_loss), 0) as profit,
-            (SELECT price FROM TRADES t2 WHERE t2.symbol = t.symbol AND opr = 'buy' ORDER BY price DESC LIMIT 1) as last_price
-            FROM TRADES t
-            GROUP BY symbol
-            HAVING net_shares != 0
-            """)
-            tickers = cursor.fetchall()
+            # Switching accounts swaps in that account's warm session
+            with profiler.span("snapshot"):
+                session = sessions.get( settings )
+                snapshot = session.refresh( settings.get_account().exchange_rate )
+            current_prices = session.current_prices
+            selected_ticker = session.selected_ticker
+            selected_price = session.selected_price
+
+            total_cash = snapshot.total_cash
+            trades = snapshot.trades
+            symbols = snapshot.symbols
 
             # Initialize current prices with last price
-            if not current_prices or selected_ticker not in current_prices:
-                current_prices = {row[0]: row[4] for row in tickers}        
+            for holding in snapshot.tickers:
+                current_prices.setdefault(holding.symbol, holding.price)
             if selected_price:
                 try:
                     current_prices[selected_ticker] = float(selected_price)
                 except ValueError:
                     console.print(f"[red]Invalid price input for {selected_ticker}. Using last price from database.[/red]")
 
-            # Get open positions for all tickers
-            symbols = [row[0] for row in tickers]
-            trades = []
-            if symbols:
-                placeholders = ','.join('?' * len(symbols))
-                cursor.execute(f"SELECT ID, trade_date, symbol, opr, filled_qty, price, fees, vat, cost_value, profit_loss FROM TRADES WHERE symbol IN ({placeholders}) AND is_position_open = 1 ORDER BY price", symbols)
-                trades = cursor.fetchall()
-
-            conn.close()
-
             # Get ticker data with current prices
-            ticker_data = []
-            for row in tickers:
-                symbol, ticker_net_shares, ticker_total_cost, ticker_profit, _ = row
-                ticker_current_price = current_prices.get(symbol, 0)
-                ticker_data.append((symbol, ticker_net_shares, ticker_total_cost, ticker_profit, ticker_current_price))
-
-            # Calculations
-            total_market_value = sum(row[1] * row[4] for row in ticker_data)
-            total_unrealized_pl = total_market_value - total_cost
-            total_pl = all_net_profit + total_unrealized_pl
+            ticker_data = get_ticker_data(snapshot, current_prices)
 
             # Clear console and display panels
             console.clear()
 
-            # Trades table
-            if trades:
-                trades_table = Table(title="Open Positions")
-                trades_table.add_column("#", style="yellow")            
-                trades_table.add_column("Date", style="dim")
-                trades_table.add_column("Ticker", style="cyan")
-                trades_table.add_column("Operation", justify="left")
-                trades_table.add_column("Qty", justify="right")
-                trades_table.add_column("Price", justify="right", style="yellow")
-                trades_table.add_column("Cost Value", justify="right")
-                trades_table.add_column("Cost Price", justify="right", style="yellow")
-                trades_table.add_column("Profit/Loss", justify="right")
-                trades_table.add_column(f" {settings.get_account().exchange_rate_label} ", justify="right")
-
-                counter = 1
-                total_qty = 0
-                total_cost_value = 0
-                sub_pl = 0
-                for trade in trades:
-                    ID, trade_date, symbol, opr, filled_qty, price, fees, vat, cost_value, profit_loss = trade
-                    current_price = current_prices.get(symbol, price)
-                    if opr.lower() == 'buy':
-                        pl = ( (current_price - price) * filled_qty ) - settings.get_account().fees_usd * 2
-                    else:
-                        pl = profit_loss or 0
-                    pl_text = f"[red]${pl:,.2f}[/red]" if pl < 0 else f"${pl:,.2f}"
-                    pl_text_percent = (pl / cost_value) if cost_value != 0 else 0
-                    pl_text_sar = f"[red]{pl * settings.get_account().exchange_rate:,.2f}[/red]" if pl < 0 else f"{pl * settings.get_account().exchange_rate :,.2f}"
-                    opr_text = f"[green]{opr}[/green]" if opr.lower() == 'buy' else f"[red]{opr}[/red]"
-                    trades_table.add_row(str(counter), str(trade_date), symbol, f"{opr_text} #{str(ID)}", str(filled_qty), f"${price:,.2f}", f"${cost_value:,.2f}", f"{((filled_qty * price) + settings.get_account().fees_usd) / filled_qty :,.2f}", F"{pl_text} [dim]{pl_text_percent:.2%}[/dim]", pl_text_sar)
-                    counter += 1
-                    total_qty += filled_qty
-                    total_cost_value += cost_value
-                    sub_pl += pl
-
-                # Add totals row
-                trades_table.add_row("---", "---", "---", "---", "---", "---", "---", "---", "---")
-                pl_text_total = f"[red]${sub_pl:,.2f}[/red]" if sub_pl < 0 else f"${sub_pl:,.2f}"
-                pl_text_percent_total = (sub_pl / total_cost_value) if total_cost_value != 0 else 0
-                pl_text_sar_total = f"[red]{sub_pl * settings.get_account().exchange_rate:,.2f}[/red]" if sub_pl < 0 else f"{sub_pl * settings.get_account().exchange_rate:,.2f}"
-                trades_table.add_row("Total", "", "", "", str(total_qty), f"{total_cost_value / total_qty :,.2f}", f"${total_cost_value:,.2f}", "", f"{pl_text_total} [dim]{pl_text_percent_total:.2%}[/dim]", pl_text_sar_total)
-
-                console.print(trades_table)
-                
-            if total_market_value == 0:
-                cash_ratio = 0
-            else:
-                cash_ratio = total_cash / total_market_value
-                
-
-            # Ticker summary table
-            table = Table(title="Summary of Holdings (Version 0.1.1)")
-            table.add_column("Ticker", style="cyan")
-            table.add_column("Shares", justify="right")
-            table.add_column("Total Cost", justify="right")
-            table.add_column("Market Value", justify="right", style="yellow")
-            table.add_column("Unrealized P/L", justify="right")
-            table.add_column("Realized P/L", justify="right")
-            table.add_column("%, avg", justify="right")
-
-            for row in ticker_data:
-                symbol, net_shares, total_cost, profit, current_price = row
-                market_value = net_shares * current_price
-                unrealized_pl = market_value - total_cost
-                unrealized_text = f"[red]${unrealized_pl:,.2f}[/red]" if unrealized_pl < 0 else f"${unrealized_pl:,.2f}"
-                unrealized_text_sar = f"[red]{settings.get_account().exchange_rate_label} {unrealized_pl * settings.get_account().exchange_rate:,.2f}[/red]" if unrealized_pl < 0 else f"{settings.get_account().exchange_rate_label} {unrealized_pl * settings.get_account().exchange_rate:,.2f}"            
-                profit_text = f"[red]${profit:,.2f}[/red]" if profit < 0 else f"${profit:,.2f}"
-                profit_text_sar = f"[red]{settings.get_account().exchange_rate_label} {profit * settings.get_account().exchange_rate:,.2f}[/red]" if profit < 0 else f"{settings.get_account().exchange_rate_label} {profit * settings.get_account().exchange_rate:,.2f}"
-                table.add_row(symbol, str(net_shares), f"${total_cost:,.2f}", f"${market_value:,.2f}", unrealized_text, profit_text, f"{unrealized_pl/total_funds:.2%}")
-                table.add_row(f"[magenta]{current_price}[/magenta]", "", f"{settings.get_account().exchange_rate_label} {total_cost * settings.get_account().exchange_rate:,.2f}", f"{settings.get_account().exchange_rate_label} {market_value * settings.get_account().exchange_rate:,.2f}", unrealized_text_sar, profit_text_sar, f"{total_cost/net_shares:.2f}")
-            console.print(table)
-                
-            # Account Totals table
-            totals_table = Table(title=f"Account Totals ({settings.default_account})")
-            totals_table.add_column("Funds", justify="right")
-            totals_table.add_column(f"Cash [dim]{cash_ratio:.2%}[/dim]", justify="right", style="magenta")
-            totals_table.add_column("Fees", justify="right")
-            totals_table.add_column("VAT", justify="right")
-            totals_table.add_column("Net Worth", justify="right", style="green")
-            totals_table.add_column("Trades", justify="left")
-            
-            totals_table.add_row(f"${total_funds:,.2f}", f"${total_cash:,.2f}", f"${total_fees:,.2f}", f"${total_vat:,.2f}", f"${total_market_value + total_cash:,.2f}", f"{total_buy_trades} buy")
-            totals_table.add_row(f"{settings.get_account().exchange_rate_label} {total_funds_sar:,.2f}", f"{settings.get_account().exchange_rate_label} {total_cash * settings.get_account().exchange_rate:,.2f}", f"{settings.get_account().exchange_rate_label} {total_fees * settings.get_account().exchange_rate:,.2f}", f"{settings.get_account().exchange_rate_label} {total_vat * settings.get_account().exchange_rate:,.2f}", f"{settings.get_account().exchange_rate_label} {(total_market_value + total_cash) * settings.get_account().exchange_rate:,.2f}", f"{total_sell_trades} sell")
-            
-            console.print(totals_table)
+            with profiler.span("render.open_positions", "render"):
+                trades_table = open_positions_table(snapshot, current_prices, settings, session.positions_view)
+                if trades_table:
+                    console.print(trades_table)
+            with profiler.span("render.holdings", "render"):
+                console.print(holdings_table(snapshot, ticker_data, settings))
+            with profiler.span("render.totals", "render"):
+                console.print(totals_table(snapshot, ticker_data, settings))
+            fired_table = alerts_table(alerts.fired(session.conn, ALERTS_SHOWN), alerts.fired_count(session.conn))
+            if fired_table:
+                console.print(fired_table)
+
+            timing_table = profiler.timing_table()
+            if timing_table:
+                console.print(timing_table)
+                profiler.new_frame()
                     
             # ===============================================================================================
             # Prompt for input
             # ===============================================================================================
             
-            console.print("[blue]Options:[/blue] M[dim]enu[/dim], B[dim]uy[/dim], S[dim]ell[/dim], D[dim]elete[/dim], T[dim]icker[/dim], F[dim]ilter[/dim], P[dim]lan[/dim], U[dim]pdate[/dim], C[dim]alculator[/dim] or Q[dim]uit[/dim]")
+            console.print("[blue]Options:[/blue] M[dim]enu[/dim], B[dim]uy[/dim], S[dim]ell[/dim], E [dim]batch entry[/dim], D[dim]elete[/dim], T[dim]icker[/dim], F[dim]ilter[/dim], P[dim]lan[/dim], W[dim]hat-if[/dim], U[dim]pdate[/dim], C[dim]alculator[/dim], > [dim]next page[/dim], < [dim]previous page[/dim], ^ [dim]sort[/dim], #[dim]ID jump[/dim] or Q[dim]uit[/dim]")
             user_input = input(f"Enter price for {selected_ticker} or options: ").strip()
             if user_input.lower() == 'q':
                 break
+            elif user_input in ('>', '<'):
+                # Page through open positions
+                view = session.positions_view
+                if not (view.next(len(trades)) if user_input == '>' else view.previous()):
+                    console.print("[yellow]No more pages.[/yellow]")
+                    input("Press Enter to continue...")
+            elif user_input == '^':
+                sort = prompt_sort(session.positions_view.sort, LotBook.SORT_COLUMNS, console)
+                if sort:
+                    session.positions_view.resort(sort)
+            elif user_input.startswith('#'):
+                # Jump to the page holding an open lot
+                trade_id = parse_jump(user_input)
+                if trade_id is None or not jump_to_lot(snapshot, current_prices, settings, session.positions_view, trade_id):
+                    console.print(f"[yellow]Open position #{trade_id} not found.[/yellow]")
+                    input("Press Enter to continue...")
             elif user_input.lower() == 'u':
                 # Update current price for all tickers from yfinance lib
                 console.print("[blue]Updating prices from yfinance...[/blue]")
+                fetched = {}
                 for symbol in symbols:
                     try:
-                        stock = yf.Ticker(symbol.replace("$", ""))
-                        current_prices[symbol] = stock.info['regularMarketPrice']
+                        with profiler.span("quote", "quote", symbol=symbol):
+                            stock = yf.Ticker(symbol.replace("$", ""))
+                            fired = session.quote(symbol, stock.info['regularMarketPrice'])
+                        fetched[symbol] = stock.info['regularMarketPrice']
                         console.print(f"[green]Updated {symbol}: ${stock.info['regularMarketPrice']:.2f}[/green]")
+                        for alert in fired:
+                            console.print(f"[yellow]Alert: {alert.describe()}[/yellow]")
                     except Exception as e:
                         console.print(f"[red]Failed to fetch price for {symbol}: {e}[/red]")
+                try:
+                    # Kept in the account's quote journal, shown as today's sparklines
+                    ticks.append(session.conn, session.name, fetched)
+                    for symbol, (_, prices) in ticks.today_series(session.conn, session.name, fetched).items():
+                        console.print(f"{symbol:<8} {ticks.sparkline(prices)} [dim]{len(prices)} quotes today, ${prices.min():,.2f} - ${prices.max():,.2f}[/dim]")
+                except Exception as e:
+                    console.print(f"[red]Quote journal not written: {e}[/red]")
                 if selected_ticker in current_prices:
-                    selected_price = current_prices[selected_ticker]
+                    session.selected_price = current_prices[selected_ticker]
                 console.print("[green]Price update completed.[/green]")
                 input("Press Enter to continue...")
             elif user_input.lower() == 'p':
                 # Planning menu
                 plan_menu(trades, selected_ticker, current_prices, settings)
+            elif user_input.lower() == 'w':
+                # Hypothetical trades on a copy of the snapshot
+                simulate_menu(snapshot, current_prices, settings)
             elif user_input.lower() == 'b':
                 # Buy trade
                 buy_menu(selected_ticker, current_prices, total_cash, settings=settings)
             elif user_input.lower() == 's':
                 # Sell trade
                 sell_menu(ticker_data, trades, selected_ticker, current_prices, settings=settings)
+            elif user_input.lower() == 'e':
+                # Many trades in one transaction
+                batch_menu(ticker_data, trades, total_cash, settings=settings)
             elif user_input.lower() == 'd':
                 # Delete trade
                 delete_trade_menu(settings=settings)
             elif user_input.lower() == 't':
                 # Change ticker
-                selected_ticker = input("Enter new ticker symbol: ").strip().upper()
+                session.selected_ticker = input("Enter new ticker symbol: ").strip().upper()
+                session.selected_price = None
             elif user_input.lower() == 'f':
                 # Filter trades menu
                 filter_menu(settings=settings, current_prices=current_prices)
                 
             elif user_input.lower() == 'm':
                 # Main menu
-                main_menu(settings, settings_path)
+                main_menu(settings, settings_path, current_prices)
             
             elif user_input.lower() == 'c':
                 calc_menu(settings=settings)
@@ -253,11 +169,17 @@ def main():
             else:
                 # Assume price update
                 try:
-                    selected_price = float(user_input)
+                    # A what-if price for the display only, alerts fire on fetched quotes
+                    session.selected_price = float(user_input)
                 except ValueError:
                     pass
     except KeyboardInterrupt:
         console.print("\n[red]Exiting application.[/red]")
+    finally:
+        sessions.close_all()
+        profiler.close()
 
 if __name__ == "__main__":
+    # The backtest replays symbols in worker processes, which a frozen build must hand off here
+    multiprocessing.freeze_support()
     main()
@@ -1,29 +1,329 @@
-from utils import get_db_path
-from settings import Settings, load_settings
+from utils import get_db_path, parse_date_key
+from funds_query import FundsFilter, FundsPager, aggregate as aggregate_funds
+from settings import Settings, Account
 import load_data
+import alerts
+import archive
+import fx_rates
+import journal
 import migrate
+import query_cache
+import rollup
+import sync
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 from datetime import datetime
 from trade import deposit_funds, withdraw_funds, update_trade
+from consolidated import consolidated_menu
+from returns import returns_menu
+from backtest import backtest_menu
+from session import sessions
 
 import sqlite3
+import profiler
+import repository
+
+FUNDS_PAGE_SIZE = 50
+JOURNAL_ROWS = 20
 
 def get_funds(settings: Settings=Settings()):
     # Connect to database
-    conn = sqlite3.connect(get_db_path( settings.default_account ))
-    cursor = conn.cursor()
-    cursor.execute("SELECT ID, opr, fund_date, source, amount_SAR, amount_USD, rate_exchange FROM FUNDS ORDER BY ID")
-    funds = cursor.fetchall()
+    conn = profiler.connect(get_db_path( settings.default_account ))
+    funds = list(repository.iter_funds(conn))
     conn.close()
     return funds
 
-def main_menu(settings: Settings, settings_path: str):
+def print_funds_page(pager: FundsPager, totals: dict, settings: Settings, console: Console):
+    account = settings.get_account()
+    total_pages = max(1, -(-totals['count'] // pager.page_size))
+    funds_table = Table(title=f"Funds History ({pager.funds_filter.describe()}) Page {pager.page} of {total_pages}")
+    funds_table.add_column("#", style="yellow")
+    funds_table.add_column("Operation", justify="center")
+    funds_table.add_column("Date", style="dim")
+    funds_table.add_column("Source", style="cyan")
+    funds_table.add_column(f"Amount {account.exchange_rate_label}", justify="right")
+    funds_table.add_column("Amount USD", justify="right")
+    funds_table.add_column("Exchange Rate", justify="right")
+
+    for fund in pager.rows:
+        opr_text = f"[green]{fund.opr} [/green]" if fund.opr.lower() == 'deposit' else f"[red]{fund.opr}[/red]"
+        funds_table.add_row(str(fund.ID), f"{opr_text}", str(fund.fund_date), fund.source, f"{fund.amount_SAR:,.2f}", f"${fund.amount_USD:,.2f}", f"{fund.rate_exchange:.4f}")
+
+    console.print(funds_table)
+    
+    # Print panel for total deposits and withdrawals
+    deposits_panel = Panel(f"""
+        [green]Total Deposits:[/green] {account.exchange_rate_label} {totals['deposit_sar']:,.2f} | ${totals['deposit_usd']:,.2f}   
+        [red]Total Withdrawals:[/red]  {account.exchange_rate_label} {totals['withdraw_sar']:,.2f} | ${totals['withdraw_usd']:,.2f} 
+        Total {account.exchange_rate_label} = {totals['deposit_sar'] - totals['withdraw_sar']:,.2f}   
+        Total USD = {totals['deposit_usd'] - totals['withdraw_usd']:,.2f}   
+                    """, title="Funds Summary", expand=False)
+    console.print(deposits_panel)
+
+def funds_menu(settings: Settings):
+    console = Console()
+    # The shared read connection, served from the in-memory replica when it is enabled
+    cursor = query_cache.get_connection(get_db_path( settings.default_account )).cursor()
+    funds_filter = FundsFilter()
+    pager = FundsPager(funds_filter, FUNDS_PAGE_SIZE)
+    pager.load(cursor)
+    if not pager.rows:
+        console.print("No funds records found.")             
+        input("Press Enter to continue...")
+        return
+    totals = aggregate_funds(cursor, funds_filter)
+    while True:
+        console.clear()
+        print_funds_page(pager, totals, settings, console)
+        
+        console.print("[blue]Filter Funds by:[/blue] D[dim]ate,[/dim] R[dim]ange of dates,[/dim] S[dim]ource[/dim], X [dim]reset filter[/dim], > [dim]next page[/dim], < [dim]previous page or[/dim] E[dim]nter[/dim]")            
+        filter_choice = input("Enter choice: ").strip().lower()
+        if filter_choice == '>':
+            pager.next(cursor)
+            continue
+        elif filter_choice == '<':
+            pager.previous(cursor)
+            continue
+        try:
+            if filter_choice == 'd':
+                month_year_str = input("Enter month and year to filter (MM/YYYY) or (YYYY): ").strip()
+                funds_filter = funds_filter.update(date_from=parse_date_key(month_year_str), date_to=parse_date_key(month_year_str, end=True))
+            elif filter_choice == 'r':
+                date_from = input("Enter start date (DD/MM/YYYY, MM/YYYY or YYYY, Enter for none): ").strip()
+                date_to = input("Enter end date (DD/MM/YYYY, MM/YYYY or YYYY, Enter for none): ").strip()
+                funds_filter = funds_filter.update(date_from=parse_date_key(date_from) if date_from else None, date_to=parse_date_key(date_to, end=True) if date_to else None)
+            elif filter_choice == 's':
+                source_str = input("Enter source prefix to filter (*text to match anywhere): ").strip()
+                funds_filter = funds_filter.update(source=source_str or None)
+            elif filter_choice == 'x':
+                funds_filter = FundsFilter()
+            else:
+                break  # Exit filtering loop
+        except ValueError as e:
+            console.print(f"[red]Invalid date: {e}[/red]")
+            input("Press Enter to continue...")
+            continue
+        pager = FundsPager(funds_filter, FUNDS_PAGE_SIZE)
+        pager.load(cursor)
+        totals = aggregate_funds(cursor, funds_filter)
+
+def fx_menu(settings: Settings):
+    console = Console()
+    conn = profiler.connect(get_db_path( settings.default_account ))
+    try:
+        fx = fx_rates.load_fx(conn, settings.get_account().exchange_rate)
+        console.print(f"{len(fx)} {settings.get_account().exchange_rate_label} rates stored, latest 1 USD = {fx.latest()} {settings.get_account().exchange_rate_label}")
+        console.print("[blue]Exchange Rates:[/blue] L[dim]oad CSV (date,rate)[/dim], F[dim]ill from funds[/dim], A[dim]dd rate[/dim] or Enter [dim]to go back[/dim]")
+        fx_choice = input("Enter choice: ").strip().lower()
+        if fx_choice == 'l':
+            csv_path = input("Enter CSV file path: ").strip()
+            count = fx_rates.import_csv(conn, csv_path)
+            console.print(f"[green]{count} rates loaded.[/green]")
+        elif fx_choice == 'f':
+            count = fx_rates.seed_from_funds(conn)
+            console.print(f"[green]{count} rates added from funds.[/green]")
+        elif fx_choice == 'a':
+            date_str = input("Enter rate date (DD/MM/YYYY): ").strip() or datetime.today().strftime("%d/%m/%Y")
+            rate = float(input(f"Enter USD to {settings.get_account().exchange_rate_label} rate: ").strip())
+            fx_rates.add_rate(conn, date_str, rate)
+            console.print("[green]Rate saved.[/green]")
+        else:
+            return
+    except (OSError, ValueError, IndexError, sqlite3.Error) as e:
+        console.print(f"[red]Error: {e}[/red]")
+    finally:
+        conn.close()
+    input("Press Enter to continue...")
+
+def journal_menu(settings: Settings):
+    console = Console()
+    conn = profiler.connect(get_db_path( settings.default_account ))
+    try:
+        state = journal.replay(conn)
+        table = Table(title=f"Journal ({settings.default_account})")
+        table.add_column("Seq", style="yellow", justify="right")
+        table.add_column("Time", style="dim")
+        table.add_column("Action", style="cyan")
+        table.add_column("Changes")
+        table.add_column("State", justify="center")
+        for entry in reversed(journal.entries(conn, limit=JOURNAL_ROWS, newest_first=True)):
+            action = f"{entry.action} #{entry.ref}" if entry.ref else entry.action
+            status = "[dim]undone[/dim]" if entry.seq in state.undone else ""
+            table.add_row(str(entry.seq), entry.created, action, entry.describe(), status)
+        console.print(table)
+        console.print("[blue]Journal:[/blue] U[dim]ndo[/dim], R[dim]edo[/dim], S[dim]napshot now[/dim], V[dim]erify[/dim], B [dim]rebuild tables from journal[/dim] or Enter [dim]to go back[/dim]")
+        journal_choice = input("Enter choice: ").strip().lower()
+        if journal_choice == 'u':
+            entry = journal.undo(conn)
+            console.print(f"[green]Undid {entry.action} #{entry.seq}: {entry.describe()}[/green]" if entry else "[yellow]Nothing to undo.[/yellow]")
+        elif journal_choice == 'r':
+            entry = journal.redo(conn)
+            console.print(f"[green]Redid {entry.action} #{entry.seq}: {entry.describe()}[/green]" if entry else "[yellow]Nothing to redo.[/yellow]")
+        elif journal_choice == 's':
+            seq = journal.snapshot(conn)
+            conn.commit()
+            console.print(f"[green]Snapshot taken at journal entry {seq}.[/green]")
+        elif journal_choice == 'v':
+            differences = journal.verify(conn)
+            if differences:
+                console.print(f"[red]{len(differences)} rows differ from the journal: {', '.join(differences[:20])}[/red]")
+            else:
+                console.print("[green]Tables match the journal.[/green]")
+        elif journal_choice == 'b':
+            if input("Rewrite TRADES and FUNDS from the latest snapshot and journal? (y/n): ").strip().lower() == 'y':
+                console.print(f"[green]{journal.rebuild(conn)} rows rebuilt.[/green]")
+        else:
+            return
+    except (journal.JournalError, sqlite3.Error) as e:
+        conn.rollback()
+        console.print(f"[red]Error: {e}[/red]")
+    finally:
+        conn.close()
+    input("Press Enter to continue...")
+
+def rollup_menu(settings: Settings):
+    console = Console()
+    conn = profiler.connect(get_db_path( settings.default_account ))
+    try:
+        differences = rollup.check(conn)
+        if not differences:
+            console.print("[green]Rollups match TRADES and TRADES_ARCHIVE.[/green]")
+        else:
+            console.print(f"[red]{len(differences)} rollup values differ from the trades:[/red]")
+            for difference in differences[:20]:
+                console.print(f"[red]  {difference}[/red]")
+        if input("Rebuild rollups from the trades? (y/n): ").strip().lower() == 'y':
+            rows = rollup.rebuild(conn)
+            conn.commit()
+            console.print(f"[green]{rows} rollup rows rebuilt.[/green]")
+    except sqlite3.Error as e:
+        console.print(f"[red]Error: {e}[/red]")
+    finally:
+        conn.close()
+    input("Press Enter to continue...")
+
+def archive_menu(settings: Settings):
+    console = Console()
+    conn = profiler.connect(get_db_path( settings.default_account ))
+    try:
+        live, archived = archive.counts(conn)
+        until = archive.archived_until(conn)
+        console.print(f"[blue]Archive:[/blue] {live} trades in TRADES, {archived} archived" + (f" up to {until[6:8]}/{until[4:6]}/{until[:4]}" if until else ""))
+        date_str = input("Archive closed trades dated before (DD/MM/YYYY, MM/YYYY or YYYY, Enter to go back): ").strip()
+        if not date_str:
+            return
+        before = parse_date_key(date_str)
+        count, realized_pl = archive.preview(conn, before)
+        if not count:
+            console.print("[yellow]No closed trades before that date.[/yellow]")
+        elif input(f"Move {count} closed trades (realized P/L ${realized_pl:,.2f}) to the archive? (y/n): ").strip().lower() == 'y':
+            moved = archive.archive_closed(conn, before)
+            conn.commit()
+            console.print(f"[green]{moved} trades archived, totals are unchanged. Filters reach them with H or a date range.[/green]")
+    except ValueError as e:
+        console.print(f"[red]Invalid input: {e}[/red]")
+    except sqlite3.Error as e:
+        conn.rollback()
+        console.print(f"[red]Error: {e}[/red]")
+    finally:
+        conn.close()
+    input("Press Enter to continue...")
+
+def alerts_menu(settings: Settings, current_prices: dict):
+    console = Console()
+    conn = profiler.connect(get_db_path( settings.default_account ))
+    try:
+        table = Table(title=f"Price Alerts ({settings.default_account})")
+        table.add_column("#", style="yellow")
+        table.add_column("Ticker", style="cyan")
+        table.add_column("Level")
+        table.add_column("Price", justify="right", style="yellow")
+        table.add_column("When", justify="left")
+        table.add_column("Status")
+        for alert in alerts.pending(conn) + alerts.fired(conn):
+            status = f"[magenta]fired {alert.fired} at ${alert.fired_price:,.2f}[/magenta]" if alert.fired else "[dim]pending[/dim]"
+            table.add_row(str(alert.ID), alert.symbol, alert.label.replace('_', ' '), f"${alert.price:,.2f}", "rises to" if alert.above else "falls to", status)
+        console.print(table)
+        console.print("[blue]Alerts:[/blue] A[dim]dd alert[/dim], D[dim]elete alert[/dim], C [dim]dismiss fired alerts[/dim] or Enter [dim]to go back[/dim]")
+        alert_choice = input("Enter choice: ").strip().lower()
+        if alert_choice == 'a':
+            symbol = input("Enter ticker symbol: ").strip().upper()
+            price = float(input("Enter alert price: ").strip())
+            label = input("Enter label (e.g. key support 1): ").strip().replace(' ', '_') or 'manual'
+            alerts.add_alert(conn, symbol, label, price, current_prices.get(symbol))
+            conn.commit()
+            console.print("[green]Alert saved.[/green]")
+        elif alert_choice == 'd':
+            alert_id = int(input("Enter alert #: ").strip())
+            deleted = alerts.delete(conn, alert_id)
+            conn.commit()
+            console.print("[green]Alert deleted.[/green]" if deleted else f"[yellow]Alert #{alert_id} not found.[/yellow]")
+        elif alert_choice == 'c':
+            count = alerts.dismiss(conn)
+            conn.commit()
+            console.print(f"[green]{count} fired alerts dismissed.[/green]")
+        else:
+            return
+    except ValueError as e:
+        console.print(f"[red]Invalid input: {e}[/red]")
+    except sqlite3.Error as e:
+        conn.rollback()
+        console.print(f"[red]Error: {e}[/red]")
+    finally:
+        conn.close()
+    input("Press Enter to continue...")
+
+def sync_menu(settings: Settings):
+    console = Console()
+    conn = profiler.connect(get_db_path( settings.default_account ))
+    try:
+        table = Table(title=f"Sync peers of {sync.node_name()} ({settings.default_account})")
+        table.add_column("Peer", style="cyan")
+        table.add_column("Our entries it has", justify="right")
+        table.add_column("Its entries we have", justify="right")
+        table.add_column("To export", justify="right", style="yellow")
+        table.add_column("Last sync", style="dim")
+        for peer, acked, imported, pending, synced in sync.peers(conn):
+            table.add_row(peer, str(acked), str(imported), str(pending), synced or "")
+        console.print(table)
+        console.print("[blue]Sync:[/blue] E[dim]xport changes for a machine[/dim], I[dim]mport a changes file[/dim] or Enter [dim]to go back[/dim]")
+        sync_choice = input("Enter choice: ").strip().lower()
+        if sync_choice == 'e':
+            peer = input("Machine to export for (its host name or TRADECLI_NODE): ").strip()
+            if not peer:
+                return
+            default = sync.default_path(settings.default_account, peer)
+            path = input(f"File [{default}]: ").strip() or default
+            count = sync.export_changes(conn, settings.default_account, peer, path)
+            console.print(f"[green]{count} journal entries written to {path}.[/green]")
+        elif sync_choice == 'i':
+            path = input("Changes file to import: ").strip()
+            if not path:
+                return
+            result = sync.import_changes(conn, settings.default_account, sync.read_changeset(path))
+            console.print(f"[green]{result.applied} entries applied, {result.skipped} already here"
+                          + (f", {result.remapped} rows inserted on both machines renumbered" if result.remapped else "") + ".[/green]")
+            if result.conflicts:
+                console.print(f"[red]{len(result.conflicts)} entries skipped, their rows were changed here too:[/red]")
+                for conflict in result.conflicts[:20]:
+                    console.print(f"[red]  {conflict}[/red]")
+        else:
+            return
+    except (OSError, ValueError, KeyError, sync.SyncError) as e:
+        console.print(f"[red]Error: {e}[/red]")
+    except sqlite3.Error as e:
+        conn.rollback()
+        console.print(f"[red]Error: {e}[/red]")
+    finally:
+        conn.close()
+    input("Press Enter to continue...")
+
+def main_menu(settings: Settings, settings_path: str, current_prices: dict = {}):
     console = Console()
     try:
         # Show main menu
-        console.print("[blue]Options:[/blue] A[dim]ccount[/dim], R[dim]eset Data[/dim], L[dim]oad Data[/dim], F[dim]unds[/dim], D[dim]eposit[/dim], W[dim]ithdraw[/dim], P[dim]osition[/dim] or S[dim]ettings[/dim]")
+        console.print("[blue]Options:[/blue] A[dim]ccount[/dim], R[dim]eset Data[/dim], L[dim]oad Data[/dim], F[dim]unds[/dim], D[dim]eposit[/dim], W[dim]ithdraw[/dim], P[dim]osition[/dim], V[dim]iew all accounts[/dim], X [dim]exchange rates[/dim], J[dim]ournal (undo/redo)[/dim], K [dim]check rollups[/dim], H [dim]archive closed trades[/dim], N [dim]price alerts[/dim], I [dim]money-weighted returns (XIRR)[/dim], B[dim]acktest exit rules[/dim], Y [dim]sync with another machine[/dim] or S[dim]ettings[/dim]")
         choicee = input("Enter choice: ").strip().lower()
         if choicee == 'a':
             # Change account
@@ -34,11 +334,12 @@ def main_menu(settings: Settings, settings_path: str):
             acc_choice = input("Enter choice: ").strip().lower()
             if acc_choice == 'n':
                 account_name = input("Enter account name (no spaces or special characters): ").strip()
+                if not settings.has_account(account_name):
+                    settings.accounts.append(Account(name=account_name))
                 settings.default_account = account_name
                 settings.save(settings_path)
+                # The session for the new account creates its database on first use
                 console.print(f"[green]New account '{account_name}' created and set as default.[/green]")
-                settings = load_settings(settings_path)  # Reload settings
-                migrate.check_and_migrate( settings ) 
                 input("Press Enter to continue...")
             else:
                 try:
@@ -46,8 +347,6 @@ def main_menu(settings: Settings, settings_path: str):
                     if 0 <= acc_index < len(settings.accounts):
                         settings.default_account = settings.accounts[acc_index].name
                         settings.save(settings_path)
-                        settings = load_settings(settings_path)  # Reload settings
-                        migrate.check_and_migrate( settings )
                         console.print(f"[green]Switched to account '{settings.default_account}'.[/green]")
                         input("Press Enter to continue...")
                     else:
@@ -57,9 +356,29 @@ def main_menu(settings: Settings, settings_path: str):
                     console.print("[red]Invalid input.[/red]")
                     input("Press Enter to continue...")
                     
+        elif choicee == 'v':
+            # Consolidated totals across all accounts
+            consolidated_menu(settings, current_prices)
+        elif choicee == 'x':
+            fx_menu(settings)
+        elif choicee == 'j':
+            journal_menu(settings)
+        elif choicee == 'k':
+            rollup_menu(settings)
+        elif choicee == 'h':
+            archive_menu(settings)
+        elif choicee == 'y':
+            sync_menu(settings)
+        elif choicee == 'n':
+            alerts_menu(settings, current_prices)
+        elif choicee == 'i':
+            returns_menu(settings, current_prices)
+        elif choicee == 'b':
+            backtest_menu(settings)
         elif choicee == 'r':
             # run schema migration
             try:
+                sessions.close( settings.default_account )
                 migrate.migrate_db( settings.default_account )
                 console.print("[green]Schema migration completed successfully.[/green]")
             except Exception as e:
@@ -71,68 +390,8 @@ def main_menu(settings: Settings, settings_path: str):
             console.print("[green]Funds/trades operation completed.[/green]")
             input("Press Enter to continue...")
         elif choicee == 'f':
-            # List funds
-            funds = get_funds(settings=settings)
-            
-            if funds:
-                while True:
-                    console.clear()
-                    funds_table = Table(title="Funds History")
-                    funds_table.add_column("#", style="yellow")
-                    funds_table.add_column("Operation", justify="center")
-                    funds_table.add_column("Date", style="dim")
-                    funds_table.add_column("Source", style="cyan")
-                    funds_table.add_column(f"Amount {settings.get_account().exchange_rate_label}", justify="right")
-                    funds_table.add_column("Amount USD", justify="right")
-                    funds_table.add_column("Exchange Rate", justify="right")
-
-                    for fund in funds:
-                        ID, opr, fund_date, source, amount_SAR, amount_USD, rate_exchange = fund
-                        opr_text = f"[green]{opr} [/green]" if opr.lower() == 'deposit' else f"[red]{opr}[/red]"
-                        funds_table.add_row(str(ID), f"{opr_text}", str(fund_date), source, f"{amount_SAR:,.2f}", f"${amount_USD:,.2f}", f"{rate_exchange:.4f}")
-
-                    console.print(funds_table)
-                    
-                    # Print panel for total deposits and withdrawals
-                    total_deposits_sar = sum(fund[4] for fund in funds if fund[1].lower() == 'deposit')
-                    total_withdrawals_sar = sum(fund[4] for fund in funds if fund[1].lower() == 'withdraw')
-                    total_deposits_usd = sum(fund[5] for fund in funds if fund[1].lower() == 'deposit')
-                    total_withdrawals_usd = sum(fund[5] for fund in funds if fund[1].lower() == 'withdraw')
-                    deposits_panel = Panel(f"""
-        [green]Total Deposits:[/green] {settings.get_account().exchange_rate_label} {total_deposits_sar:,.2f} | ${total_deposits_usd:,.2f}   
-        [red]Total Withdrawals:[/red]  {settings.get_account().exchange_rate_label} {total_withdrawals_sar:,.2f} | ${total_withdrawals_usd:,.2f} 
-        Total {settings.get_account().exchange_rate_label} = {total_deposits_sar - total_withdrawals_sar:,.2f}   
-        Total USD = {total_deposits_usd - total_withdrawals_usd:,.2f}   
-                    """, title="Funds Summary", expand=False)
-                    console.print(deposits_panel)
-                    
-                    console.print("[blue]Filter Funds by:[/blue] D[dim]ate range,[/dim] S[dim]ource[/dim], R[dim]eset Filter or[/dim] E[dim]nter[/dim]")            
-                    filter_choice = input("Enter choice: ").strip().lower()
-                    if filter_choice == 'd':
-                        try:
-                            month_year_str = input("Enter month and year to filter (MM/YYYY) or (YYYY): ").strip()
-                            if month_year_str and len(month_year_str) == 4:
-                                filtered_funds = [fund for fund in funds if fund[2].endswith(month_year_str)]
-                            else:
-                                month_year = datetime.strptime(month_year_str, "%m/%Y")
-                                month_year_str = month_year.strftime("%m/%Y")
-                                filtered_funds = [fund for fund in funds if fund[2][3:10] == month_year_str]
-                            funds = filtered_funds
-                        except ValueError:
-                            console.print(f"[red]Invalid month/year format.[/red]")
-                            input("Press Enter to continue...")
-                    elif filter_choice == 's':
-                        source_str = input("Enter source to filter: ").strip().lower()
-                        filtered_funds = [fund for fund in funds if source_str in fund[3].lower()]
-                        funds = filtered_funds
-                    elif filter_choice == 'r':
-                        funds = get_funds(settings=settings)
-                    else:
-                        break  # Exit filtering loop
-
-            else:
-                console.print("No funds records found.")             
-                input("Press Enter to continue...")
+            # List funds, filtering and totals run in SQLite and the table is paged
+            funds_menu(settings)
                 
         elif choicee == 'd':
             # deposit fund
@@ -162,28 +421,25 @@ def main_menu(settings: Settings, settings_path: str):
             input("Press Enter to continue...")
         elif choicee == 'p':
             # Connect to database
-            conn = sqlite3.connect(get_db_path( settings.default_account ))
-            cursor = conn.cursor()
+            conn = profiler.connect(get_db_path( settings.default_account ))
             trade_id_input = input("Enter Trade ID to view trade details: ").strip()
             if trade_id_input.isdigit():
                 trade_id = int(trade_id_input)
-                cursor.execute("SELECT ID, trade_date, symbol, opr, filled_qty, price, fees, vat, cost_value, profit_loss, is_position_open FROM TRADES WHERE ID = ?", (trade_id,))
-                trade = cursor.fetchone()
+                trade = repository.get_trade(conn, trade_id)
                 if trade:
-                    ID, trade_date, symbol, opr, filled_qty, price, fees, vat, cost_value, profit_loss, is_position_open = trade
-                    is_position_open_text = "OPEN" if is_position_open == 1 else "CLOSED"
+                    is_position_open_text = "OPEN" if trade.is_open else "CLOSED"
                     console.print(f"""
     Trade Details:
-    ID: {ID}
-    Date: {trade_date}
-    Symbol: {symbol}
-    Operation: {opr} ({is_position_open_text})
-    Quantity: {filled_qty}
-    Price: ${price:,.2f}
-    Fees: ${fees:,.2f}
-    VAT: ${vat:,.2f}
-    Cost Value: ${cost_value:,.2f}
-    Profit/Loss: ${profit_loss:,.2f}
+    ID: {trade.ID}
+    Date: {trade.trade_date}
+    Symbol: {trade.symbol}
+    Operation: {trade.opr} ({is_position_open_text})
+    Quantity: {trade.filled_qty}
+    Price: ${trade.price:,.2f}
+    Fees: ${trade.fees:,.2f}
+    VAT: ${trade.vat:,.2f}
+    Cost Value: ${trade.cost_value or 0:,.2f}
+    Profit/Loss: ${trade.profit_loss or 0:,.2f}
                     """)
                     console.print("[blue]Options for Trade:[/blue] C[dim]lose Position,[/dim] O[dim]pen Position or[/dim] Enter [dim]to go back[/dim]")
                     mark_pos_input = input("Enter choice: ").strip().lower()
@@ -193,16 +449,16 @@ def main_menu(settings: Settings, settings_path: str):
                         if pl_input:
                             try:
                                 profit_loss = float(pl_input)
-                                update_trade(trade_id, profit_loss=profit_loss, is_position_open=0, settings=settings)
+                                update_trade(trade_id, profit_loss=profit_loss, is_position_open=0, settings=settings, action='close')
                                 console.print(f"[green]Trade ID {trade_id} marked as CLOSED.[/green]")
                             except ValueError:
                                 console.print("[red]Invalid Profit/Loss input. Keeping existing value.[/red]")
                         else:
-                            update_trade(trade_id, is_position_open=0, settings=settings)
+                            update_trade(trade_id, is_position_open=0, settings=settings, action='close')
                             console.print(f"[green]Trade ID {trade_id} marked as CLOSED.[/green]")
                     elif mark_pos_input == 'o':
                         # Open position
-                        update_trade(trade_id, is_position_open=1, settings=settings)
+                        update_trade(trade_id, is_position_open=1, settings=settings, action='open')
                         console.print(f"[green]Trade ID {trade_id} marked as OPEN.[/green]")
                 else:
                     console.print(f"[red]No trade found with ID {trade_id}.[/red]")
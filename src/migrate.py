@@ -1,6 +1,12 @@
 import sqlite3
+import profiler
 import os
-from utils import get_db_path
+import journal
+import query_cache
+import rollup
+import ticks
+from repository import SCALES, to_storage
+from utils import get_db_path, date_key_sql
 from settings import Settings
 
 schema_funds_sql = """
@@ -9,12 +15,13 @@ CREATE TABLE FUNDS (
     opr TEXT NOT NULL CHECK (opr IN ('deposit', 'withdraw')),
     fund_date TEXT NOT NULL,
     source TEXT NOT NULL,
-    amount_SAR REAL NOT NULL,
-    amount_USD REAL NOT NULL,
+    amount_SAR INTEGER NOT NULL,
+    amount_USD INTEGER NOT NULL,
     rate_exchange REAL NOT NULL
 );
 """
 
+# Money columns hold integer units, prices in 1/10000 and amounts in cents (see repository.py)
 schema_trades_sql = """
 CREATE TABLE TRADES (
     ID INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -22,30 +29,295 @@ CREATE TABLE TRADES (
     symbol TEXT NOT NULL,
     opr TEXT NOT NULL CHECK (opr IN ('buy', 'sell')),
     filled_qty INTEGER NOT NULL,
-    price REAL NOT NULL,
-    fees REAL NOT NULL,
-    vat REAL NOT NULL,
-    cost_value REAL,
-    profit_loss REAL,   
+    price INTEGER NOT NULL,
+    fees INTEGER NOT NULL,
+    vat INTEGER NOT NULL,
+    cost_value INTEGER,
+    profit_loss INTEGER,
     is_position_open INTEGER,
-    closed_position_price REAL,
-    closed_position_amount REAL
+    closed_position_price INTEGER,
+    closed_position_amount INTEGER
 );
 """
 
+schema_fx_sql = """
+CREATE TABLE IF NOT EXISTS FX_RATES (
+    rate_date INTEGER PRIMARY KEY,
+    rate REAL NOT NULL
+);
+"""
+
+schema_journal_sql = """
+CREATE TABLE IF NOT EXISTS JOURNAL (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    created TEXT NOT NULL,
+    action TEXT NOT NULL,
+    ref INTEGER,
+    changes TEXT NOT NULL
+);
+-- Undo/redo and rebuild, see journal.py
+CREATE TABLE IF NOT EXISTS JOURNAL_SNAPSHOTS (
+    seq INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    stacks TEXT NOT NULL,
+    state BLOB NOT NULL
+);
+-- Rows of each snapshot in chunks of IDs, a chunk written again only when the journal tail touched it
+CREATE TABLE IF NOT EXISTS JOURNAL_SNAPSHOT_CHUNKS (
+    tbl TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    columns TEXT NOT NULL,
+    rows BLOB NOT NULL,
+    PRIMARY KEY (tbl, chunk, seq)
+);
+"""
+
+schema_sync_sql = """
+-- Changeset sync with other machines, see sync.py
+CREATE TABLE IF NOT EXISTS SYNC_PEERS (
+    peer TEXT PRIMARY KEY,
+    acked_seq INTEGER NOT NULL DEFAULT 0,
+    imported_seq INTEGER NOT NULL DEFAULT 0,
+    synced TEXT
+);
+CREATE TABLE IF NOT EXISTS SYNC_APPLIED (
+    seq INTEGER PRIMARY KEY,
+    peer TEXT NOT NULL,
+    peer_seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sync_applied_peer ON SYNC_APPLIED (peer, seq);
+CREATE TABLE IF NOT EXISTS SYNC_IDS (
+    peer TEXT NOT NULL,
+    family TEXT NOT NULL,
+    peer_id INTEGER NOT NULL,
+    local_id INTEGER NOT NULL,
+    PRIMARY KEY (peer, family, peer_id)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sync_ids_local ON SYNC_IDS (peer, family, local_id);
+"""
+
+schema_alerts_sql = """
+-- Price alerts, see alerts.py
+CREATE TABLE IF NOT EXISTS ALERTS (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol TEXT NOT NULL,
+    label TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    above INTEGER NOT NULL,
+    created TEXT NOT NULL,
+    fired TEXT,
+    fired_price INTEGER,
+    dismissed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_pending ON ALERTS (symbol, price) WHERE fired IS NULL;
+CREATE INDEX IF NOT EXISTS idx_alerts_fired ON ALERTS (fired) WHERE fired IS NOT NULL AND dismissed = 0;
+"""
+
+schema_dividends_sql = """
+-- Dividends received, for the money-weighted returns in returns.py
+CREATE TABLE IF NOT EXISTS DIVIDENDS (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    pay_date TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    amount_USD INTEGER NOT NULL
+);
+"""
+
+schema_bars_sql = """
+-- Daily price bars cached for backtest.py, prices in 1/10000 dollars
+CREATE TABLE IF NOT EXISTS PRICE_BARS (
+    symbol TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    open INTEGER NOT NULL,
+    high INTEGER NOT NULL,
+    low INTEGER NOT NULL,
+    close INTEGER NOT NULL,
+    PRIMARY KEY (symbol, day)
+) WITHOUT ROWID;
+"""
+
+schema_quotes_sql = """
+-- Symbol ids of the quote journal and the daily bars compacted from it, see ticks.py
+CREATE TABLE IF NOT EXISTS QUOTE_SYMBOLS (
+    ID INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS QUOTE_BARS (
+    symbol TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    open INTEGER NOT NULL,
+    high INTEGER NOT NULL,
+    low INTEGER NOT NULL,
+    close INTEGER NOT NULL,
+    ticks INTEGER NOT NULL,
+    PRIMARY KEY (symbol, day)
+) WITHOUT ROWID;
+"""
+
+schema_archive_table_sql = """
+CREATE TABLE IF NOT EXISTS TRADES_ARCHIVE (
+    ID INTEGER PRIMARY KEY,
+    trade_date TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    opr TEXT NOT NULL CHECK (opr IN ('buy', 'sell')),
+    filled_qty INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    fees INTEGER NOT NULL,
+    vat INTEGER NOT NULL,
+    cost_value INTEGER,
+    profit_loss INTEGER,
+    is_position_open INTEGER,
+    closed_position_price INTEGER,
+    closed_position_amount INTEGER
+);
+"""
+
+schema_archive_sql = f"""
+-- Closed trades moved out of TRADES, see archive.py
+{schema_archive_table_sql}
+CREATE INDEX IF NOT EXISTS idx_trades_archive_symbol_opr_price ON TRADES_ARCHIVE (symbol, opr, price);
+CREATE INDEX IF NOT EXISTS idx_trades_archive_date ON TRADES_ARCHIVE ({date_key_sql('trade_date')});
+"""
+
+schema_indexes_sql = f"""
+CREATE INDEX IF NOT EXISTS idx_trades_price ON TRADES (price);
+CREATE INDEX IF NOT EXISTS idx_trades_symbol_opr_price ON TRADES (symbol, opr, price);
+CREATE INDEX IF NOT EXISTS idx_trades_open_symbol ON TRADES (is_position_open, symbol);
+CREATE INDEX IF NOT EXISTS idx_trades_date ON TRADES ({date_key_sql('trade_date')});
+CREATE INDEX IF NOT EXISTS idx_funds_date ON FUNDS ({date_key_sql('fund_date')});
+CREATE INDEX IF NOT EXISTS idx_funds_source ON FUNDS (source COLLATE NOCASE);
+"""
+
+def create_schema( conn: sqlite3.Connection ):
+    """
+    Creates the full schema on an open connection, for tools that build databases directly.
+    """
+    conn.executescript(schema_funds_sql + schema_trades_sql + schema_fx_sql + schema_journal_sql + schema_sync_sql + schema_alerts_sql + schema_dividends_sql + schema_bars_sql + schema_quotes_sql + schema_archive_sql + schema_indexes_sql + rollup.schema_rollup_sql)
+    conn.commit()
+
+class MigrationError(Exception):
+    pass
+
+# Tables whose money columns moved from REAL dollars to integer units, and the column that tells them apart
+MONEY_TABLES = {
+    'FUNDS': (schema_funds_sql, 'amount_USD'),
+    'TRADES': (schema_trades_sql, 'price'),
+    'TRADES_ARCHIVE': (schema_archive_table_sql, 'price'),
+}
+
+def _legacy_money_tables(conn: sqlite3.Connection) -> list[str]:
+    """
+    The MONEY_TABLES that still store dollars, recognised by their declared column type.
+    """
+    legacy = []
+    for table, (_, marker) in MONEY_TABLES.items():
+        found = conn.execute(f"SELECT type FROM pragma_table_info('{table}') WHERE name = ?", (marker,)).fetchone()
+        if found is not None and found[0].upper() != 'INTEGER':
+            legacy.append(table)
+    return legacy
+
+def fractional_shares(conn: sqlite3.Connection, table: str) -> list[int]:
+    """
+    IDs of the rows whose filled_qty is not a whole number of shares, which the migration refuses.
+    """
+    if not conn.execute(f"SELECT 1 FROM pragma_table_info('{table}') WHERE name = 'filled_qty'").fetchone():
+        return []
+    return [row[0] for row in conn.execute(f"SELECT ID FROM {table} WHERE filled_qty != ROUND(filled_qty) ORDER BY ID")]
+
+def _units_sql(column: str) -> str:
+    if column == 'filled_qty':
+        # Whole already, fractional_shares() is checked first
+        return "CAST(filled_qty AS INTEGER)"
+    if column in SCALES:
+        return f"CAST(ROUND({column} * {SCALES[column]}) AS INTEGER)"
+    return column
+
+def money_totals(conn: sqlite3.Connection, table: str, legacy: bool) -> dict:
+    """
+    (rows, total in dollars) per money column and filled_qty of a table, before or after the migration.
+    """
+    columns = [info[1] for info in conn.execute(f"PRAGMA table_info({table})") if info[1] in SCALES or info[1] == 'filled_qty']
+    sums = ", ".join(f"COUNT({column}), TOTAL({column})" if legacy else f"COUNT({column}), COALESCE(SUM({column}), 0)" for column in columns)
+    values = conn.execute(f"SELECT {sums} FROM {table}").fetchone()
+    totals = {}
+    for index, column in enumerate(columns):
+        count, total = values[2 * index], values[2 * index + 1]
+        totals[(table, column)] = (count, total if legacy else total / SCALES.get(column, 1))
+    return totals
+
+def reconcile(before: dict, after: dict) -> list[str]:
+    """
+    Totals that moved by more than rounding every row to its unit explains, as 'TABLE.column: before != after' strings.
+    Share counts are copied as they are and must match exactly.
+    """
+    differences = []
+    for key, (count, total) in before.items():
+        table, column = key
+        after_count, after_total = after.get(key, (0, 0))
+        allowed = 0 if column == 'filled_qty' else count * 0.5 / SCALES.get(column, 1) + 1e-9 * max(1.0, abs(total))
+        if after_count != count or abs(after_total - total) > allowed:
+            differences.append(f"{table}.{column}: {total} != {after_total}")
+    return differences
+
+def migrate_money( conn: sqlite3.Connection ) -> dict:
+    """
+    Rebuilds tables that store money as REAL dollars with integer units and rescales their
+    journal images, in one transaction that is rolled back unless every column total
+    reconciles within rounding. The rollups are dropped, the caller recreates and refills them.
+    Returns the reconciled totals as {(table, column): (before, after)}, empty when nothing was migrated.
+    """
+    legacy = _legacy_money_tables(conn)
+    if not legacy:
+        return {}
+    conn.execute("BEGIN")
+    try:
+        before = {}
+        after = {}
+        for table in legacy:
+            fractional = fractional_shares(conn, table)
+            if fractional:
+                raise MigrationError(f"{table} has fractional filled_qty in rows {', '.join(map(str, fractional))}, correct them to whole shares first")
+            before.update(money_totals(conn, table, legacy=True))
+            columns = [info[1] for info in conn.execute(f"PRAGMA table_info({table})")]
+            # Rename, recreate and copy keeps the IDs and moves the AUTOINCREMENT counter over
+            conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+            conn.execute(MONEY_TABLES[table][0])
+            conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(_units_sql(column) for column in columns)} FROM {table}_legacy")
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+            conn.execute("UPDATE sqlite_sequence SET name = ? WHERE name = ?", (table, f"{table}_legacy"))
+            conn.execute(f"DROP TABLE {table}_legacy")
+            journal.rescale(conn, table, to_storage)
+            after.update(money_totals(conn, table, legacy=False))
+        for table in rollup.ROLLUPS:
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+        differences = reconcile(before, after)
+        if differences:
+            raise MigrationError("; ".join(differences))
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return {key: (before[key][1], after[key][1]) for key in before}
+
 def migrate_db( account_name: str ):
     print("Starting database schema operations...", sqlite3.sqlite_version)
 
     try:        
         # Delete DB file if exists
         db_path = get_db_path( account_name )
+        query_cache.close_connection( db_path )
         if os.path.exists(db_path):
             os.remove(db_path)
             print("Existing database file deleted.")
+        # Its symbol ids go with the database
+        if os.path.exists(ticks.journal_path(account_name)):
+            os.remove(ticks.journal_path(account_name))
         
         # Create the database and tables
         create_funds_table( account_name )
         create_trades_table( account_name )
+        ensure_schema( account_name )
         
         print("DB created successfully.")
     except FileNotFoundError:
@@ -56,7 +328,7 @@ def create_funds_table( account_name: str ):
     try:
         db_path = get_db_path( account_name )
         # Open a connection to a SQLite database (creates the file if it doesn't exist)
-        conn = sqlite3.connect(db_path)
+        conn = profiler.connect(db_path)
 
         # Create a cursor object to execute SQL commands
         cursor = conn.cursor()        
@@ -77,7 +349,7 @@ def create_trades_table( account_name: str):
     try:
         db_path = get_db_path(account_name)
         # Open a connection to a SQLite database (creates the file if it doesn't exist)
-        conn = sqlite3.connect(db_path)
+        conn = profiler.connect(db_path)
 
         # Create a cursor object to execute SQL commands
         cursor = conn.cursor()        
@@ -93,6 +365,32 @@ def create_trades_table( account_name: str):
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         input("Press Enter to continue...")
+
+def ensure_schema( account_name: str ):
+    """
+    Creates the supporting tables and indexes that are missing, safe to run on every start.
+    """
+    try:
+        conn = profiler.connect(get_db_path( account_name ))
+        conn.executescript(schema_fx_sql + schema_journal_sql + schema_sync_sql + schema_alerts_sql + schema_dividends_sql + schema_bars_sql + schema_quotes_sql)
+        migrated = migrate_money(conn)
+        conn.executescript(schema_archive_sql + schema_indexes_sql + rollup.schema_rollup_sql)
+        conn.commit()
+        if migrated:
+            rollup.rebuild(conn)
+            conn.commit()
+            gap = max(abs(new - old) for old, new in migrated.values())
+            print(f"{account_name}: amounts migrated to integer units, {len(migrated)} column totals reconcile (largest difference {gap:.6f}).")
+        rollup.ensure(conn)
+        journal.ensure_snapshot(conn)
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        input("Press Enter to continue...")
+    except MigrationError as e:
+        # Rolled back, the amounts would be read in the wrong units
+        print(f"Amounts could not be migrated, the database is unchanged: {e}")
+        raise SystemExit(1)
     
 
 def check_and_migrate( settings: Settings ):
@@ -102,18 +400,18 @@ def check_and_migrate( settings: Settings ):
         migrate_db( settings.default_account )
         return
     # Check if tables exist
-    conn = sqlite3.connect(db_path)
+    conn = profiler.connect(db_path)
     cursor = conn.cursor()
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='FUNDS'")
-    if not cursor.fetchone():
+    has_funds = cursor.fetchone() is not None
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='TRADES'")
+    has_trades = cursor.fetchone() is not None
+    conn.close()
+    if not has_funds:
         print("FUNDS table not found. Running migration...")
-        conn.close()
         create_funds_table( settings.default_account )
-        return
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='TRADES'")
-    if not cursor.fetchone():
+    if not has_trades:
         print("TRADES table not found. Running migration...")
-        conn.close()
         create_trades_table( settings.default_account )
-        return
-    conn.close()
\ No newline at end of file
+    # Everything in ensure_schema uses IF NOT EXISTS so older databases pick it up on start
+    ensure_schema( settings.default_account )
\ No newline at end of file
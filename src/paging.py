@@ -0,0 +1,81 @@
+"""
+Sort order and page window state shared by the paged tables (open positions, filtered trades).
+"""
+from __future__ import annotations
+from dataclasses import dataclass, replace
+from rich.console import Console
+
+# Menu key -> sort column
+SORT_KEYS = {'i': 'ID', 'd': 'date', 'y': 'symbol', 'q': 'qty', 'p': 'price', 'c': 'cost', 'l': 'pl'}
+
+@dataclass(frozen=True)
+class SortOrder:
+    column: str = 'price'
+    descending: bool = False
+
+    def describe(self) -> str:
+        return f"{self.column} {'desc' if self.descending else 'asc'}"
+
+def prompt_sort(sort: SortOrder, columns: list[str], console: Console) -> SortOrder | None:
+    """
+    Asks for a sort column; picking the current column again flips the direction.
+    Returns None when the input was not a sortable column.
+    """
+    keys = {key: column for key, column in SORT_KEYS.items() if column in columns}
+    legend = ", ".join(f"{key.upper()} [dim]{column}[/dim]" for key, column in keys.items())
+    console.print(f"[blue]Sort by:[/blue] {legend} [dim](current {sort.describe()}, same column flips direction)[/dim]")
+    column = keys.get(input("Enter choice: ").strip().lower())
+    if column is None:
+        return None
+    if column == sort.column:
+        return replace(sort, descending=not sort.descending)
+    return SortOrder(column)
+
+def parse_jump(user_input: str) -> int | None:
+    """
+    Trade ID from '#123', or asked for when the input is a bare '#'.
+    """
+    text = user_input[1:].strip() or input("Jump to Trade ID: ").strip()
+    return int(text) if text.isdigit() else None
+
+@dataclass
+class PageWindow:
+    """
+    The visible slice of a table that is sorted and counted elsewhere.
+    page is zero based, highlight is the ID of the row a jump landed on.
+    """
+    page_size: int
+    sort: SortOrder = SortOrder()
+    page: int = 0
+    highlight: int | None = None
+
+    def pages(self, total: int) -> int:
+        return max(1, -(-total // self.page_size))
+
+    def bounds(self, total: int) -> tuple[int, int]:
+        self.page = min(self.page, self.pages(total) - 1)
+        start = self.page * self.page_size
+        return start, min(start + self.page_size, total)
+
+    def next(self, total: int) -> bool:
+        if self.page + 1 >= self.pages(total):
+            return False
+        self.page += 1
+        self.highlight = None
+        return True
+
+    def previous(self) -> bool:
+        if self.page == 0:
+            return False
+        self.page -= 1
+        self.highlight = None
+        return True
+
+    def show_position(self, position: int, row_id: int):
+        self.page = position // self.page_size
+        self.highlight = row_id
+
+    def resort(self, sort: SortOrder):
+        self.sort = sort
+        self.page = 0
+        self.highlight = None
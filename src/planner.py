@@ -1,20 +1,19 @@
-import sqlite3
+import alerts
+import profiler
+import query_cache
+import repository
 from utils import get_db_path
 from rich.console import Console
 from rich.panel import Panel
 from settings import Settings
+from fx_rates import account_fx
 
 def get_open_positions(ticker, account_name):
     """
-    Retrieves open positions for a given ticker from the database.
-    Returns a list of (filled_qty, price) tuples.
+    Retrieves the open buy lots for a given ticker from the database.
     """
-    conn = sqlite3.connect(get_db_path(account_name))
-    cursor = conn.cursor()
-    cursor.execute("SELECT filled_qty, price FROM TRADES WHERE symbol = ? AND opr = 'buy' AND is_position_open = 1", (ticker,))
-    positions = cursor.fetchall()
-    conn.close()
-    return positions
+    conn = query_cache.get_connection(get_db_path(account_name))
+    return repository.open_lots(conn, [ticker], 'buy')
 
 def calculate_position_summary(positions):
     """
@@ -22,8 +21,8 @@ def calculate_position_summary(positions):
     """
     if not positions:
         return 0, 0.0
-    total_shares = sum(qty for qty, _ in positions)
-    total_cost = sum(qty * price for qty, price in positions)
+    total_shares = sum(lot.filled_qty for lot in positions)
+    total_cost = sum(lot.filled_qty * lot.price for lot in positions)
     avg_cost = total_cost / total_shares if total_shares > 0 else 0.0
     return total_shares, avg_cost
 
@@ -31,15 +30,15 @@ def collect_technical_levels(positions, ticker, current_price):
     """
     Asks the user for technical levels for the ticker.
     """
-    ath_position = max(positions, key=lambda x: x[1]) if positions else (0, 0.0)
-    current_resistance_position = max((pos for pos in positions if pos[1] < current_price), default=(0, 0.0), key=lambda x: x[1])
-    avg_position_price = sum(qty * price for qty, price in positions) / sum(qty for qty, _ in positions) if positions else 0.0
+    ath_price = max((lot.price for lot in positions), default=0.0)
+    current_resistance_price = max((lot.price for lot in positions if lot.price < current_price), default=0.0)
+    _, avg_position_price = calculate_position_summary(positions)
     print(f"Collecting technical levels for {ticker}:")
 
-    all_time_high = float(input(f"Enter all-time high zone (e.g., {ath_position[1]}): ") or ath_position[1])
-    current_resistance = float(input(f"Enter current resistance (e.g., {current_resistance_position[1]}): ") or current_resistance_position[1])
-    key_support1 = float(input(f"Enter key support 1 (e.g., {ath_position[1] * 0.9}): ") or ath_position[1] * 0.9)
-    key_support2 = float(input(f"Enter key support 2 (e.g., {ath_position[1] * 0.8}): ") or ath_position[1] * 0.8)
+    all_time_high = float(input(f"Enter all-time high zone (e.g., {ath_price}): ") or ath_price)
+    current_resistance = float(input(f"Enter current resistance (e.g., {current_resistance_price}): ") or current_resistance_price)
+    key_support1 = float(input(f"Enter key support 1 (e.g., {ath_price * 0.9}): ") or ath_price * 0.9)
+    key_support2 = float(input(f"Enter key support 2 (e.g., {ath_price * 0.8}): ") or ath_price * 0.8)
     deeper_support = float(input(f"Enter deeper support (e.g., {avg_position_price:.2f}): ") or avg_position_price)
     return {
         'current_price': current_price,
@@ -78,16 +77,17 @@ def print_risk_plan(ticker, shares, avg_cost, levels, risks, settings: Settings)
     Prints the risk management plan to the console.
     """
     console = Console()
+    exchange_rate = account_fx(settings).latest()
     content = f"Ticker : [magenta]{ticker}[/magenta]\n"
-    content += f"Open Position: {shares} shares @ avg cost ${avg_cost:.2f} = ${shares * avg_cost:.2f} / {shares * avg_cost * settings.get_account().exchange_rate:.2f}\n"
-    content += f"Current Value: ${shares * levels['current_price']:.2f} / {shares * levels['current_price'] * settings.get_account().exchange_rate:.2f}\n"
+    content += f"Open Position: {shares} shares @ avg cost ${avg_cost:.2f} = ${shares * avg_cost:.2f} / {shares * avg_cost * exchange_rate:.2f}\n"
+    content += f"Current Value: ${shares * levels['current_price']:.2f} / {shares * levels['current_price'] * exchange_rate:.2f}\n"
     content += "\n[yellow]Technical Levels:[/yellow]\n"
     for name, price in levels.items():
         content += f"  {name.replace('_', ' ').title()}: ${price:.2f}\n"
     content += "\n[yellow]Risk Scenarios:[/yellow]\n"
     for level, data in risks.items():
         if isinstance(data, dict):
-            content += f"  {level.replace('_', ' ').title()}: ${data['price']:.2f} | Drawdown: {data['drawdown_percent']:.2f}% | Loss: ${data['potential_loss']:.2f} / {settings.get_account().exchange_rate * data['potential_loss']:.2f}\n"
+            content += f"  {level.replace('_', ' ').title()}: ${data['price']:.2f} | Drawdown: {data['drawdown_percent']:.2f}% | Loss: ${data['potential_loss']:.2f} / {exchange_rate * data['potential_loss']:.2f}\n"
         else:
             content += f"  {level.replace('_', ' ').title()}: {data}\n"
     content += "\n[yellow]Practical Plan:[/yellow]\n"
@@ -108,6 +108,20 @@ def plan( ticker, current_price, settings: Settings ):
     levels = collect_technical_levels(positions, ticker, current_price)
     risks = calculate_risk_levels(shares, avg_cost, levels)
     print_risk_plan(ticker, shares, avg_cost, levels, risks, settings)
+    if input(f"Alert when {ticker} reaches these levels? (y/n): ").strip().lower() == 'y':
+        print(f"{save_alerts(ticker, levels, current_price, settings)} alerts saved.")
+
+def save_alerts( ticker, levels, current_price, settings: Settings ) -> int:
+    """
+    Stores price alerts on the given levels (name -> price), see alerts.py.
+    """
+    conn = profiler.connect(get_db_path( settings.default_account ))
+    try:
+        added = alerts.add_levels(conn, ticker, levels, current_price)
+        conn.commit()
+    finally:
+        conn.close()
+    return added
     
 def plan_menu(trades, selected_ticker, current_prices, settings: Settings):
     console = Console()
@@ -124,13 +138,13 @@ def plan_menu(trades, selected_ticker, current_prices, settings: Settings):
                 input("Press Enter to continue...")
                 return
             # Fetch the trades from trades above
-            selected_trades = [trade for trade in trades if trade[0] in trade_ids]
+            selected_trades = [lot for lot in trades if lot.ID in trade_ids]
             if not selected_trades:
                 console.print("[red]No matching trades found for the given IDs.[/red]")
                 input("Press Enter to continue...")
                 return
-            total_qty = sum(trade[4] for trade in selected_trades)
-            total_cost_value = sum(trade[8] for trade in selected_trades)
+            total_qty = sum(lot.filled_qty for lot in selected_trades)
+            total_cost_value = sum(lot.cost_value for lot in selected_trades)
             exit_choice = input("Calculate exit position for (P)rice profit or (D)esired profit in USD? ( P or D): ").strip().lower()
             if exit_choice == 'p':
                 target_price = float(input("Enter target exit price: ").strip())
@@ -141,6 +155,12 @@ def plan_menu(trades, selected_ticker, current_prices, settings: Settings):
                 desired_profit_usd = float(input("Enter desired profit in USD: ").strip())
                 exit_price = (total_cost_value + desired_profit_usd) / total_qty
                 console.print(f"[green]Calculated Exit Price: ${exit_price:.2f} for total quantity {total_qty} to achieve desired profit of ${desired_profit_usd:.2f}[/green]")
+            symbols = {lot.symbol for lot in selected_trades}
+            if exit_choice in ('p', 'd') and len(symbols) == 1:
+                symbol = symbols.pop()
+                if input(f"Alert when {symbol} reaches ${exit_price:.2f}? (y/n): ").strip().lower() == 'y':
+                    save_alerts(symbol, {'exit_price': exit_price}, current_prices.get(symbol), settings)
+                    console.print("[green]Alert saved.[/green]")
             input("Press Enter to continue...")
             return
         except ValueError as e:
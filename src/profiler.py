@@ -0,0 +1,246 @@
+"""
+Opt-in instrumentation: SQL statement timings (with EXPLAIN QUERY PLAN for slow ones),
+quote fetches and dashboard render phases.
+
+Enable with TRADECLI_PROFILE=1 or `main.py --profile`. TRADECLI_TRACE=<file> (or --trace <file>)
+also writes every event to a trace file: a .jsonl file gets one JSON object per line as events
+happen, any other name gets a Chrome trace (chrome://tracing, Perfetto) when the app exits.
+TRADECLI_SLOW_MS sets the slow query threshold (default 50 ms).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from rich.table import Table
+
+SLOW_MS = 50.0
+
+_enabled = False
+_slow_ms = SLOW_MS
+_trace_path = None
+_trace_file = None
+_trace_events = []
+_origin = time.perf_counter()
+_frame = {'sql': [], 'spans': [], 'slow': []}
+_plans = {}
+
+def enabled() -> bool:
+    return _enabled
+
+def enable(trace_path: str | None = None, slow_ms: float = SLOW_MS):
+    global _enabled, _slow_ms, _trace_path, _trace_file
+    _enabled = True
+    _slow_ms = slow_ms
+    _trace_path = trace_path
+    if trace_path and trace_path.endswith('.jsonl'):
+        _trace_file = open(trace_path, 'a')
+
+def configure(argv: list) -> list:
+    """
+    Enables profiling from the environment or --profile / --trace <file> arguments.
+    Returns argv without the profiling arguments.
+    """
+    remaining = []
+    profile = os.environ.get('TRADECLI_PROFILE', '') not in ('', '0')
+    trace_path = os.environ.get('TRADECLI_TRACE') or None
+    args = iter(argv)
+    for arg in args:
+        if arg == '--profile':
+            profile = True
+        elif arg == '--trace':
+            trace_path = next(args, None)
+        else:
+            remaining.append(arg)
+    if profile or trace_path:
+        enable(trace_path, float(os.environ.get('TRADECLI_SLOW_MS', SLOW_MS)))
+    return remaining
+
+def close():
+    """
+    Flushes the trace file. A Chrome trace is written in one go here.
+    """
+    global _trace_file
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
+    elif _trace_path and _trace_events:
+        with open(_trace_path, 'w') as f:
+            json.dump({'traceEvents': _trace_events, 'displayTimeUnit': 'ms'}, f)
+
+def _emit(name: str, cat: str, start: float, duration: float, args: dict | None = None):
+    if not _trace_path:
+        return
+    event = {
+        'name': name,
+        'cat': cat,
+        'ph': 'X',
+        'ts': round((start - _origin) * 1_000_000, 1),
+        'dur': round(duration * 1_000_000, 1),
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+    }
+    if args:
+        event['args'] = args
+    if _trace_file is not None:
+        _trace_file.write(json.dumps(event) + '\n')
+    else:
+        _trace_events.append(event)
+
+@contextmanager
+def span(name: str, cat: str = 'app', **args):
+    """
+    Times a block as one phase of the current frame. Free when profiling is off.
+    """
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        _frame['spans'].append((name, cat, duration))
+        _emit(name, cat, start, duration, args)
+
+def new_frame():
+    """
+    Starts a new set of timings, called once the previous set has been displayed.
+    """
+    _frame['sql'].clear()
+    _frame['spans'].clear()
+    _frame['slow'].clear()
+
+def _explain(conn: sqlite3.Connection, sql: str, params) -> str:
+    if sql not in _plans:
+        try:
+            # A plain cursor, so the EXPLAIN itself is not profiled
+            rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            _plans[sql] = "; ".join(row[-1] for row in rows)
+        except sqlite3.Error as e:
+            _plans[sql] = f"(no plan: {e})"
+    return _plans[sql]
+
+class _Statement:
+    """
+    One executed statement, execute time plus the time spent fetching its rows.
+    """
+    __slots__ = ('sql', 'params', 'seconds', 'slow')
+
+    def __init__(self, sql: str, params):
+        self.sql = sql
+        self.params = params
+        self.seconds = 0.0
+        self.slow = False
+
+class ProfiledCursor(sqlite3.Cursor):
+    _statement = None
+
+    def _record(self, start: float, name: str):
+        duration = time.perf_counter() - start
+        statement = self._statement
+        statement.seconds += duration
+        _emit(name, 'sql', start, duration, {'sql': statement.sql})
+        if not statement.slow and statement.seconds * 1000 >= _slow_ms:
+            statement.slow = True
+            plan = _explain(self.connection, statement.sql, statement.params) if statement.params is not None else ''
+            _frame['slow'].append((statement, plan))
+
+    def _run(self, method, sql: str, params, explain_params, name: str):
+        self._statement = _Statement(' '.join(sql.split()), explain_params)
+        _frame['sql'].append(self._statement)
+        start = time.perf_counter()
+        try:
+            return method(self, sql, *params)
+        finally:
+            self._record(start, name)
+
+    def execute(self, sql, parameters=()):
+        return self._run(sqlite3.Cursor.execute, sql, (parameters,), parameters, 'sql.execute')
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(sqlite3.Cursor.executemany, sql, (seq_of_parameters,), None, 'sql.executemany')
+
+    def executescript(self, sql_script):
+        return self._run(sqlite3.Cursor.executescript, sql_script, (), None, 'sql.executescript')
+
+    def _fetch(self, method, *args):
+        if self._statement is None:
+            return method(self, *args)
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            self._record(start, 'sql.fetch')
+
+    def fetchone(self):
+        return self._fetch(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(sqlite3.Cursor.fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._fetch(sqlite3.Cursor.fetchall)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._fetch(sqlite3.Cursor.__next__)
+
+class ProfiledConnection(sqlite3.Connection):
+    """
+    Connection whose cursors time every statement and fetch.
+    """
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+def connect(database: str, **kwargs) -> sqlite3.Connection:
+    """
+    sqlite3.connect, returning a ProfiledConnection while profiling is enabled.
+    """
+    if _enabled:
+        kwargs.setdefault('factory', ProfiledConnection)
+    return sqlite3.connect(database, **kwargs)
+
+def slow_queries() -> list:
+    """
+    (sql, ms, plan) for the slow statements of the current frame, in execution order.
+    """
+    return [(statement.sql, statement.seconds * 1000, plan) for statement, plan in _frame['slow']]
+
+def timing_table() -> Table | None:
+    """
+    Compact summary of the current frame, or None when profiling is off.
+    """
+    if not _enabled:
+        return None
+    table = Table(title=f"Timings (slow SQL >= {_slow_ms:g} ms)", title_style="dim", show_edge=False)
+    table.add_column("Phase", style="dim")
+    table.add_column("Calls", justify="right")
+    table.add_column("ms", justify="right", style="yellow")
+    table.add_column("Detail", style="dim", overflow="fold")
+
+    statements = _frame['sql']
+    sql_ms = sum(statement.seconds for statement in statements) * 1000
+    table.add_row("sql", str(len(statements)), f"{sql_ms:,.1f}", f"{len(_frame['slow'])} slow")
+    phases = {}
+    for name, cat, duration in _frame['spans']:
+        calls, total = phases.get(name, (0, 0.0))
+        phases[name] = (calls + 1, total + duration)
+    for name, (calls, total) in phases.items():
+        table.add_row(name, str(calls), f"{total * 1000:,.1f}", "")
+    for statement, plan in sorted(_frame['slow'], key=lambda item: -item[0].seconds)[:3]:
+        sql = statement.sql if len(statement.sql) <= 80 else statement.sql[:77] + "..."
+        table.add_row("[red]slow sql[/red]", "", f"{statement.seconds * 1000:,.1f}", f"{sql}\n[cyan]{plan}[/cyan]" if plan else sql)
+    return table
@@ -0,0 +1,108 @@
+import sqlite3
+import profiler
+import replica
+import sys
+from collections import OrderedDict
+
+class ResultCache:
+    """
+    LRU cache for query results, bounded by the number of cached rows and their approximate size in bytes.
+    """
+    def __init__(self, max_rows: int = 100_000, max_bytes: int = 32 * 1024 * 1024):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.rows = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, rows: int):
+        size = estimate_size(value)
+        if rows > self.max_rows or size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (value, rows, size)
+        self.rows += rows
+        self.bytes += size
+        while self.rows > self.max_rows or self.bytes > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for key, calling loader() and caching its result on a miss.
+        """
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.put(key, value, len(value) if isinstance(value, list) else 1)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.rows = 0
+        self.bytes = 0
+
+    def _drop(self, key):
+        _, rows, size = self.entries.pop(key)
+        self.rows -= rows
+        self.bytes -= size
+
+def estimate_size(value) -> int:
+    """
+    Rough memory footprint of a result: containers plus their scalar values.
+    """
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    slots = getattr(type(value), '__slots__', None)
+    if slots:
+        return sys.getsizeof(value) + sum(estimate_size(getattr(value, name)) for name in slots)
+    return sys.getsizeof(value)
+
+# Long lived read connections, PRAGMA data_version is only comparable within one connection
+_connections = {}
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """
+    The long lived read connection for a database, its synced in-memory replica when enabled.
+    """
+    if replica.enabled():
+        return replica.get(db_path).conn
+    conn = _connections.get(db_path)
+    if conn is None:
+        conn = profiler.connect(db_path)
+        _connections[db_path] = conn
+    return conn
+
+def close_connection(db_path: str):
+    """
+    Closes the cached connection, needed before the database file is deleted or replaced.
+    """
+    conn = _connections.pop(db_path, None)
+    if conn is not None:
+        conn.close()
+    replica.close(db_path)
+    filter_cache.clear()
+
+def data_version(conn: sqlite3.Connection) -> int:
+    """
+    Changes whenever another connection (this process or any other) commits to the database.
+    """
+    synced = replica.version(conn)
+    if synced is not None:
+        return synced
+    return conn.execute("PRAGMA data_version").fetchone()[0]
+
+filter_cache = ResultCache()
@@ -0,0 +1,221 @@
+"""
+Registry of the application's queries and a query plan guard.
+
+Each entry calls the real application function against a generated database with the
+profiler capturing every statement and its EXPLAIN QUERY PLAN. An entry fails when one of its
+statements reads TRADES, FUNDS or TRADES_ARCHIVE whole, by a plain scan or by walking an
+index end to end, unless the entry names that table in scans (totals over every trade and
+the like). A walk stopped by the statement's LIMIT, with no temporary b-tree to sort first,
+reads one page and passes:
+
+    python src/query_plans.py             # exit code 1 when a query lost its index
+    python src/query_plans.py --verbose   # print every plan
+
+tests/test_query_plans.py runs the same check under pytest.
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+from contextlib import contextmanager, redirect_stdout
+from dataclasses import dataclass
+from io import StringIO
+from typing import Callable
+import profiler
+import alerts
+import archive
+import backtest
+import repository
+import returns
+import rollup
+import ticks
+from benchmark import generate_account
+from consolidated import attach_accounts, load_consolidated
+from filter_trades import open_pager
+from funds_query import FundsFilter, fetch_page as fetch_funds_page, aggregate as aggregate_funds
+from fx_rates import account_fx
+from menu import get_funds
+from planner import get_open_positions
+from settings import Settings, Account
+from snapshot import load_snapshot
+from trade import view_trade, buy_trade, sell_trade, delete_trade, update_trade, deposit_funds, withdraw_funds
+from paging import SortOrder
+from trade_query import TradeFilter, fetch_page, aggregate, locate
+from utils import get_db_path
+
+# Scans of the large tables, with or without an index, under their own names (in any attached
+# database) or the aliases the query builders use
+FULL_SCAN = re.compile(r"\bSCAN (?:\w+\.)?(TRADES|FUNDS|TRADES_ARCHIVE|t|t2|a|f)\b")
+ALIASES = {'t': 'TRADES', 't2': 'TRADES', 'a': 'TRADES_ARCHIVE', 'f': 'FUNDS'}
+LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+
+def full_scans(sql: str, plan: str) -> set:
+    """
+    The large tables a statement reads whole. Scans of a subquery's co-routine read rows its own
+    (indexed) searches already found, and a statement with a LIMIT and nothing to sort first
+    stops its walk at the page.
+    """
+    if LIMIT.search(sql) and "TEMP B-TREE" not in plan:
+        return set()
+    coroutines = set(re.findall(r"CO-ROUTINE (\w+)", plan))
+    return {ALIASES.get(name, name) for name in FULL_SCAN.findall(plan) if name not in coroutines}
+
+@dataclass
+class Context:
+    settings: Settings
+    conn: object
+    symbol: str
+    trade_id: int
+    prices: dict
+
+    @property
+    def cursor(self):
+        return self.conn.cursor()
+
+@dataclass
+class QueryCheck:
+    name: str
+    run: Callable[[Context], object]
+    # Large tables the query reads whole by design
+    scans: tuple = ()
+
+def _trade_filter(trade_filter: TradeFilter, what: str) -> Callable[[Context], object]:
+    if what == 'page':
+        return lambda ctx: fetch_page(ctx.cursor, trade_filter, ctx.prices)
+    return lambda ctx: aggregate(ctx.cursor, trade_filter, ctx.prices)
+
+def _symbol_filter(what: str) -> Callable[[Context], object]:
+    return lambda ctx: _trade_filter(TradeFilter(symbol=ctx.symbol), what)(ctx)
+
+def _consolidated(ctx: Context):
+    conn = profiler.connect(":memory:")
+    try:
+        attached, _ = attach_accounts(conn, ctx.settings)
+        return load_consolidated(conn, attached, ctx.prices)
+    finally:
+        conn.close()
+
+QUERIES = [
+    # Dashboard
+    # Deposits and withdrawals are summed over every fund row
+    QueryCheck("snapshot.load", lambda ctx: load_snapshot(ctx.cursor, 3.75), scans=('FUNDS',)),
+    QueryCheck("planner.open_positions", lambda ctx: get_open_positions(ctx.symbol, ctx.settings.default_account)),
+    QueryCheck("fx.account_rates", lambda ctx: account_fx(ctx.settings)),
+    # Trade filters
+    QueryCheck("filter.symbol.page", _symbol_filter('page')),
+    QueryCheck("filter.symbol.totals", _symbol_filter('totals')),
+    QueryCheck("filter.year.page", _trade_filter(TradeFilter(date_from="20240101", date_to="20241231"), 'page')),
+    QueryCheck("filter.year.totals", _trade_filter(TradeFilter(date_from="20240101", date_to="20241231"), 'totals')),
+    QueryCheck("filter.open.page", _trade_filter(TradeFilter(is_open=True), 'page')),
+    QueryCheck("filter.open.totals", _trade_filter(TradeFilter(is_open=True), 'totals')),
+    QueryCheck("filter.price.page", _trade_filter(TradeFilter(price_min=100, price_max=110), 'page')),
+    QueryCheck("filter.price.totals", _trade_filter(TradeFilter(price_min=100, price_max=110), 'totals')),
+    QueryCheck("filter.all.page", _trade_filter(TradeFilter(), 'page')),
+    # Totals of every trade, closed P/L excluding open lots, which the rollups do not split
+    QueryCheck("filter.all.totals", _trade_filter(TradeFilter(), 'totals'), scans=('TRADES',)),
+    QueryCheck("filter.loss.page", _trade_filter(TradeFilter(pl_sign=-1), 'page')),
+    QueryCheck("filter.all.page.date_desc", lambda ctx: fetch_page(ctx.cursor, TradeFilter(), ctx.prices, sort=SortOrder('date', True))),
+    QueryCheck("filter.symbol.page.qty", lambda ctx: fetch_page(ctx.cursor, TradeFilter(symbol=ctx.symbol), ctx.prices, sort=SortOrder('qty'))),
+    QueryCheck("filter.symbol.locate", lambda ctx: locate(ctx.cursor, TradeFilter(symbol=ctx.symbol), ctx.prices, ctx.trade_id)),
+    QueryCheck("filter.history.year.page", _trade_filter(TradeFilter(date_from="20240101", date_to="20241231", history=True), 'page')),
+    QueryCheck("filter.history.year.totals", _trade_filter(TradeFilter(date_from="20240101", date_to="20241231", history=True), 'totals')),
+    QueryCheck("archive.resolve", lambda ctx: archive.resolve(ctx.conn, TradeFilter(date_from="20240101"))),
+    QueryCheck("archive.preview", lambda ctx: archive.preview(ctx.conn, "20200101")),
+    QueryCheck("rollup.monthly", lambda ctx: rollup.monthly(ctx.conn, ctx.symbol, "20240101", "20241231")),
+    QueryCheck("alerts.load", lambda ctx: alerts.AlertBook.load(ctx.conn)),
+    QueryCheck("alerts.fired", lambda ctx: (alerts.fired(ctx.conn, 10), alerts.fired_count(ctx.conn))),
+    # Every trade's cash flow, read in one pass
+    QueryCheck("returns.symbols", lambda ctx: returns.symbol_flows(ctx.conn, ctx.prices), scans=('TRADES',)),
+    QueryCheck("returns.account", lambda ctx: returns.account_flows(ctx.conn, ctx.settings.default_account, ctx.prices), scans=('FUNDS',)),
+    QueryCheck("returns.years", lambda ctx: returns.year_flows(ctx.conn), scans=('FUNDS',)),
+    QueryCheck("backtest.pieces", lambda ctx: backtest.load_pieces(ctx.conn), scans=('TRADES', 'TRADES_ARCHIVE')),
+    QueryCheck("backtest.bars", lambda ctx: backtest.load_bars(ctx.conn, ctx.symbol)),
+    QueryCheck("ticks.last_prices", lambda ctx: ticks.last_prices(ctx.conn, ctx.settings.default_account)),
+    # The totals of every sell, about half the trades
+    QueryCheck("filter.cached", lambda ctx: open_pager(get_db_path(ctx.settings.default_account), TradeFilter(opr='sell'), ctx.prices), scans=('TRADES',)),
+    # Funds
+    QueryCheck("funds.all.page", lambda ctx: fetch_funds_page(ctx.cursor, FundsFilter())),
+    QueryCheck("funds.all.totals", lambda ctx: aggregate_funds(ctx.cursor, FundsFilter()), scans=('FUNDS',)),
+    QueryCheck("funds.source.page", lambda ctx: fetch_funds_page(ctx.cursor, FundsFilter(source="Sal"))),
+    QueryCheck("funds.source.totals", lambda ctx: aggregate_funds(ctx.cursor, FundsFilter(source="Sal"))),
+    QueryCheck("funds.year.page", lambda ctx: fetch_funds_page(ctx.cursor, FundsFilter(date_from="20240101", date_to="20241231"))),
+    QueryCheck("funds.year.totals", lambda ctx: aggregate_funds(ctx.cursor, FundsFilter(date_from="20240101", date_to="20241231"))),
+    QueryCheck("funds.list", lambda ctx: get_funds(ctx.settings), scans=('FUNDS',)),
+    # Single trades
+    QueryCheck("repository.get_trade", lambda ctx: repository.get_trade(ctx.conn, ctx.trade_id)),
+    # Streams every trade, for exports and rebuilds
+    QueryCheck("repository.iter_trades", lambda ctx: next(repository.iter_trades(ctx.conn), None), scans=('TRADES',)),
+    QueryCheck("trade.view", lambda ctx: view_trade(ctx.trade_id, ctx.settings)),
+    QueryCheck("trade.update", lambda ctx: update_trade(ctx.trade_id, price=100.0, settings=ctx.settings)),
+    QueryCheck("trade.buy", lambda ctx: buy_trade("01/01/2024", ctx.symbol, 1, 100.0, settings=ctx.settings)),
+    QueryCheck("trade.sell_and_close", lambda ctx: sell_trade("02/01/2024", ctx.symbol, 1, 110.0, close_position=ctx.trade_id, settings=ctx.settings)),
+    QueryCheck("trade.delete", lambda ctx: delete_trade(ctx.trade_id, ctx.settings)),
+    QueryCheck("funds.deposit", lambda ctx: deposit_funds("01/01/2024", "Salary", 3750.0, 1000.0, 3.75, ctx.settings)),
+    QueryCheck("funds.withdraw", lambda ctx: withdraw_funds("01/01/2024", "Salary", 375.0, 100.0, 3.75, ctx.settings)),
+    # Accounts
+    # Each account's fund totals, as in snapshot.load
+    QueryCheck("consolidated.totals", _consolidated, scans=('FUNDS',)),
+]
+
+def check(ctx: Context, queries: list = QUERIES) -> list:
+    """
+    Runs every query and returns (check, [(sql, plan)], tables read whole it does not allow) results.
+    """
+    results = []
+    for query in queries:
+        profiler.new_frame()
+        with redirect_stdout(StringIO()):
+            query.run(ctx)
+        statements = [(sql, plan) for sql, _, plan in profiler.slow_queries() if plan]
+        scanned = set().union(*(full_scans(sql, plan) for sql, plan in statements))
+        results.append((query, statements, sorted(scanned - set(query.scans))))
+    return results
+
+@contextmanager
+def generated(trades: int = 50_000, funds: int = 2_000):
+    """
+    A Context on an account generated in a temporary directory, the current one while it is open,
+    with the plan of every statement captured.
+    """
+    # Every statement counts as slow, so each one gets its plan captured
+    profiler.enable(slow_ms=0)
+    previous_dir = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="tradecli-plans-"))
+    try:
+        settings = Settings(default_account="plans", accounts=[Account(name="plans")])
+        generate_account(get_db_path(settings.default_account), trades=trades, funds=funds, open_lots=trades // 50)
+        conn = profiler.connect(get_db_path(settings.default_account))
+        try:
+            symbol, trade_id = conn.execute("SELECT symbol, ID FROM TRADES WHERE opr = 'buy' AND is_position_open = 1 LIMIT 1").fetchone()
+            prices = dict(conn.execute(f"SELECT symbol, {repository.price_sql('MAX(price)')} FROM TRADES GROUP BY symbol").fetchall())
+            yield Context(settings, conn, symbol, trade_id, prices)
+        finally:
+            conn.close()
+    finally:
+        os.chdir(previous_dir)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check that application queries do not read TRADES or FUNDS whole unless they are meant to.")
+    parser.add_argument("--trades", type=int, default=50_000)
+    parser.add_argument("--funds", type=int, default=2_000)
+    parser.add_argument("--verbose", action="store_true", help="Print the plan of every statement")
+    args = parser.parse_args(argv)
+
+    with generated(args.trades, args.funds) as ctx:
+        results = check(ctx)
+
+    failures = 0
+    for query, statements, scanned in results:
+        failures += bool(scanned)
+        status = "FAIL" if scanned else ("ok" if not query.scans else f"scans {', '.join(query.scans)}")
+        print(f"{status:12} {query.name}" + (f" (reads {', '.join(scanned)} whole)" if scanned else ""))
+        if scanned or args.verbose:
+            for sql, plan in statements:
+                print(f"{'':12}   {sql[:100]}")
+                print(f"{'':12}   -> {plan}")
+    print(f"{len(results)} queries checked, {failures} failed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
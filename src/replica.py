@@ -0,0 +1,119 @@
+"""
+Optional in-memory read replica of an account database, for the read-heavy screens
+(trade filters, funds history, planner). Enabled with --replica or TRADECLI_REPLICA=1.
+
+The replica is a :memory: copy taken with the SQLite backup API. Writes still go to
+the database file; before every read the replica checks the file's PRAGMA data_version
+and, when it moved, applies the journal entries written since (see journal.py), so the
+rollup triggers in the copy keep its totals current too. A change without new journal
+entries (rollup or journal rebuilds) or with different exchange rates reloads the whole copy.
+"""
+from __future__ import annotations
+import os
+import sqlite3
+import journal
+import profiler
+
+_enabled = False
+_replicas = {}
+
+class Replica:
+    """
+    A :memory: copy of one database file and the journal seq it has applied up to.
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.disk = profiler.connect(db_path)
+        self.conn = profiler.connect(":memory:")
+        self.version = None
+        self.seq = 0
+        self.fx = None
+        self.reloads = 0
+        self.applied = 0
+
+    def _fx_fingerprint(self, conn: sqlite3.Connection) -> tuple:
+        return conn.execute("SELECT COUNT(*), TOTAL(rate), TOTAL(rate_date * rate) FROM FX_RATES").fetchone()
+
+    def load(self):
+        """
+        Copies the whole database file into memory.
+        """
+        self.version = self.disk.execute("PRAGMA data_version").fetchone()[0]
+        with profiler.span("replica.load", "sql"):
+            self.disk.backup(self.conn)
+        self.seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM JOURNAL").fetchone()[0]
+        self.fx = self._fx_fingerprint(self.conn)
+        self.reloads += 1
+
+    def sync(self):
+        """
+        Brings the copy up to date with the file, a no-op when nothing was committed since.
+        """
+        version = self.disk.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.version:
+            return
+        tail = journal.entries(self.disk, after=self.seq)
+        if not tail or self._fx_fingerprint(self.disk) != self.fx:
+            self.load()
+            return
+        try:
+            with profiler.span("replica.apply", "sql", entries=len(tail)):
+                for entry in tail:
+                    journal.write_changes(self.conn, entry.changes)
+                self.conn.commit()
+        except (journal.JournalError, sqlite3.Error):
+            # The copy no longer matches the journal's before images
+            self.conn.rollback()
+            self.load()
+            return
+        self.version = version
+        self.seq = tail[-1].seq
+        self.applied += len(tail)
+
+    def close(self):
+        self.conn.close()
+        self.disk.close()
+
+def configure(argv: list) -> list:
+    """
+    Enables the replica from the environment or a --replica argument.
+    Returns argv without it.
+    """
+    global _enabled
+    _enabled = os.environ.get('TRADECLI_REPLICA', '') not in ('', '0') or '--replica' in argv
+    return [arg for arg in argv if arg != '--replica']
+
+def enable(enabled: bool = True):
+    global _enabled
+    _enabled = enabled
+
+def enabled() -> bool:
+    return _enabled
+
+def get(db_path: str) -> Replica:
+    """
+    The synced replica of a database file, loaded on first use.
+    """
+    replica = _replicas.get(db_path)
+    if replica is None:
+        replica = Replica(db_path)
+        replica.load()
+        _replicas[db_path] = replica
+    else:
+        replica.sync()
+    return replica
+
+def version(conn: sqlite3.Connection) -> int | None:
+    """
+    The file data_version a replica connection was last synced to, None for other connections.
+    A replica's own PRAGMA data_version does not move when it applies changes itself.
+    """
+    for replica in _replicas.values():
+        if replica.conn is conn:
+            return replica.version
+    return None
+
+def close(db_path: str):
+    replica = _replicas.pop(db_path, None)
+    if replica is not None:
+        replica.close()
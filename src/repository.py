@@ -0,0 +1,243 @@
+"""
+Typed records for TRADES and FUNDS rows and the queries that load them.
+
+Records are slotted dataclasses, so fields are read by name instead of tuple position and
+large histories cost no per-row __dict__. Queries select only the columns a record needs
+and cursors stream rows through a row factory instead of building a list of tuples first.
+
+Money is stored as integer minor units, prices in 1/10000 and amounts in cents, with whole
+share quantities, so SUM() is exact and stays on SQLite's integer path. This module is the
+boundary: projections divide back to floats in the SELECT and writes go through to_price()
+and to_amount(). Aggregates sum the stored integers and convert once, see amount_sql().
+"""
+from __future__ import annotations
+import re
+import sqlite3
+from dataclasses import dataclass, fields
+from typing import Iterator
+
+PRICE_SCALE = 10_000
+AMOUNT_SCALE = 100
+
+# Stored column -> units per dollar
+SCALES = {
+    'price': PRICE_SCALE,
+    'closed_position_price': PRICE_SCALE,
+    'fired_price': PRICE_SCALE,
+    'fees': AMOUNT_SCALE,
+    'vat': AMOUNT_SCALE,
+    'cost_value': AMOUNT_SCALE,
+    'profit_loss': AMOUNT_SCALE,
+    'closed_position_amount': AMOUNT_SCALE,
+    'amount_SAR': AMOUNT_SCALE,
+    'amount_USD': AMOUNT_SCALE,
+}
+
+def scaled(value: float | None, scale: int) -> int | None:
+    """
+    value in integer units of 1/scale, rounded half away from zero like SQLite's ROUND().
+    """
+    if value is None:
+        return None
+    units = float(value) * scale
+    return int(units + 0.5) if units >= 0 else int(units - 0.5)
+
+def to_price(value: float | None) -> int | None:
+    return scaled(value, PRICE_SCALE)
+
+def to_amount(value: float | None) -> int | None:
+    return scaled(value, AMOUNT_SCALE)
+
+def to_shares(value) -> int:
+    """
+    A share quantity as an int, refusing fractions.
+    """
+    shares = float(value)
+    if not shares.is_integer():
+        raise ValueError(f"Share quantity must be whole: {value}")
+    return int(shares)
+
+def to_storage(values: dict) -> dict:
+    """
+    A row of dollar amounts (as stored before the integer migration) in stored units.
+    """
+    stored = dict(values)
+    for name, scale in SCALES.items():
+        if name in stored:
+            stored[name] = scaled(stored[name], scale)
+    if stored.get('filled_qty') is not None:
+        stored['filled_qty'] = scaled(stored['filled_qty'], 1)
+    return stored
+
+def _from_units(expression: str, scale: int) -> str:
+    if not re.fullmatch(r"[\w.]+", expression):
+        expression = f"({expression})"
+    return f"{expression} / {scale}.0"
+
+def price_sql(expression: str) -> str:
+    """
+    SQL converting an expression in stored price units to dollars.
+    """
+    return _from_units(expression, PRICE_SCALE)
+
+def amount_sql(expression: str) -> str:
+    """
+    SQL converting an expression in cents, such as SUM(cost_value), to dollars.
+    """
+    return _from_units(expression, AMOUNT_SCALE)
+
+def column_sql(name: str, alias: str | None = None) -> str:
+    """
+    A stored column as selected into a record, converted to dollars when it holds money.
+    """
+    column = f"{alias}.{name}" if alias else name
+    if name in SCALES:
+        return f"{_from_units(column, SCALES[name])} AS {name}"
+    return column
+
+@dataclass(slots=True)
+class Trade:
+    ID: int
+    trade_date: str
+    symbol: str
+    opr: str
+    filled_qty: int
+    price: float
+    fees: float = 0.0
+    vat: float = 0.0
+    cost_value: float = 0.0
+    profit_loss: float | None = 0.0
+    is_position_open: int = 0
+    closed_position_price: float | None = None
+    closed_position_amount: float | None = None
+
+    @property
+    def is_buy(self) -> bool:
+        return self.opr.lower() == 'buy'
+
+    @property
+    def is_open(self) -> bool:
+        return self.is_position_open == 1
+
+@dataclass(slots=True)
+class Lot:
+    """
+    An open position, the columns the dashboard, planner and sell menu work with.
+    """
+    ID: int
+    trade_date: str
+    symbol: str
+    opr: str
+    filled_qty: int
+    price: float
+    cost_value: float
+    profit_loss: float | None
+
+    @property
+    def is_buy(self) -> bool:
+        return self.opr.lower() == 'buy'
+
+@dataclass(slots=True)
+class Holding:
+    """
+    Net position per symbol. price is the highest buy price until a current price is known.
+    total_cost is net of sale proceeds; the cost basis of a sell is avg_buy_cost, from the buys alone.
+    """
+    symbol: str
+    net_shares: int
+    total_cost: float
+    profit: float
+    price: float
+    buy_qty: int = 0
+    buy_cost: float = 0.0
+
+    @property
+    def avg_buy_cost(self) -> float:
+        return self.buy_cost / self.buy_qty if self.buy_qty else 0.0
+
+@dataclass(slots=True)
+class Fund:
+    ID: int
+    opr: str
+    fund_date: str
+    source: str
+    amount_SAR: float
+    amount_USD: float
+    rate_exchange: float
+
+def columns(record_type: type) -> list[str]:
+    return [f.name for f in fields(record_type)]
+
+def projection(record_type: type, alias: str | None = None) -> str:
+    """
+    SELECT list for record_type, see column_sql().
+    """
+    return ", ".join(column_sql(name, alias) for name in columns(record_type))
+
+def row_factory(record_type: type, names: list[str] | None = None):
+    """
+    sqlite3 row factory building record_type from rows holding the given columns.
+    Rows in field order are passed positionally, anything else by name.
+    """
+    if names is None or names == columns(record_type)[:len(names)]:
+        return lambda cursor, row: record_type(*row)
+    return lambda cursor, row: record_type(**dict(zip(names, row)))
+
+def select(conn: sqlite3.Connection, record_type: type, sql: str, params=(), names: list[str] | None = None) -> sqlite3.Cursor:
+    """
+    Executes sql on a new cursor whose rows come back as record_type.
+    Iterate the cursor to stream, or call fetchall()/fetchone().
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory(record_type, names)
+    return cursor.execute(sql, params)
+
+TRADE_SQL = f"SELECT {projection(Trade)} FROM TRADES"
+LOT_SQL = f"SELECT {projection(Lot)} FROM TRADES"
+FUND_SQL = f"SELECT {projection(Fund)} FROM FUNDS"
+
+# Per-symbol sums come from the trigger-maintained rollup (see rollup.py)
+HOLDINGS_SQL = f"""
+    SELECT symbol,
+    buy_qty - sell_qty as net_shares,
+    {amount_sql('buy_cost - sell_cost')} as total_cost,
+    {amount_sql('realized_pl')} as profit,
+    (SELECT {price_sql('MAX(price)')} FROM (
+        SELECT MAX(price) AS price FROM TRADES t2 WHERE t2.symbol = r.symbol AND opr = 'buy'
+        UNION ALL
+        SELECT MAX(price) FROM TRADES_ARCHIVE a WHERE a.symbol = r.symbol AND opr = 'buy'
+    )) as last_price,
+    buy_qty,
+    {amount_sql('buy_cost')} as buy_cost
+    FROM SYMBOL_ROLLUP r
+    WHERE buy_qty - sell_qty != 0
+    ORDER BY symbol
+"""
+
+def get_trade(conn: sqlite3.Connection, trade_id: int) -> Trade | None:
+    return select(conn, Trade, f"{TRADE_SQL} WHERE ID = ?", (trade_id,)).fetchone()
+
+def iter_trades(conn: sqlite3.Connection, where: str = "1", params=(), order: str = "ID") -> Iterator[Trade]:
+    return select(conn, Trade, f"{TRADE_SQL} WHERE {where} ORDER BY {order}", params)
+
+def open_lots(conn: sqlite3.Connection, symbols: list | None = None, opr: str | None = None) -> list[Lot]:
+    """
+    Open positions ordered by price, optionally limited to some symbols or one side.
+    """
+    clauses = ["is_position_open = 1"]
+    params = []
+    if symbols is not None:
+        if not symbols:
+            return []
+        clauses.append(f"symbol IN ({','.join('?' * len(symbols))})")
+        params.extend(symbols)
+    if opr is not None:
+        clauses.append("opr = ?")
+        params.append(opr)
+    return select(conn, Lot, f"{LOT_SQL} WHERE {' AND '.join(clauses)} ORDER BY price", params).fetchall()
+
+def holdings(conn: sqlite3.Connection) -> list[Holding]:
+    return select(conn, Holding, HOLDINGS_SQL).fetchall()
+
+def iter_funds(conn: sqlite3.Connection, order: str = "ID") -> Iterator[Fund]:
+    return select(conn, Fund, f"{FUND_SQL} ORDER BY {order}")
@@ -0,0 +1,339 @@
+"""
+Money-weighted returns (XIRR) from the dated cash flows of an account, where the dashboard's
+P/L % of funds ignores when the money came in.
+
+- Account: deposits in, withdrawals out, the net worth today (holdings at the current
+  prices, cash and dividends received) as the final flow.
+- Symbol: buys in, sells and dividends out, the shares held at the current price today.
+- Year: the book at the start of the year in, the year's deposits and withdrawals, the book
+  at its end out. Past year ends have no prices, so every year is valued at cost (net funds
+  plus realized P/L and dividends) and the years show realized returns.
+
+Flows are summed per day in SQL (TRADES per trade day, archived trades from ARCHIVE_ROLLUP)
+and solved for every series at once: Newton steps on all rows of a padded matrix, with
+bisection in a bracket for the rows Newton leaves unconverged. Rates are annualized, NaN when
+a series has no sign change (nothing to solve) or no rate in the bracket.
+"""
+from __future__ import annotations
+import os
+import sqlite3
+from dataclasses import dataclass
+from datetime import date, datetime
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+import migrate
+import profiler
+import repository
+from repository import AMOUNT_SCALE, amount_sql, to_amount
+from settings import Settings
+from utils import date_key_sql, get_db_path
+
+DAYS_PER_YEAR = 365.0
+# Solved for x = ln(1 + rate): rates from -99.995% to about 2,200,000% a year
+X_LIMIT = 10.0
+NEWTON_STEPS = 50
+BISECT_STEPS = 100
+TOLERANCE = 1e-10
+
+@dataclass
+class Flows:
+    """
+    Cash flows of several series, one row each, padded with zero flows on the row's first day.
+    Amounts are dollars from the investor's side: money put in is negative.
+    """
+    names: list
+    days: np.ndarray
+    amounts: np.ndarray
+
+    def xirr(self) -> np.ndarray:
+        return xirr(self.days, self.amounts)
+
+def key_days(date_keys) -> np.ndarray:
+    """
+    YYYYMMDD keys to days since 1970-01-01.
+    """
+    keys = np.asarray(date_keys, dtype=np.int64)
+    months = (keys // 10000 - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (keys // 100 % 100 - 1)
+    return (months.astype('datetime64[D]') + (keys % 100 - 1)).astype(np.int64)
+
+def _npv(x: np.ndarray, years: np.ndarray, amounts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    discount = np.exp(-x[:, None] * years)
+    return (amounts * discount).sum(axis=1), -(amounts * years * discount).sum(axis=1)
+
+def xirr(days, amounts, guess: float = 0.1) -> np.ndarray:
+    """
+    The annual rate of each row of a (series, flows) matrix: the rate at which its flows,
+    discounted from their day to the row's first day, sum to zero.
+    """
+    days = np.asarray(days, dtype=np.float64)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    if amounts.size == 0:
+        return np.full(len(amounts), np.nan)
+    years = (days - days[:, :1]) / DAYS_PER_YEAR
+    # Scaled to the largest flow of the row, so one tolerance fits every account size
+    scale = np.abs(amounts).max(axis=1, keepdims=True)
+    amounts = amounts / np.where(scale > 0, scale, 1.0)
+    solvable = (amounts > 0).any(axis=1) & (amounts < 0).any(axis=1)
+
+    x = np.full(len(amounts), np.log1p(guess))
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for _ in range(NEWTON_STEPS):
+            value, slope = _npv(x, years, amounts)
+            step = np.where(slope != 0, value / slope, 0.0)
+            x = np.clip(x - np.nan_to_num(step), -X_LIMIT, X_LIMIT)
+            if np.all(np.abs(step[solvable]) < TOLERANCE):
+                break
+        value, _ = _npv(x, years, amounts)
+        missed = solvable & ~(np.abs(value) < 1e-9)
+        if missed.any():
+            x[missed] = _bisect(years[missed], amounts[missed])
+    rates = np.expm1(x)
+    rates[~solvable] = np.nan
+    return rates
+
+def _bisect(years: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+    """
+    Rows Newton did not solve, halving [-X_LIMIT, X_LIMIT]. NaN without a sign change in it.
+    """
+    low = np.full(len(amounts), -X_LIMIT)
+    high = np.full(len(amounts), X_LIMIT)
+    low_value, _ = _npv(low, years, amounts)
+    high_value, _ = _npv(high, years, amounts)
+    bracketed = np.sign(low_value) != np.sign(high_value)
+    for _ in range(BISECT_STEPS):
+        middle = (low + high) / 2
+        value, _ = _npv(middle, years, amounts)
+        lower_half = np.sign(value) != np.sign(low_value)
+        high = np.where(lower_half, middle, high)
+        low = np.where(lower_half, low, middle)
+        low_value = np.where(lower_half, low_value, value)
+    return np.where(bracketed, (low + high) / 2, np.nan)
+
+def pad(names: list, series: np.ndarray, days: np.ndarray, amounts: np.ndarray) -> Flows:
+    """
+    Flows from (series index, day, amount) rows, summed per series and day.
+    """
+    order = np.lexsort((days, series))
+    series, days, amounts = series[order], days[order], amounts[order]
+    first = np.r_[True, (series[1:] != series[:-1]) | (days[1:] != days[:-1])]
+    group = np.cumsum(first) - 1
+    series, days = series[first], days[first]
+    amounts = np.bincount(group, weights=amounts)
+    counts = np.bincount(series, minlength=len(names))
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    width = max(int(counts.max()) if len(counts) else 0, 1)
+    column = np.arange(len(series)) - starts[series]
+    day_matrix = np.repeat(days[starts].reshape(-1, 1) if len(series) else np.zeros((len(names), 1), dtype=np.int64), width, axis=1)
+    amount_matrix = np.zeros((len(names), width))
+    day_matrix[series, column] = days
+    amount_matrix[series, column] = amounts
+    return Flows(names, day_matrix, amount_matrix)
+
+def _rows(conn: sqlite3.Connection, sql: str, params=()) -> tuple:
+    rows = conn.execute(sql, params).fetchall()
+    return tuple(np.asarray(column) for column in zip(*rows)) if rows else None
+
+def _fund_flows(conn: sqlite3.Connection) -> tuple | None:
+    """
+    (day key, net deposit) per fund day.
+    """
+    return _rows(conn, f"""
+        SELECT CAST({date_key_sql('fund_date')} AS INTEGER), {amount_sql("SUM(CASE WHEN opr = 'deposit' THEN amount_USD ELSE -amount_USD END)")}
+        FROM FUNDS GROUP BY 1 ORDER BY 1
+    """)
+
+def _dividends(conn: sqlite3.Connection) -> tuple | None:
+    return _rows(conn, f"SELECT symbol, CAST({date_key_sql('pay_date')} AS INTEGER), {amount_sql('SUM(amount_USD)')} FROM DIVIDENDS GROUP BY 1, 2")
+
+def market_values(conn: sqlite3.Connection, current_prices: dict) -> dict:
+    """
+    Value of each holding at its current price, or the highest buy price without one.
+    """
+    return {holding.symbol: holding.net_shares * current_prices.get(holding.symbol, holding.price) for holding in repository.holdings(conn)}
+
+def net_worth(conn: sqlite3.Connection, current_prices: dict) -> tuple[float, float]:
+    """
+    (net deposits, holdings + cash + dividends received).
+    """
+    funds, cost = conn.execute(f"""
+        SELECT (SELECT {amount_sql("COALESCE(SUM(CASE WHEN opr = 'deposit' THEN amount_USD ELSE -amount_USD END), 0)")} FROM FUNDS),
+               (SELECT {amount_sql('COALESCE(SUM(buy_cost - sell_cost), 0)')} FROM SYMBOL_ROLLUP)
+    """).fetchone()
+    dividends = conn.execute(f"SELECT {amount_sql('COALESCE(SUM(amount_USD), 0)')} FROM DIVIDENDS").fetchone()[0]
+    return funds, sum(market_values(conn, current_prices).values()) + funds - cost + dividends
+
+def today_key() -> int:
+    return int(date.today().strftime("%Y%m%d"))
+
+def account_flows(conn: sqlite3.Connection, name: str, current_prices: dict, as_of: int | None = None) -> Flows:
+    funds = _fund_flows(conn)
+    _, worth = net_worth(conn, current_prices)
+    keys, amounts = (funds[0], -funds[1]) if funds else (np.empty(0, dtype=np.int64), np.empty(0))
+    keys = np.r_[keys, as_of or today_key()]
+    amounts = np.r_[amounts, worth]
+    return pad([name], np.zeros(len(keys), dtype=np.int64), key_days(keys), amounts)
+
+def symbol_flows(conn: sqlite3.Connection, current_prices: dict, as_of: int | None = None) -> Flows:
+    # One row per trade, in cents: a GROUP BY per symbol and day costs more than summing in pad()
+    trades = _rows(conn, f"""
+        SELECT symbol, CAST({date_key_sql('trade_date')} AS INTEGER), CASE WHEN opr = 'sell' THEN cost_value ELSE -cost_value END
+        FROM TRADES
+        UNION ALL
+        SELECT symbol, day, sell_cost - buy_cost FROM ARCHIVE_ROLLUP
+    """)
+    parts = [(trades[0], trades[1], trades[2] / AMOUNT_SCALE)] if trades is not None else []
+    dividends = _dividends(conn)
+    if dividends is not None:
+        parts.append(dividends)
+    values = market_values(conn, current_prices)
+    if values:
+        parts.append((np.asarray(list(values)), np.full(len(values), as_of or today_key()), np.asarray(list(values.values()), dtype=np.float64)))
+    if not parts:
+        return Flows([], np.zeros((0, 1), dtype=np.int64), np.zeros((0, 1)))
+    symbols, keys, amounts = (np.concatenate(column) for column in zip(*parts))
+    names, series = np.unique(symbols, return_inverse=True)
+    return pad(names.tolist(), series, key_days(keys), amounts.astype(np.float64))
+
+def year_flows(conn: sqlite3.Connection, as_of: int | None = None) -> tuple[Flows, np.ndarray, np.ndarray]:
+    """
+    One row per calendar year from the first deposit, with the book at cost at its start and end.
+    """
+    as_of = as_of or today_key()
+    funds = _fund_flows(conn)
+    if funds is None:
+        return Flows([], np.zeros((0, 1), dtype=np.int64), np.zeros((0, 1))), np.empty(0), np.empty(0)
+    # Only the book at year ends is needed, so realized P/L per month from the rollup will do,
+    # dated on the 1st so the current month counts at today
+    realized = _rows(conn, f"SELECT month * 100 + 1, {amount_sql('SUM(realized_pl)')} FROM MONTH_ROLLUP GROUP BY month")
+    dividends = _dividends(conn)
+    # Book at cost after each event day: net funds plus realized P/L and dividends
+    event_keys = np.concatenate([funds[0]] + [part[-2] for part in (realized, dividends) if part is not None])
+    event_amounts = np.concatenate([funds[1]] + [part[-1].astype(np.float64) for part in (realized, dividends) if part is not None])
+    order = np.argsort(event_keys, kind='stable')
+    event_keys, book = event_keys[order], np.cumsum(event_amounts[order])
+
+    def book_at(key: int) -> float:
+        index = np.searchsorted(event_keys, key, side='right') - 1
+        return float(book[index]) if index >= 0 else 0.0
+
+    years = list(range(int(funds[0][0]) // 10000, as_of // 10000 + 1))
+    series, keys, amounts, starts, ends = [], [], [], [], []
+    fund_years = funds[0] // 10000
+    for row, year in enumerate(years):
+        start, end = year * 10000 + 101, min(year * 10000 + 1231, as_of)
+        in_year = fund_years == year
+        row_keys = [start, *funds[0][in_year].tolist(), end]
+        row_amounts = [-book_at(start - 1), *(-funds[1][in_year]).tolist(), book_at(end)]
+        series += [row] * len(row_keys)
+        keys += row_keys
+        amounts += row_amounts
+        starts.append(-row_amounts[0])
+        ends.append(row_amounts[-1])
+    flows = pad([str(year) for year in years], np.asarray(series), key_days(keys), np.asarray(amounts, dtype=np.float64))
+    return flows, np.asarray(starts), np.asarray(ends)
+
+def symbol_totals(conn: sqlite3.Connection) -> dict:
+    """
+    (bought, sold + dividends) per symbol, archived trades included.
+    """
+    totals = {symbol: [bought, sold] for symbol, bought, sold in conn.execute(f"SELECT symbol, {amount_sql('buy_cost')}, {amount_sql('sell_cost')} FROM SYMBOL_ROLLUP")}
+    for symbol, _, amount in zip(*(_dividends(conn) or ((), (), ()))):
+        totals.setdefault(symbol, [0.0, 0.0])[1] += amount
+    return totals
+
+def add_dividend(conn: sqlite3.Connection, pay_date: str, symbol: str, amount: float):
+    """
+    A dividend received, in dollars after withholding tax. The caller commits.
+    """
+    conn.execute("INSERT INTO DIVIDENDS (pay_date, symbol, amount_USD) VALUES (?, ?, ?)", (pay_date, symbol, to_amount(amount)))
+
+def rate_text(rate: float) -> str:
+    if np.isnan(rate):
+        return "[dim]-[/dim]"
+    rate = round(float(rate), 6) + 0.0
+    return f"[red]{rate:.2%}[/red]" if rate < 0 else f"[green]{rate:.2%}[/green]"
+
+def accounts_table(settings: Settings, current_prices: dict) -> Table:
+    """
+    XIRR of every account next to its P/L as a share of net deposits, as the dashboard counts it.
+    """
+    table = Table(title="Money-Weighted Return per Account (XIRR)")
+    table.add_column("Account", style="cyan")
+    table.add_column("Net Deposits", justify="right")
+    table.add_column("Net Worth", justify="right", style="yellow")
+    table.add_column("P/L", justify="right")
+    table.add_column("P/L % of Funds", justify="right")
+    table.add_column("XIRR / year", justify="right")
+    for account in settings.accounts:
+        db_path = get_db_path(account.name)
+        if not os.path.exists(db_path):
+            continue
+        # Accounts not opened since DIVIDENDS was added get it first, as consolidated totals do
+        migrate.ensure_schema(account.name)
+        conn = profiler.connect(db_path)
+        try:
+            funds, worth = net_worth(conn, current_prices)
+            rate = account_flows(conn, account.name, current_prices).xirr()[0]
+        except sqlite3.Error:
+            continue
+        finally:
+            conn.close()
+        pl = worth - funds
+        pl_text = f"[red]${pl:,.2f}[/red]" if pl < 0 else f"${pl:,.2f}"
+        table.add_row(account.name, f"${funds:,.2f}", f"${worth:,.2f}", pl_text, f"{pl / funds:.2%}" if funds else "-", rate_text(rate))
+    return table
+
+def years_table(flows: Flows, starts: np.ndarray, ends: np.ndarray) -> Table:
+    table = Table(title="XIRR per Year (book at cost, realized P/L)")
+    table.add_column("Year", style="cyan")
+    table.add_column("Start", justify="right")
+    table.add_column("Net Deposits", justify="right")
+    table.add_column("End", justify="right", style="yellow")
+    table.add_column("XIRR", justify="right")
+    for name, row, start, end, rate in zip(flows.names, flows.amounts, starts, ends, flows.xirr()):
+        deposits = end - start - row.sum()
+        table.add_row(name, f"${start:,.2f}", f"${deposits:,.2f}", f"${end:,.2f}", rate_text(rate))
+    return table
+
+def symbols_table(flows: Flows, totals: dict, values: dict) -> Table:
+    table = Table(title="Money-Weighted Return per Symbol (XIRR)")
+    table.add_column("Symbol", style="cyan")
+    table.add_column("Bought", justify="right")
+    table.add_column("Sold + Dividends", justify="right")
+    table.add_column("Value", justify="right", style="yellow")
+    table.add_column("XIRR / year", justify="right")
+    rates = flows.xirr()
+    for index in np.argsort(-np.nan_to_num(rates, nan=-np.inf), kind='stable'):
+        name = flows.names[index]
+        bought, returned = totals.get(name, (0.0, 0.0))
+        value = values.get(name, 0.0)
+        table.add_row(name, f"${bought:,.2f}", f"${returned:,.2f}", f"${value:,.2f}" if value else "", rate_text(rates[index]))
+    return table
+
+def returns_menu(settings: Settings, current_prices: dict):
+    console = Console()
+    conn = profiler.connect(get_db_path(settings.default_account))
+    try:
+        console.print(accounts_table(settings, current_prices))
+        console.print(years_table(*year_flows(conn)))
+        console.print(symbols_table(symbol_flows(conn, current_prices), symbol_totals(conn), market_values(conn, current_prices)))
+        console.print("[dim]Holdings are valued at the current prices, or their highest buy price when none was entered.[/dim]")
+        console.print("[blue]Returns:[/blue] D [dim]record a dividend[/dim] or Enter [dim]to go back[/dim]")
+        if input("Enter choice: ").strip().lower() == 'd':
+            symbol = input("Enter ticker symbol: ").strip().upper()
+            amount = float(input("Enter amount received in USD (after tax): ").strip())
+            pay_date = input("Enter Pay Date (DD/MM/YYYY) = ").strip() or date.today().strftime("%d/%m/%Y")
+            # Stored zero-padded, the date keys read fixed SUBSTR offsets
+            pay_date = datetime.strptime(pay_date, "%d/%m/%Y").strftime("%d/%m/%Y")
+            add_dividend(conn, pay_date, symbol, amount)
+            conn.commit()
+            console.print("[green]Dividend saved.[/green]")
+    except ValueError as e:
+        console.print(f"[red]Invalid input: {e}[/red]")
+    except sqlite3.Error as e:
+        conn.rollback()
+        console.print(f"[red]Error: {e}[/red]")
+    finally:
+        conn.close()
+    input("Press Enter to continue...")
@@ -0,0 +1,172 @@
+"""
+Per-symbol and per-month rollups of TRADES, kept up to date by triggers.
+
+Every insert adds the row's contribution to SYMBOL_ROLLUP and MONTH_ROLLUP, every delete
+subtracts it and an update does both, so dashboard totals, holdings and the monthly report
+read one row per symbol or per month instead of aggregating every trade. check() compares
+the rollups against a fresh aggregation of TRADES and rebuild() recomputes them.
+
+TRADES_ARCHIVE feeds the same rollups, so archived trades keep counting in the totals.
+DAY_ROLLUP (live trades) and ARCHIVE_ROLLUP (archived ones) keep per symbol and day sums for
+conversion at each trade date's exchange rate.
+
+Amounts are kept in the stored integer units (cents, see repository.py), so the running
+sums never drift and check() compares them exactly.
+"""
+from __future__ import annotations
+import sqlite3
+from repository import amount_sql
+
+# Rollup column -> contribution of one TRADES row, {r} being NEW, OLD or the TRADES table
+METRICS = {
+    'buy_count': "CASE WHEN {r}.opr = 'buy' THEN 1 ELSE 0 END",
+    'sell_count': "CASE WHEN {r}.opr = 'sell' THEN 1 ELSE 0 END",
+    'buy_qty': "CASE WHEN {r}.opr = 'buy' THEN {r}.filled_qty ELSE 0 END",
+    'sell_qty': "CASE WHEN {r}.opr = 'sell' THEN {r}.filled_qty ELSE 0 END",
+    'buy_cost': "CASE WHEN {r}.opr = 'buy' THEN COALESCE({r}.cost_value, 0) ELSE 0 END",
+    'sell_cost': "CASE WHEN {r}.opr = 'sell' THEN COALESCE({r}.cost_value, 0) ELSE 0 END",
+    'realized_pl': "COALESCE({r}.profit_loss, 0)",
+    'fees': "{r}.fees",
+    'vat': "{r}.vat",
+}
+
+# Rollup table -> its key columns (and their value for a trade row) and the tables it sums
+ROLLUPS = {
+    'SYMBOL_ROLLUP': ({'symbol': "{r}.symbol"}, ('TRADES', 'TRADES_ARCHIVE')),
+    'MONTH_ROLLUP': ({'month': "CAST(SUBSTR({r}.trade_date, 7, 4) || SUBSTR({r}.trade_date, 4, 2) AS INTEGER)", 'symbol': "{r}.symbol"}, ('TRADES', 'TRADES_ARCHIVE')),
+    'DAY_ROLLUP': ({'day': "CAST(SUBSTR({r}.trade_date, 7, 4) || SUBSTR({r}.trade_date, 4, 2) || SUBSTR({r}.trade_date, 1, 2) AS INTEGER)", 'symbol': "{r}.symbol"}, ('TRADES',)),
+    'ARCHIVE_ROLLUP': ({'day': "CAST(SUBSTR({r}.trade_date, 7, 4) || SUBSTR({r}.trade_date, 4, 2) || SUBSTR({r}.trade_date, 1, 2) AS INTEGER)", 'symbol': "{r}.symbol"}, ('TRADES_ARCHIVE',)),
+}
+
+def _table_sql(table: str, keys: dict) -> str:
+    key_columns = ", ".join(f"{key} {'TEXT' if key == 'symbol' else 'INTEGER'} NOT NULL" for key in keys)
+    metric_columns = ", ".join(f"{metric} INTEGER NOT NULL DEFAULT 0" for metric in METRICS)
+    return f"CREATE TABLE IF NOT EXISTS {table} ({key_columns}, {metric_columns}, PRIMARY KEY ({', '.join(keys)})) WITHOUT ROWID;\n"
+
+def _add_sql(table: str, keys: dict, r: str) -> str:
+    columns = list(keys) + list(METRICS)
+    values = [expression.format(r=r) for expression in list(keys.values()) + list(METRICS.values())]
+    updates = ", ".join(f"{metric} = {metric} + excluded.{metric}" for metric in METRICS)
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(values)}) ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates};"
+
+def _subtract_sql(table: str, keys: dict, r: str) -> str:
+    where = " AND ".join(f"{key} = {expression.format(r=r)}" for key, expression in keys.items())
+    updates = ", ".join(f"{metric} = {metric} - ({expression.format(r=r)})" for metric, expression in METRICS.items())
+    return (f"UPDATE {table} SET {updates} WHERE {where};\n"
+            f"        DELETE FROM {table} WHERE {where} AND buy_count = 0 AND sell_count = 0;")
+
+def _schema_sql() -> str:
+    sql = ""
+    for table, (keys, _) in ROLLUPS.items():
+        sql += _table_sql(table, keys)
+    for source in ('TRADES', 'TRADES_ARCHIVE'):
+        rollups = [(table, keys) for table, (keys, sources) in ROLLUPS.items() if source in sources]
+        add = "\n        ".join(_add_sql(table, keys, "NEW") for table, keys in rollups)
+        subtract = "\n        ".join(_subtract_sql(table, keys, "OLD") for table, keys in rollups)
+        prefix = source.lower()
+        sql += f"""
+CREATE TRIGGER IF NOT EXISTS {prefix}_rollup_insert AFTER INSERT ON {source} BEGIN
+        {add}
+END;
+CREATE TRIGGER IF NOT EXISTS {prefix}_rollup_delete AFTER DELETE ON {source} BEGIN
+        {subtract}
+END;
+CREATE TRIGGER IF NOT EXISTS {prefix}_rollup_update AFTER UPDATE ON {source} BEGIN
+        {subtract}
+        {add}
+END;
+"""
+    return sql
+
+schema_rollup_sql = _schema_sql()
+
+def _aggregate_sql(table: str) -> str:
+    """
+    The rollup recomputed from the tables it sums, in the rollup's column order.
+    """
+    keys, sources = ROLLUPS[table]
+    key_values = [expression.format(r="t") for expression in keys.values()]
+    metrics = [f"SUM({expression.format(r='t')})" for expression in METRICS.values()]
+    source = " UNION ALL ".join(f"SELECT * FROM {source}" for source in sources)
+    return f"SELECT {', '.join(key_values + metrics)} FROM ({source}) t GROUP BY {', '.join(str(i + 1) for i in range(len(keys)))}"
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """
+    Recomputes every rollup from TRADES and TRADES_ARCHIVE. Returns the number of rollup rows. The caller commits.
+    """
+    rows = 0
+    for table in ROLLUPS:
+        conn.execute(f"DELETE FROM {table}")
+        rows += conn.execute(f"INSERT INTO {table} {_aggregate_sql(table)}").rowcount
+    return rows
+
+def stale_triggers(conn: sqlite3.Connection) -> list[str]:
+    """
+    Rollup triggers created by an older schema that do not feed every rollup of their table yet.
+    """
+    stale = []
+    for source in ('TRADES', 'TRADES_ARCHIVE'):
+        tables = [table for table, (_, sources) in ROLLUPS.items() if source in sources]
+        names = [f"{source.lower()}_rollup_{event}" for event in ('insert', 'delete', 'update')]
+        for name, sql in conn.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({', '.join('?' * len(names))})", names):
+            if any(table not in sql for table in tables):
+                stale.append(name)
+    return stale
+
+def ensure(conn: sqlite3.Connection):
+    """
+    Fills the rollups of a database that had trades before the triggers existed, and replaces
+    the triggers of an older schema, refilling the rollups they did not feed.
+    """
+    stale = stale_triggers(conn)
+    for name in stale:
+        conn.execute(f"DROP TRIGGER {name}")
+    if stale:
+        conn.executescript(schema_rollup_sql)
+    if stale or (conn.execute("SELECT 1 FROM SYMBOL_ROLLUP LIMIT 1").fetchone() is None and conn.execute("SELECT 1 FROM TRADES LIMIT 1").fetchone()):
+        rebuild(conn)
+        conn.commit()
+
+def check(conn: sqlite3.Connection) -> list[str]:
+    """
+    Rollup rows that differ from a fresh aggregation of the trades, as 'TABLE key: column' strings.
+    """
+    differences = []
+    for table, (keys, _) in ROLLUPS.items():
+        key_count = len(keys)
+        stored = {row[:key_count]: row[key_count:] for row in conn.execute(f"SELECT {', '.join(list(keys) + list(METRICS))} FROM {table}")}
+        fresh = {row[:key_count]: row[key_count:] for row in conn.execute(_aggregate_sql(table))}
+        for key in sorted(stored.keys() | fresh.keys()):
+            label = f"{table} {'/'.join(str(part) for part in key)}"
+            if key not in stored or key not in fresh:
+                differences.append(f"{label}: {'missing' if key not in stored else 'no trades'}")
+                continue
+            for metric, stored_value, fresh_value in zip(METRICS, stored[key], fresh[key]):
+                if stored_value != fresh_value:
+                    differences.append(f"{label}: {metric} {stored_value} != {fresh_value}")
+    return differences
+
+def monthly(conn: sqlite3.Connection, symbol: str | None = None, date_from: str | None = None, date_to: str | None = None) -> list:
+    """
+    (month, buys, sells, buy_cost, sell_cost, realized_pl, fees, vat) per YYYYMM month, newest first, amounts in dollars.
+    date_from/date_to are YYYYMMDD keys (see utils.parse_date_key), only their months count.
+    """
+    clauses = []
+    params = []
+    if symbol:
+        clauses.append("symbol = ?")
+        params.append(symbol)
+    if date_from is not None:
+        clauses.append("month >= ?")
+        params.append(int(date_from[:6]))
+    if date_to is not None:
+        clauses.append("month <= ?")
+        params.append(int(date_to[:6]))
+    amounts = ", ".join(amount_sql(f"SUM({metric})") for metric in ('buy_cost', 'sell_cost', 'realized_pl', 'fees', 'vat'))
+    return conn.execute(f"""
+        SELECT month, SUM(buy_count), SUM(sell_count), {amounts}
+        FROM MONTH_ROLLUP
+        WHERE {' AND '.join(clauses) or '1'}
+        GROUP BY month
+        ORDER BY month DESC
+    """, params).fetchall()
@@ -0,0 +1,157 @@
+"""
+Read-only JSON API over the dashboard snapshot, for spreadsheets and status boards that poll:
+
+    python src/main.py serve [--port 8765]
+
+GET /holdings, /positions, /totals and /funds, ?account=name for an account other than the
+default one. The server binds to 127.0.0.1 only.
+
+Every account is served from its warm session (see session.py), whose snapshot is reloaded
+only when PRAGMA data_version moved. Each endpoint's JSON is encoded once per snapshot, so
+any number of pollers cost one database read per change instead of one per request.
+"""
+from __future__ import annotations
+import argparse
+import json
+import sqlite3
+from dataclasses import asdict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+from funds_query import FundsFilter, aggregate as aggregate_funds
+import repository
+from session import AccountSession, sessions
+from settings import Account, Settings
+from snapshot import Snapshot
+
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+def holdings_json(session: AccountSession, snapshot: Snapshot, account: Account) -> list:
+    """
+    Net position per symbol, price being the highest buy price (the server has no quotes).
+    """
+    return [asdict(holding) for holding in snapshot.tickers]
+
+def positions_json(session: AccountSession, snapshot: Snapshot, account: Account) -> list:
+    return [asdict(lot) for lot in snapshot.trades]
+
+def totals_json(session: AccountSession, snapshot: Snapshot, account: Account) -> dict:
+    return {
+        'currency': account.exchange_rate_label,
+        'rate': snapshot.fx.latest(),
+        'funds': snapshot.total_funds,
+        'funds_sec': snapshot.total_funds_sar,
+        'cost': snapshot.total_cost,
+        'cash': snapshot.total_cash,
+        'realized_pl': snapshot.all_net_profit,
+        'realized_pl_sec': sum(snapshot.realized_sec.values()),
+        'fees': snapshot.total_fees,
+        'fees_sec': snapshot.total_fees_sec,
+        'vat': snapshot.total_vat,
+        'vat_sec': snapshot.total_vat_sec,
+        'buy_trades': snapshot.total_buy_trades,
+        'sell_trades': snapshot.total_sell_trades,
+    }
+
+def funds_json(session: AccountSession, snapshot: Snapshot, account: Account) -> dict:
+    """
+    Every deposit and withdrawal with their totals, read from FUNDS when the snapshot changed.
+    """
+    return {
+        'rows': [asdict(fund) for fund in repository.iter_funds(session.conn)],
+        'totals': aggregate_funds(session.conn.cursor(), FundsFilter()),
+    }
+
+ENDPOINTS = {
+    'holdings': holdings_json,
+    'positions': positions_json,
+    'totals': totals_json,
+    'funds': funds_json,
+}
+
+class PortfolioApi:
+    """
+    Encoded endpoint bodies per account, built on first request and dropped with their snapshot.
+    """
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.bodies = {}
+        self.builds = 0
+
+    def index(self) -> bytes:
+        return json.dumps({
+            'account': self.settings.default_account,
+            'accounts': [account.name for account in self.settings.accounts],
+            'endpoints': [f"/{endpoint}" for endpoint in ENDPOINTS],
+        }).encode()
+
+    def body(self, account_name: str, endpoint: str) -> bytes:
+        settings = Settings(default_account=account_name, accounts=self.settings.accounts)
+        session = sessions.get(settings)
+        snapshot = session.refresh(settings.get_account().exchange_rate)
+        cached, bodies = self.bodies.get(account_name, (None, {}))
+        if cached is not snapshot:
+            bodies = {}
+            self.bodies[account_name] = (snapshot, bodies)
+        if endpoint not in bodies:
+            payload = ENDPOINTS[endpoint](session, snapshot, settings.get_account())
+            bodies[endpoint] = json.dumps({'account': account_name, endpoint: payload}).encode()
+            self.builds += 1
+        return bodies[endpoint]
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    GET only, other methods get http.server's 501.
+    """
+    server_version = "TradeCLI"
+
+    def do_GET(self):
+        api = self.server.api
+        url = urlsplit(self.path)
+        endpoint = url.path.strip("/")
+        account_name = parse_qs(url.query).get('account', [api.settings.default_account])[0]
+        if endpoint == "":
+            self._send(HTTPStatus.OK, api.index())
+        elif endpoint not in ENDPOINTS:
+            self._error(HTTPStatus.NOT_FOUND, f"Unknown endpoint /{endpoint}")
+        elif not api.settings.has_account(account_name):
+            self._error(HTTPStatus.NOT_FOUND, f"Unknown account {account_name}")
+        else:
+            try:
+                self._send(HTTPStatus.OK, api.body(account_name, endpoint))
+            except sqlite3.Error as e:
+                self._error(HTTPStatus.SERVICE_UNAVAILABLE, f"Database error: {e}")
+
+    def _error(self, status: HTTPStatus, message: str):
+        self._send(status, json.dumps({'error': message}).encode())
+
+    def _send(self, status: HTTPStatus, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+def make_server(settings: Settings, port: int = DEFAULT_PORT) -> HTTPServer:
+    """
+    A server on 127.0.0.1. Requests are handled one at a time on the serving thread,
+    which owns the session connections.
+    """
+    server = HTTPServer((HOST, port), ApiHandler)
+    server.api = PortfolioApi(settings)
+    return server
+
+def main(argv: list, settings: Settings):
+    parser = argparse.ArgumentParser(prog="tradecli serve", description="Serve the portfolio snapshot as JSON on localhost.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+    server = make_server(settings, args.port)
+    print(f"Serving {', '.join(f'/{endpoint}' for endpoint in ENDPOINTS)} on http://{HOST}:{args.port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
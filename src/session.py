@@ -0,0 +1,108 @@
+import sqlite3
+import profiler
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import alerts
+import migrate
+import query_cache
+import ticks
+from dashboard import OPEN_POSITIONS_PAGE_SIZE
+from paging import PageWindow
+from settings import Settings
+from snapshot import Snapshot, load_snapshot
+from utils import get_db_path
+
+@dataclass
+class AccountSession:
+    """
+    Warm per-account state: an open connection, the last dashboard snapshot,
+    fetched quotes, the ticker/price the user selected in this account, the
+    page and sort order of its open positions table and its pending alerts.
+    """
+    name: str
+    conn: sqlite3.Connection
+    selected_ticker: str
+    selected_price: float | None = None
+    current_prices: dict = field(default_factory=dict)
+    snapshot: Snapshot | None = None
+    data_version: int | None = None
+    default_rate: float | None = None
+    positions_view: PageWindow = field(default_factory=lambda: PageWindow(OPEN_POSITIONS_PAGE_SIZE))
+    alert_book: alerts.AlertBook | None = None
+
+    def refresh(self, default_rate: float) -> Snapshot:
+        """
+        Returns the snapshot, re-running the dashboard queries only when
+        the database was written to since it was taken.
+        """
+        version = query_cache.data_version(self.conn)
+        if self.snapshot is None or version != self.data_version or default_rate != self.default_rate:
+            self.snapshot = load_snapshot(self.conn.cursor(), default_rate)
+            if version != self.data_version:
+                # Alerts may have been added or deleted by another connection
+                self.alert_book = None
+            self.data_version = version
+            self.default_rate = default_rate
+        return self.snapshot
+
+    def quote(self, symbol: str, price: float) -> list[alerts.Alert]:
+        """
+        Records a fetched quote and fires the alerts it reached.
+        """
+        self.current_prices[symbol] = price
+        if self.alert_book is None:
+            self.alert_book = alerts.AlertBook.load(self.conn)
+        return alerts.check_quote(self.conn, self.alert_book, symbol, price)
+
+    def close(self):
+        self.conn.close()
+
+class SessionManager:
+    """
+    Keeps the most recently used account sessions open, evicting the least recently used.
+    """
+    def __init__(self, max_sessions: int = 4):
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+
+    def get(self, settings: Settings) -> AccountSession:
+        """
+        Session for settings.default_account, created (and migrated) on first use.
+        """
+        name = settings.default_account
+        session = self.sessions.get(name)
+        if session is not None:
+            self.sessions.move_to_end(name)
+            return session
+        migrate.check_and_migrate( settings )
+        session = AccountSession(
+            name=name,
+            conn=profiler.connect(get_db_path( name )),
+            selected_ticker=settings.get_account().selected_ticker,
+        )
+        try:
+            # Quotes of past days folded into daily bars, then the prices as of the last refresh
+            ticks.compact(session.conn, name)
+            session.current_prices.update(ticks.last_prices(session.conn, name))
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"Quote journal not read: {e}")
+        self.sessions[name] = session
+        while len(self.sessions) > self.max_sessions:
+            _, evicted = self.sessions.popitem(last=False)
+            evicted.close()
+        return session
+
+    def close(self, name: str):
+        """
+        Drops a session, needed before its database file is deleted or replaced.
+        """
+        session = self.sessions.pop(name, None)
+        if session is not None:
+            session.close()
+
+    def close_all(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+sessions = SessionManager()
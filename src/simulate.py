@@ -0,0 +1,281 @@
+"""
+What-if simulator: the Holdings and Account Totals numbers after hypothetical trades,
+worked out on a copy of the dashboard snapshot without touching the database.
+
+Candidate trades use the batch entry lines (see batch_entry.py), fees default to the
+account's fees_usd, and pass the checks of the buy and sell menus: a buy must fit in the
+cash, a sell in the shares held. A trade moves one holding and the totals: the cash by the
+buy cost or the sell proceeds, and a sell's realized P/L and the holding's cost by its basis,
+the average buy cost (every buy's cost over the shares bought) or the closed lot's cost value.
+A scenario costs its number of trades, not the size of the book.
+
+Scenario.grid() evaluates one more trade at every combination of candidate quantities and
+prices as NumPy arrays: cash, cash ratio, average cost, unrealized and realized P/L.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, replace
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+from batch_entry import BatchTrade, close_error, parse_batch, read_lines
+from dashboard import holdings_table, totals_table
+from repository import Holding
+from settings import Settings
+from snapshot import Snapshot
+from trade import buy_cost, can_afford, can_sell, sell_proceeds
+
+GRID_METRICS = {
+    'a': ('avg_cost', "Average cost"),
+    'c': ('cash_ratio', "Cash ratio"),
+    'u': ('unrealized_pl', "Unrealized P/L"),
+    'r': ('realized_pl', "Realized P/L"),
+}
+
+@dataclass
+class Grid:
+    """
+    One candidate trade at quantities (rows) x prices (columns), every array of that shape.
+    """
+    opr: str
+    symbol: str
+    quantities: np.ndarray
+    prices: np.ndarray
+    feasible: np.ndarray
+    cash: np.ndarray
+    cash_ratio: np.ndarray
+    avg_cost: np.ndarray
+    unrealized_pl: np.ndarray
+    realized_pl: np.ndarray
+
+class Scenario:
+    """
+    The snapshot's holdings at the current prices and its totals, changed by each applied trade.
+    """
+    def __init__(self, snapshot: Snapshot, current_prices: dict, fees_usd: float):
+        self.base = snapshot
+        self.fees_usd = fees_usd
+        self.rate = snapshot.fx.latest()
+        self.holdings = {holding.symbol: replace(holding, price=current_prices.get(holding.symbol, holding.price)) for holding in snapshot.tickers}
+        self.total_cost = snapshot.total_cost
+        self.realized_pl = snapshot.all_net_profit
+        self.realized_sec = dict(snapshot.realized_sec)
+        self.fees = 0.0
+        self.vat = 0.0
+        self.buys = 0
+        self.sells = 0
+        self.market_value = sum(holding.net_shares * holding.price for holding in self.holdings.values())
+        self.base_market_value = self.market_value
+        self.trades = []
+        self.lots = {lot.ID: lot for lot in snapshot.trades if lot.is_buy}
+
+    @property
+    def cash(self) -> float:
+        return self.base.total_funds - self.total_cost
+
+    def apply(self, trade: BatchTrade) -> str | None:
+        """
+        Applies a trade, or returns why the buy or sell menu would refuse it.
+        Sells closing a lot (#ID) get their P/L against its cost value, other sells against the average buy cost,
+        and take that basis, not their proceeds, off the holding's cost.
+        """
+        holding = self.holdings.get(trade.symbol) or Holding(trade.symbol, 0, 0.0, 0.0, trade.price)
+        if trade.is_buy:
+            if not can_afford(trade.cost_value, self.cash):
+                return f"Line {trade.line_no}: needs ${trade.cost_value:,.2f}, cash available ${self.cash:,.2f}"
+            shares, cost, profit = holding.net_shares + trade.filled_qty, holding.total_cost + trade.cost_value, holding.profit
+            bought = {'buy_qty': holding.buy_qty + trade.filled_qty, 'buy_cost': holding.buy_cost + trade.cost_value}
+            self.total_cost += trade.cost_value
+            self.buys += 1
+        else:
+            if trade.close_position is not None:
+                lot = self.lots.get(trade.close_position)
+                error = close_error(trade, lot, holding.net_shares)
+                if error:
+                    return error
+                del self.lots[lot.ID]
+                basis = lot.cost_value
+            elif not can_sell(trade.filled_qty, holding.net_shares):
+                return f"Line {trade.line_no}: sells {trade.filled_qty} {trade.symbol}, {holding.net_shares} held"
+            else:
+                basis = holding.avg_buy_cost * trade.filled_qty
+            trade.profit_loss = trade.cost_value - basis
+            shares, cost, profit = holding.net_shares - trade.filled_qty, holding.total_cost - basis, holding.profit + trade.profit_loss
+            bought = {}
+            self.total_cost -= trade.cost_value
+            self.realized_pl += trade.profit_loss
+            self.realized_sec[trade.symbol] = self.realized_sec.get(trade.symbol, 0.0) + trade.profit_loss * self.rate
+            self.sells += 1
+        self.market_value += (shares - holding.net_shares) * holding.price
+        self.holdings[trade.symbol] = replace(holding, net_shares=shares, total_cost=cost, profit=profit, **bought)
+        self.fees += trade.fees
+        self.vat += trade.vat
+        self.trades.append(trade)
+        return None
+
+    def prices(self) -> dict:
+        return {symbol: holding.price for symbol, holding in self.holdings.items()}
+
+    def snapshot(self) -> Snapshot:
+        """
+        A copy of the snapshot with the simulated holdings and totals, for the dashboard tables.
+        """
+        base = self.base
+        return replace(
+            base,
+            tickers=[holding for _, holding in sorted(self.holdings.items()) if holding.net_shares != 0],
+            total_cost=self.total_cost,
+            all_net_profit=self.realized_pl,
+            realized_sec=self.realized_sec,
+            total_fees=base.total_fees + self.fees,
+            total_vat=base.total_vat + self.vat,
+            total_fees_sec=base.total_fees_sec + self.fees * self.rate,
+            total_vat_sec=base.total_vat_sec + self.vat * self.rate,
+            total_buy_trades=base.total_buy_trades + self.buys,
+            total_sell_trades=base.total_sell_trades + self.sells,
+        )
+
+    def grid(self, opr: str, symbol: str, quantities, prices, fees: float | None = None) -> Grid:
+        """
+        One more trade at every quantity and price. The holding stays valued at its current
+        price, a symbol not held yet at the candidate price. Infeasible cells are computed too,
+        feasible marks the ones the buy or sell menu would accept.
+        """
+        fees = self.fees_usd if fees is None else fees
+        qty, price = np.meshgrid(np.asarray(quantities, dtype=np.float64), np.asarray(prices, dtype=np.float64), indexing='ij')
+        holding = self.holdings.get(symbol)
+        held, cost, basis = (holding.net_shares, holding.total_cost, holding.avg_buy_cost) if holding else (0, 0.0, 0.0)
+        quote = holding.price if holding else price
+        if opr == 'buy':
+            value = buy_cost(qty, price, fees, 0.0)
+            feasible = can_afford(value, self.cash)
+            shares, cost_after, cash = held + qty, cost + value, self.cash - value
+            realized = np.zeros_like(value)
+        else:
+            value = sell_proceeds(qty, price, fees, 0.0)
+            feasible = can_sell(qty, held)
+            realized = value - basis * qty
+            shares, cost_after, cash = held - qty, cost - basis * qty, self.cash + value
+        market_value = self.market_value + (shares - held) * quote
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_cost = np.where(shares != 0, cost_after / shares, np.nan)
+            cash_ratio = np.where(market_value != 0, cash / market_value, 0.0)
+        return Grid(opr, symbol, qty[:, 0], price[0], feasible, cash, cash_ratio, avg_cost, shares * quote - cost_after, realized)
+
+def parse_values(text: str) -> np.ndarray:
+    """
+    Comma separated values, or a range as start-stop:step, e.g. "10,20,50" or "240-260:5".
+    """
+    if '-' in text.strip()[1:] and ':' in text:
+        bounds, step = text.split(':')
+        start, stop = bounds.strip().split('-', 1)
+        return np.arange(float(start), float(stop) + float(step) / 2, float(step))
+    values = [float(value) for value in text.split(',') if value.strip()]
+    if not values:
+        raise ValueError("no values entered")
+    return np.asarray(values)
+
+def grid_table(grid: Grid, metric: str, title: str) -> Table:
+    table = Table(title=f"What-if {grid.opr} {grid.symbol}: {title} (quantity x price)")
+    table.add_column("Qty", style="yellow", justify="right")
+    for price in grid.prices.tolist():
+        table.add_column(f"${price:,.2f}", justify="right")
+    values = getattr(grid, metric)
+    for row, qty in enumerate(grid.quantities.tolist()):
+        cells = []
+        for column in range(len(grid.prices)):
+            value = float(values[row, column])
+            if not grid.feasible[row, column]:
+                cells.append("[dim]no cash[/dim]" if grid.opr == 'buy' else "[dim]no shares[/dim]")
+            elif np.isnan(value):
+                cells.append("-")
+            elif metric == 'cash_ratio':
+                cells.append(f"{value:.2%}")
+            else:
+                cells.append(f"[red]${value:,.2f}[/red]" if value < 0 else f"${value:,.2f}")
+        table.add_row(f"{qty:g}", *cells)
+    return table
+
+def compare_table(scenario: Scenario, settings: Settings) -> Table:
+    """
+    Account numbers before and after the applied trades.
+    """
+    label = settings.get_account().exchange_rate_label
+    base = scenario.base
+    before_mv = scenario.base_market_value
+    rows = [
+        ("Cash", base.total_cash, scenario.cash),
+        ("Market value", before_mv, scenario.market_value),
+        ("Unrealized P/L", before_mv - base.total_cost, scenario.market_value - scenario.total_cost),
+        ("Realized P/L", base.all_net_profit, scenario.realized_pl),
+        ("Fees + VAT", base.total_fees + base.total_vat, base.total_fees + base.total_vat + scenario.fees + scenario.vat),
+        ("Net worth", before_mv + base.total_cash, scenario.market_value + scenario.cash),
+    ]
+    table = Table(title=f"What-if: {len(scenario.trades)} trades (nothing saved)")
+    table.add_column("", style="cyan")
+    table.add_column("Now", justify="right")
+    table.add_column("After", justify="right", style="yellow")
+    table.add_column("Change", justify="right")
+    table.add_column(label, justify="right")
+    for name, before, after in rows:
+        change = after - before
+        change_text = f"[red]${change:,.2f}[/red]" if change < 0 else f"${change:,.2f}"
+        table.add_row(name, f"${before:,.2f}", f"${after:,.2f}", change_text, f"{change * scenario.rate:,.2f}")
+    before_ratio = base.total_cash / before_mv if before_mv else 0
+    after_ratio = scenario.cash / scenario.market_value if scenario.market_value else 0
+    table.add_row("Cash ratio", f"{before_ratio:.2%}", f"{after_ratio:.2%}", f"{after_ratio - before_ratio:+.2%}", "")
+    return table
+
+def show_trades(scenario: Scenario, console: Console, settings: Settings):
+    trades, errors = parse_batch(read_lines(console), fees=settings.get_account().fees_usd, vat=0.0)
+    for trade in trades:
+        error = scenario.apply(trade)
+        if error:
+            errors.append(error)
+    for error in errors:
+        console.print(f"[red]{error} (skipped)[/red]")
+    simulated = scenario.snapshot()
+    ticker_data = [replace(holding, price=scenario.holdings[holding.symbol].price) for holding in simulated.tickers]
+    console.print(holdings_table(simulated, ticker_data, settings))
+    console.print(totals_table(simulated, ticker_data, settings))
+    console.print(compare_table(scenario, settings))
+
+def show_grid(scenario: Scenario, console: Console, settings: Settings):
+    opr = 'sell' if input("Buy or sell? (B/S, default B): ").strip().lower() == 's' else 'buy'
+    symbol = input(f"Symbol (default {settings.get_account().selected_ticker}): ").strip().upper() or settings.get_account().selected_ticker
+    holding = scenario.holdings.get(symbol)
+    quantities = parse_values(input("Quantities, e.g. 10,20,50 or 10-100:10: "))
+    prices = parse_values(input(f"Prices, e.g. 240-260:5{f' (now {holding.price:,.2f})' if holding else ''}: "))
+    console.print("[blue]Show:[/blue] A[dim]verage cost[/dim], C[dim]ash ratio[/dim], U[dim]nrealized P/L[/dim] or R[dim]ealized P/L[/dim]")
+    metric = input("Choose (default A): ").strip().lower() or 'a'
+    name, title = GRID_METRICS.get(metric, GRID_METRICS['a'])
+    grid = scenario.grid(opr, symbol, quantities, prices)
+    console.print(grid_table(grid, name, title))
+    console.print(f"[dim]{int(grid.feasible.sum())} of {grid.feasible.size} combinations pass the {opr} checks, fees ${scenario.fees_usd:,.2f} per trade.[/dim]")
+
+def simulate_menu(snapshot: Snapshot, current_prices: dict, settings: Settings = Settings()):
+    """
+    What-if trades on the current book, nothing is saved. Trades entered stay in the
+    scenario until the menu is left, the grid is evaluated on top of them.
+    """
+    console = Console()
+    scenario = Scenario(snapshot, current_prices, settings.get_account().fees_usd)
+    while True:
+        console.print(f"[blue]What-if ({len(scenario.trades)} trades applied):[/blue] T[dim]rades[/dim], G[dim]rid of sizes and prices[/dim], R[dim]eset[/dim] or Q[dim]uit[/dim]")
+        choice = input("Choose an option: ").strip().lower()
+        try:
+            if choice == 't':
+                show_trades(scenario, console, settings)
+            elif choice == 'g':
+                show_grid(scenario, console, settings)
+            elif choice == 'r':
+                scenario = Scenario(snapshot, current_prices, settings.get_account().fees_usd)
+                console.print("[green]Scenario reset to the current book.[/green]")
+            elif choice in ('q', ''):
+                break
+            else:
+                continue
+        except (OSError, ValueError) as e:
+            console.print(f"[red]Error: {e}[/red]")
+        except KeyboardInterrupt:
+            console.print("\n[red]Cancelled.[/red]")
+        input("Press Enter to continue...")
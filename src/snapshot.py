@@ -0,0 +1,96 @@
+from dataclasses import dataclass, field
+import numpy as np
+import repository
+from fx_rates import FxRates
+from repository import Holding, Lot, amount_sql
+from valuation import LotBook
+
+@dataclass
+class Snapshot:
+    """
+    Everything the dashboard reads from the database, so it can be kept between redraws.
+    """
+    total_funds: float = 0.0
+    total_funds_sar: float = 0.0
+    all_net_profit: float = 0.0
+    total_cost: float = 0.0
+    total_fees: float = 0.0
+    total_vat: float = 0.0
+    total_buy_trades: int = 0
+    total_sell_trades: int = 0
+    tickers: list[Holding] = field(default_factory=list)
+    trades: list[Lot] = field(default_factory=list)
+    lot_book: LotBook = field(default_factory=lambda: LotBook([]))
+    fx: FxRates = field(default_factory=FxRates)
+    realized_sec: dict = field(default_factory=dict)
+    total_fees_sec: float = 0.0
+    total_vat_sec: float = 0.0
+
+    @property
+    def total_cash(self) -> float:
+        return self.total_funds - self.total_cost
+
+    @property
+    def symbols(self) -> list:
+        return [holding.symbol for holding in self.tickers]
+
+def load_snapshot(cursor, default_rate: float = 1.0) -> Snapshot:
+    """
+    Runs the dashboard queries against an open cursor.
+    default_rate is used for currency conversion when the account has no FX_RATES yet.
+    """
+    snapshot = Snapshot()
+
+    # Total Funds USD
+    cursor.execute(f"""SELECT {amount_sql("COALESCE(SUM(CASE WHEN opr='deposit' THEN amount_USD ELSE -amount_USD END), 0)")} FROM FUNDS""")
+    snapshot.total_funds = cursor.fetchone()[0]
+
+    # Total Funds SAR
+    cursor.execute(f"""SELECT {amount_sql("COALESCE(SUM(CASE WHEN opr='deposit' THEN amount_SAR ELSE -amount_SAR END), 0)")} FROM FUNDS""")
+    snapshot.total_funds_sar = cursor.fetchone()[0]
+
+    # Realized P/L, cost (buy cost value - sell cost value), fees, VAT and trade counts
+    # from the per-symbol rollup the TRADES triggers maintain (see rollup.py), summed in cents
+    cursor.execute(f"""
+    SELECT {amount_sql('COALESCE(SUM(realized_pl), 0)')}, {amount_sql('COALESCE(SUM(buy_cost - sell_cost), 0)')}, {amount_sql('COALESCE(SUM(fees), 0)')}, {amount_sql('COALESCE(SUM(vat), 0)')},
+    COALESCE(SUM(buy_count), 0), COALESCE(SUM(sell_count), 0)
+    FROM SYMBOL_ROLLUP
+    """)
+    (snapshot.all_net_profit, snapshot.total_cost, snapshot.total_fees, snapshot.total_vat,
+     snapshot.total_buy_trades, snapshot.total_sell_trades) = cursor.fetchone()
+
+    # Ticker data
+    snapshot.tickers = repository.holdings(cursor.connection)
+
+    # Get open positions for all tickers
+    snapshot.trades = repository.open_lots(cursor.connection, snapshot.symbols)
+    snapshot.lot_book = LotBook(snapshot.trades)
+
+    # Realized P/L, fees and VAT in the secondary currency at the rate of each trade date,
+    # from the per symbol and day rollups of live and archived trades (see rollup.py)
+    snapshot.fx = FxRates.load(cursor.connection, default_rate)
+    if not len(snapshot.fx):
+        # Without historical rates every date converts at default_rate, the rollup has the sums
+        cursor.execute(f"SELECT symbol, {amount_sql('realized_pl')} FROM SYMBOL_ROLLUP")
+        snapshot.realized_sec = {symbol: realized_pl * default_rate for symbol, realized_pl in cursor.fetchall()}
+        snapshot.total_fees_sec = snapshot.total_fees * default_rate
+        snapshot.total_vat_sec = snapshot.total_vat * default_rate
+        return snapshot
+    cursor.execute(f"""
+    SELECT symbol, day, {amount_sql('realized_pl')}, {amount_sql('fees')}, {amount_sql('vat')}
+    FROM DAY_ROLLUP
+    UNION ALL
+    SELECT symbol, day, {amount_sql('realized_pl')}, {amount_sql('fees')}, {amount_sql('vat')}
+    FROM ARCHIVE_ROLLUP
+    """)
+    rows = cursor.fetchall()
+    if rows:
+        row_symbols, date_keys, profits, fees, vats = zip(*rows)
+        rates = snapshot.fx.rate_at(date_keys)
+        unique_symbols, symbol_index = np.unique(row_symbols, return_inverse=True)
+        realized = np.bincount(symbol_index, weights=np.asarray(profits, dtype=np.float64) * rates, minlength=len(unique_symbols))
+        snapshot.realized_sec = dict(zip(unique_symbols.tolist(), realized.tolist()))
+        snapshot.total_fees_sec = float(np.dot(fees, rates))
+        snapshot.total_vat_sec = float(np.dot(vats, rates))
+
+    return snapshot
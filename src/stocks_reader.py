@@ -1,16 +1,32 @@
-import pandas as pd
 import sqlite3
+import pandas as pd
+import journal
+import profiler
+import repository
 from utils import get_db_path
 from settings import Settings
 
 def read_and_print_rows(df, section, row_indices, quiet=False, settings=Settings()):
     """
-    Prints the specified rows from the DataFrame and saves to DB.
+    Prints the specified rows from the DataFrame and saves them to the DB in one transaction,
+    as one journal entry so a single undo removes the whole import.
 
     :param df: Pandas DataFrame containing the data
     :param row_indices: List of row indices (1-based) to print
     """
-    
+    conn = profiler.connect(get_db_path(settings.default_account))
+    try:
+        with conn:
+            journal.record(conn, 'import', import_rows(conn, df, section, row_indices, quiet))
+    finally:
+        conn.close()
+
+def import_rows(conn: sqlite3.Connection, df, section, row_indices, quiet=False) -> list[journal.Change]:
+    """
+    Inserts the specified rows in the caller's transaction, skipping the ones that do not parse,
+    and returns their journal changes. The caller records them and commits.
+    """
+    changes = []
     for idx in row_indices:
         if 1 <= idx <= len(df):
             row = df.iloc[idx-1]
@@ -23,75 +39,73 @@ def read_and_print_rows(df, section, row_indices, quiet=False, settings=Settings
             # Insert based on section
             try:
                 if section == 'deposit' or section == 'withdraw':
-                    insert_fund(
+                    changes.append(insert_fund(
+                        conn,
                         opr=str(section),
                         fund_date=str(row[2]),
                         source=str(row[3]),
                         amount_SAR=float(row[4]),
                         amount_USD=float(row[5]),
                         rate_exchange=float(row[6]),
-                        settings=settings
-                    )
+                    ))
                     if not quiet:
                         print("Fund inserted successfully.")
                 elif section == 'buy':
-                    insert_trade(
+                    changes.append(insert_trade(
+                        conn,
                         trade_date=str(row[2]),
                         symbol=str(row[3]),
                         opr=str(section),
-                        filled_qty=float(row[4]),
+                        filled_qty=repository.to_shares(row[4]),
                         price=float(row[5]),
                         fees=float(row[6]) if pd.notna(row[6]) else 0,
                         vat=float(row[7]) if pd.notna(row[7]) else 0,
                         cost_value=float(row[9]) if pd.notna(row[9]) else 0,
-                        is_position_open=row[0] if pd.notna(row[0]) else 0,
-                        settings=settings
-                    )
+                        is_position_open=int(row[0]) if pd.notna(row[0]) else 0,
+                    ))
                     if not quiet:
                         print("Trade inserted successfully.")
                 elif section == 'sell':
-                    insert_trade(
+                    changes.append(insert_trade(
+                        conn,
                         trade_date=str(row[2]),
                         symbol=str(row[3]),
                         opr=str(section),
-                        filled_qty=float(row[4]),
+                        filled_qty=repository.to_shares(row[4]),
                         price=float(row[5]),
                         fees=float(row[6]) if pd.notna(row[6]) else 0,
                         vat=float(row[7]) if pd.notna(row[7]) else 0,
                         cost_value=float(row[9]) if pd.notna(row[9]) else 0,
                         profit_loss=float(row[10]) if pd.notna(row[10]) else 0,
                         is_position_open=0,
-                        settings=settings
-                    )
+                    ))
                     if not quiet:
                         print("Trade inserted successfully.")
             except (IndexError, ValueError, TypeError) as e:
                 print(f"Error inserting row {idx}: {e}")
         else:
             print(f"Row {idx} is out of range.")
+    return changes
 
-def insert_trade(trade_date, symbol, opr, filled_qty, price, fees=0.0, vat=0.0, market_value=0.0, cost_value=0.0, profit_loss=0.0, is_position_open=1, settings=Settings()):
+def insert_trade(conn, trade_date, symbol, opr, filled_qty, price, fees=0.0, vat=0.0, market_value=0.0, cost_value=0.0, profit_loss=0.0, is_position_open=1) -> journal.Change:
     """
-    Insert a trade into the TRADES table.
+    Insert a trade into the TRADES table in the caller's transaction and return its journal change.
     """
-    conn = sqlite3.connect(get_db_path(settings.default_account))
     cursor = conn.cursor() 
     cursor.execute("""
         INSERT INTO TRADES (trade_date, symbol, opr, filled_qty, price, fees, vat, cost_value, profit_loss, is_position_open)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (trade_date, symbol, opr, filled_qty, price, fees, vat, cost_value, profit_loss, is_position_open))
-    conn.commit()
-    conn.close()
+    """, (trade_date, symbol, opr, repository.to_shares(filled_qty), repository.to_price(price), repository.to_amount(fees), repository.to_amount(vat),
+          repository.to_amount(cost_value), repository.to_amount(profit_loss), is_position_open))
+    return journal.change(conn, 'TRADES', cursor.lastrowid)
 
-def insert_fund(opr, fund_date, source, amount_SAR, amount_USD, rate_exchange, settings=Settings()):
+def insert_fund(conn, opr, fund_date, source, amount_SAR, amount_USD, rate_exchange) -> journal.Change:
     """
-    Insert a fund operation into the FUNDS table.
+    Insert a fund operation into the FUNDS table in the caller's transaction and return its journal change.
     """
-    conn = sqlite3.connect(get_db_path(settings.default_account))
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO FUNDS (opr, fund_date, source, amount_SAR, amount_USD, rate_exchange)
         VALUES (?, ?, ?, ?, ?, ?)
-    """, (opr, fund_date, source, amount_SAR, amount_USD, rate_exchange))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    """, (opr, fund_date, source, repository.to_amount(amount_SAR), repository.to_amount(amount_USD), rate_exchange))
+    return journal.change(conn, 'FUNDS', cursor.lastrowid)
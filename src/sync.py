@@ -0,0 +1,238 @@
+"""
+Incremental sync of one account between machines, by changeset files instead of copying
+the whole database file around.
+
+The journal (see journal.py) already holds every write to TRADES, FUNDS and TRADES_ARCHIVE
+with the before and after image of each row, so it is the change log: export_changes()
+writes the entries a peer has not acknowledged yet, import_changes() applies a peer's
+entries as local 'sync' entries. Both cost the number of entries moved, not the table sizes.
+
+- Machines are named by TRADECLI_NODE or their host name. A changeset names its source and
+  target and carries the source's own progress, which acknowledges the target's entries;
+  a lost or unimported file is simply covered again by the next export.
+- Conflicts are detected by row ID: an entry whose before images do not match the local
+  rows (the same trade or fund edited on both machines) is skipped and reported.
+- A row inserted on both machines under the same ID keeps the local row, the peer's row
+  gets the next local ID. SYNC_IDS remembers the pair on the machine that renumbered, which
+  translates the row's later changes both ways; each change in a file says whether its ID is
+  the source's or already the target's. Rows should reach a machine along one path: a pair
+  of machines, or several that all sync through the same one.
+- Entries received from a peer are never sent back to it (SYNC_APPLIED).
+- On the first import from a peer the journal prefix both copies share, written before the
+  database file was copied, is recognised and skipped.
+"""
+from __future__ import annotations
+import json
+import os
+import socket
+import sqlite3
+from dataclasses import dataclass, field
+from datetime import datetime
+import journal
+
+FORMAT = 1
+
+# TRADES_ARCHIVE keeps the IDs of the trades it receives, so both tables share one ID space
+FAMILIES = {'TRADES': 'TRADES', 'TRADES_ARCHIVE': 'TRADES', 'FUNDS': 'FUNDS'}
+
+class SyncError(Exception):
+    pass
+
+class Conflict(Exception):
+    pass
+
+@dataclass
+class SyncResult:
+    entries: int = 0
+    applied: int = 0
+    skipped: int = 0
+    remapped: int = 0
+    conflicts: list = field(default_factory=list)
+
+def node_name() -> str:
+    return os.environ.get('TRADECLI_NODE') or socket.gethostname()
+
+def default_path(account_name: str, peer: str) -> str:
+    """
+    Each export covers everything the peer has not acknowledged, so the latest file replaces the previous ones.
+    """
+    return f"{account_name}-{node_name()}-to-{peer}.sync.json"
+
+def _state(conn: sqlite3.Connection, peer: str) -> tuple[int, int]:
+    """
+    (acked_seq, imported_seq) of a peer: our last entry it has, its last entry we have.
+    """
+    found = conn.execute("SELECT acked_seq, imported_seq FROM SYNC_PEERS WHERE peer = ?", (peer,)).fetchone()
+    return found if found is not None else (0, 0)
+
+def peers(conn: sqlite3.Connection) -> list[tuple]:
+    """
+    (peer, acked_seq, imported_seq, pending entries to export, last sync) per known peer.
+    """
+    rows = conn.execute("SELECT peer, acked_seq, imported_seq, synced FROM SYNC_PEERS ORDER BY peer").fetchall()
+    return [(peer, acked, imported, _pending(conn, peer, acked), synced) for peer, acked, imported, synced in rows]
+
+def _pending(conn: sqlite3.Connection, peer: str, acked: int) -> int:
+    return conn.execute("SELECT COUNT(*) FROM JOURNAL WHERE seq > ? AND seq NOT IN (SELECT seq FROM SYNC_APPLIED WHERE peer = ? AND seq > ?)",
+                        (acked, peer, acked)).fetchone()[0]
+
+def _with_id(image: dict | None, row_id: int) -> dict | None:
+    return image if image is None or image.get('ID') == row_id else {**image, 'ID': row_id}
+
+def _peer_id(conn: sqlite3.Connection, peer: str, table: str, local_id: int) -> int | None:
+    """
+    The peer's ID of a row of the peer we renumbered, None for the others.
+    """
+    found = conn.execute("SELECT peer_id FROM SYNC_IDS WHERE peer = ? AND family = ? AND local_id = ?", (peer, FAMILIES[table], local_id)).fetchone()
+    return None if found is None else found[0]
+
+def _local_id(conn: sqlite3.Connection, peer: str, table: str, peer_id: int) -> int:
+    found = conn.execute("SELECT local_id FROM SYNC_IDS WHERE peer = ? AND family = ? AND peer_id = ?", (peer, FAMILIES[table], peer_id)).fetchone()
+    return peer_id if found is None else found[0]
+
+def _next_id(conn: sqlite3.Connection, table: str) -> int:
+    """
+    An ID never used in the table's family, as AUTOINCREMENT would hand out.
+    """
+    family = FAMILIES[table]
+    tables = [name for name, owner in FAMILIES.items() if owner == family]
+    used = " UNION ALL ".join(f"SELECT MAX(ID) AS m FROM {name}" for name in tables)
+    return conn.execute(f"SELECT COALESCE(MAX(m), 0) + 1 FROM ({used} UNION ALL SELECT seq FROM sqlite_sequence WHERE name = ?)", (family,)).fetchone()[0]
+
+def _encode(entry: journal.Entry, changes: list[list]) -> list:
+    return [entry.seq, entry.created, entry.action, entry.ref, changes]
+
+def _own(change: journal.Change) -> list:
+    """
+    A change in the file format, with our own row ID.
+    """
+    return [change.table, change.row_id, change.before, change.after, False]
+
+def export_changes(conn: sqlite3.Connection, account_name: str, peer: str, path: str) -> int:
+    """
+    Writes our entries the peer has not acknowledged, except those it sent us, and the IDs
+    of the peer's rows we renumbered translated back. Returns the number of entries written.
+    """
+    if peer == node_name():
+        raise SyncError(f"{peer} is this machine")
+    acked, imported = _state(conn, peer)
+    received = {seq for (seq,) in conn.execute("SELECT seq FROM SYNC_APPLIED WHERE peer = ? AND seq > ?", (peer, acked))}
+    exported = []
+    for entry in journal.entries(conn, after=acked):
+        if entry.seq in received:
+            continue
+        changes = []
+        for c in entry.changes:
+            peer_id = _peer_id(conn, peer, c.table, c.row_id)
+            changes.append(_own(c) if peer_id is None else [c.table, peer_id, _with_id(c.before, peer_id), _with_id(c.after, peer_id), True])
+        exported.append(_encode(entry, changes))
+    last = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM JOURNAL").fetchone()[0]
+    changeset = {
+        'format': FORMAT,
+        'account': account_name,
+        'source': node_name(),
+        'target': peer,
+        'from_seq': acked,
+        'to_seq': last,
+        'acked_seq': imported,
+        'entries': exported,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(changeset, f)
+    return len(exported)
+
+def read_changeset(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        changeset = json.load(f)
+    if changeset.get('format') != FORMAT:
+        raise SyncError(f"{path} is not a changeset this version can read")
+    return changeset
+
+def _shared_prefix(conn: sqlite3.Connection, entries: list) -> int:
+    """
+    Seq of the last entry both journals hold unchanged, from before the database file was copied.
+    """
+    if not entries:
+        return 0
+    local = journal.entries(conn, after=entries[0][0] - 1, limit=len(entries))
+    shared = 0
+    for theirs, ours in zip(entries, local):
+        if theirs != json.loads(json.dumps(_encode(ours, [_own(c) for c in ours.changes]))):
+            break
+        shared = ours.seq
+    return shared
+
+def _apply(conn: sqlite3.Connection, peer: str, changes: list) -> tuple[list[journal.Change], int]:
+    """
+    Writes one peer entry, raising Conflict when a row is not in the state the peer changed it from.
+    Returns the changes as applied locally and the number of inserted rows given a new ID.
+    """
+    applied, remapped = [], 0
+    for table, peer_id, before, after, translated in changes:
+        if table not in FAMILIES:
+            raise Conflict(f"unknown table {table}")
+        row_id = peer_id if translated else _local_id(conn, peer, table, peer_id)
+        before, after = _with_id(before, row_id), _with_id(after, row_id)
+        current = journal.row(conn, table, row_id)
+        if current == after:
+            # Already in that state, the same change was made on both machines
+            continue
+        if before is None and current is not None:
+            # Inserted on both machines under one ID
+            row_id = _next_id(conn, table)
+            conn.execute("INSERT INTO SYNC_IDS (peer, family, peer_id, local_id) VALUES (?, ?, ?, ?)", (peer, FAMILIES[table], peer_id, row_id))
+            after = _with_id(after, row_id)
+            current = None
+            remapped += 1
+        if current != before:
+            raise Conflict(f"{table} #{row_id} was changed on both machines" if current is not None else f"{table} #{row_id} was deleted here")
+        change = journal.Change(table, row_id, before, after)
+        journal.write_changes(conn, [change])
+        applied.append(change)
+    return applied, remapped
+
+def import_changes(conn: sqlite3.Connection, account_name: str, changeset: dict) -> SyncResult:
+    """
+    Applies a peer's changeset in one transaction, each entry journaled as a 'sync' entry or
+    skipped whole when it conflicts. Entries already imported are skipped, so a file can be
+    imported again safely.
+    """
+    peer = changeset['source']
+    if changeset['target'] != node_name():
+        raise SyncError(f"the changeset was written for {changeset['target']}, this machine is {node_name()}")
+    if changeset['account'] != account_name:
+        raise SyncError(f"the changeset is for account {changeset['account']}, not {account_name}")
+    acked, imported = _state(conn, peer)
+    if acked == 0 and imported == 0:
+        # First contact: the peer starts after the prefix it found we share, or we look for it
+        imported = acked = max(changeset['from_seq'], _shared_prefix(conn, changeset['entries']))
+    if changeset['from_seq'] > imported:
+        raise SyncError(f"entries {imported + 1} to {changeset['from_seq']} of {peer} are missing, import its earlier changeset first")
+    result = SyncResult(entries=len(changeset['entries']))
+    conn.execute("BEGIN")
+    try:
+        conn.execute("INSERT OR IGNORE INTO SYNC_PEERS (peer) VALUES (?)", (peer,))
+        for seq, created, action, ref, changes in changeset['entries']:
+            if seq <= imported:
+                result.skipped += 1
+                continue
+            conn.execute("SAVEPOINT sync_entry")
+            try:
+                applied, remapped = _apply(conn, peer, changes)
+                local_seq = journal.record(conn, 'sync', applied)
+                if local_seq:
+                    conn.execute("INSERT INTO SYNC_APPLIED (seq, peer, peer_seq) VALUES (?, ?, ?)", (local_seq, peer, seq))
+                conn.execute("RELEASE sync_entry")
+                result.applied += 1
+                result.remapped += remapped
+            except (Conflict, journal.JournalError, sqlite3.IntegrityError) as e:
+                conn.execute("ROLLBACK TO sync_entry")
+                conn.execute("RELEASE sync_entry")
+                result.conflicts.append(f"{peer} #{seq} {action} ({created}): {e}")
+        conn.execute("UPDATE SYNC_PEERS SET acked_seq = MAX(acked_seq, ?, ?), imported_seq = MAX(imported_seq, ?, ?), synced = ? WHERE peer = ?",
+                     (acked, changeset['acked_seq'], imported, changeset['to_seq'], datetime.now().isoformat(timespec='seconds'), peer))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return result
@@ -0,0 +1,165 @@
+"""
+Append-only journal of the quotes fetched from Yahoo Finance, one file per account next to its database.
+
+Each quote is a fixed 20 byte record (time, price, symbol id) after a 16 byte header, and a
+refresh appends its quotes in one write. Readers map the file with numpy.memmap and use the
+records in place, so the price at the last refresh or a symbol's quotes for a sparkline need
+no parsing. Symbol ids are kept in QUOTE_SYMBOLS.
+
+compact() folds the quotes of past days into daily OHLC rows in QUOTE_BARS and rewrites the
+journal with today's quotes only. Days are UTC days, which hold a whole US trading session.
+"""
+from __future__ import annotations
+import os
+import sqlite3
+import time
+import numpy as np
+from repository import PRICE_SCALE, price_sql
+from utils import get_exec_path
+
+HEADER = b"TRADECLI TICKS 1"
+TICK = np.dtype([('time', '<i8'), ('price', '<i8'), ('symbol', '<u4')])
+DAY = 86400
+SPARKS = "▁▂▃▄▅▆▇█"
+
+def journal_path(account_name: str) -> str:
+    return get_exec_path(f'{account_name}.ticks')
+
+def symbol_ids(conn: sqlite3.Connection, symbols) -> dict:
+    """
+    Id of each symbol, numbering the new ones. The caller commits.
+    """
+    conn.executemany("INSERT OR IGNORE INTO QUOTE_SYMBOLS (symbol) VALUES (?)", [(symbol,) for symbol in symbols])
+    return {symbol: symbol_id for symbol_id, symbol in conn.execute("SELECT ID, symbol FROM QUOTE_SYMBOLS") if symbol in symbols}
+
+def symbol_names(conn: sqlite3.Connection) -> dict:
+    return dict(conn.execute("SELECT ID, symbol FROM QUOTE_SYMBOLS"))
+
+def append(conn: sqlite3.Connection, account_name: str, quotes: dict, at: float | None = None) -> int:
+    """
+    Appends {symbol: price} quotes stamped at (default now) and returns the number of records.
+    """
+    if not quotes:
+        return 0
+    ids = symbol_ids(conn, quotes)
+    conn.commit()
+    records = np.zeros(len(quotes), dtype=TICK)
+    records['time'] = int(time.time() if at is None else at)
+    records['price'] = [round(price * PRICE_SCALE) for price in quotes.values()]
+    records['symbol'] = [ids[symbol] for symbol in quotes]
+    with open(journal_path(account_name), 'ab') as f:
+        size = f.tell()
+        if size == 0:
+            f.write(HEADER)
+        elif (size - len(HEADER)) % TICK.itemsize:
+            # A record torn by a crash, dropped so the next ones stay aligned
+            f.truncate(size - (size - len(HEADER)) % TICK.itemsize)
+        f.write(records.tobytes())
+    return len(records)
+
+def read(account_name: str) -> np.ndarray:
+    """
+    The journal's records mapped read-only, in the order they were appended. Empty without a journal.
+    Map it per use and drop it: compact() replaces the file.
+    """
+    path = journal_path(account_name)
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    count = max(0, size - len(HEADER)) // TICK.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=TICK)
+    with open(path, 'rb') as f:
+        if f.read(len(HEADER)) != HEADER:
+            raise ValueError(f"{path} is not a quote journal")
+    return np.memmap(path, dtype=TICK, mode='r', offset=len(HEADER), shape=(count,))
+
+def last_quotes(ticks: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (symbol ids, times, prices in dollars) of the last record of each symbol.
+    """
+    ids, first = np.unique(ticks['symbol'][::-1], return_index=True)
+    last = len(ticks) - 1 - first
+    return ids, ticks['time'][last], ticks['price'][last] / PRICE_SCALE
+
+def last_prices(conn: sqlite3.Connection, account_name: str) -> dict:
+    """
+    Price of each symbol at the last refresh: its last journaled quote, or the close of its last compacted day.
+    """
+    prices = dict(conn.execute(f"""
+        SELECT symbol, {price_sql('close')} FROM QUOTE_BARS AS bars
+        WHERE day = (SELECT MAX(day) FROM QUOTE_BARS WHERE symbol = bars.symbol)
+    """))
+    names = symbol_names(conn)
+    ticks = read(account_name)
+    if len(ticks):
+        ids, _, quote_prices = last_quotes(ticks)
+        for symbol_id, price in zip(ids.tolist(), quote_prices.tolist()):
+            prices[names[symbol_id]] = price
+    return prices
+
+def series(ticks: np.ndarray, symbol_id: int, since: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Times and prices in dollars of one symbol's quotes from since on.
+    """
+    start = np.searchsorted(ticks['time'], since)
+    window = ticks[start:]
+    mine = window[window['symbol'] == symbol_id]
+    return np.asarray(mine['time']), mine['price'] / PRICE_SCALE
+
+def today_series(conn: sqlite3.Connection, account_name: str, symbols) -> dict:
+    """
+    {symbol: (times, prices)} of today's quotes (UTC) for the symbols with any.
+    """
+    ticks = read(account_name)
+    since = int(time.time()) // DAY * DAY
+    ids = {symbol: symbol_id for symbol_id, symbol in symbol_names(conn).items() if symbol in symbols}
+    result = {symbol: series(ticks, symbol_id, since) for symbol, symbol_id in ids.items()}
+    return {symbol: quotes for symbol, quotes in result.items() if len(quotes[0])}
+
+def sparkline(values: np.ndarray, width: int = 40) -> str:
+    """
+    The last width values as block characters scaled between their low and high.
+    """
+    values = np.asarray(values)[-width:]
+    if not len(values):
+        return ""
+    low, high = values.min(), values.max()
+    if high == low:
+        return SPARKS[len(SPARKS) // 2] * len(values)
+    levels = np.rint((values - low) / (high - low) * (len(SPARKS) - 1)).astype(int)
+    return "".join(SPARKS[level] for level in levels)
+
+def compact(conn: sqlite3.Connection, account_name: str, now: float | None = None) -> int:
+    """
+    Folds the quotes dated before today (UTC) into QUOTE_BARS and rewrites the journal with
+    the rest. Returns the number of (symbol, day) bars written.
+    """
+    ticks = read(account_name)
+    today = int(time.time() if now is None else now) // DAY * DAY
+    cut = int(np.searchsorted(ticks['time'], today)) if len(ticks) else 0
+    if cut == 0:
+        return 0
+    old = np.array(ticks[:cut])
+    keep = ticks[cut:].tobytes()
+    del ticks
+    days = old['time'] // DAY
+    order = np.lexsort((old['time'], days, old['symbol']))
+    old, days = old[order], days[order]
+    starts = np.flatnonzero(np.r_[True, (old['symbol'][1:] != old['symbol'][:-1]) | (days[1:] != days[:-1])])
+    ends = np.r_[starts[1:], len(old)]
+    prices = old['price']
+    day_keys = np.char.replace(np.datetime_as_string(days[starts].astype('datetime64[D]')), '-', '').astype(np.int64)
+    names = symbol_names(conn)
+    rows = zip([names[symbol_id] for symbol_id in old['symbol'][starts].tolist()], day_keys.tolist(), prices[starts].tolist(),
+               np.maximum.reduceat(prices, starts).tolist(), np.minimum.reduceat(prices, starts).tolist(), prices[ends - 1].tolist(), (ends - starts).tolist())
+    with conn:
+        # A day folded again after a crash between the two steps only adds to its tick count
+        conn.executemany("""
+            INSERT INTO QUOTE_BARS (symbol, day, open, high, low, close, ticks) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (symbol, day) DO UPDATE SET high = MAX(high, excluded.high), low = MIN(low, excluded.low),
+                close = excluded.close, ticks = ticks + excluded.ticks
+        """, rows)
+    path = journal_path(account_name)
+    with open(path + ".tmp", 'wb') as f:
+        f.write(HEADER + keep)
+    os.replace(path + ".tmp", path)
+    return len(starts)
@@ -1,27 +1,52 @@
 from datetime import datetime
 import sqlite3
+import journal
+import profiler
+import repository
 from utils import get_db_path
 from settings import Settings
 from rich.console import Console
 from rich.table import Table
 
+def buy_cost(filled_qty, price, fees, vat):
+    """
+    Cash a buy takes, fees and VAT included. Works on NumPy arrays as well.
+    """
+    return filled_qty * price + fees + vat
+
+def sell_proceeds(filled_qty, price, fees, vat):
+    """
+    Cash a sell brings in after fees and VAT. Works on NumPy arrays as well.
+    """
+    return filled_qty * price - (fees + vat)
+
+def can_afford(cost_value, total_cash):
+    """
+    The buy check: the cost, fees and VAT included, must fit in the cash.
+    """
+    return cost_value <= total_cash
+
+def can_sell(filled_qty, net_shares):
+    """
+    The sell check: no more shares than held.
+    """
+    return filled_qty <= net_shares
+
 def view_trade(trade_id, settings=Settings()):
     """
     View a trade from the TRADES table by ID.
     """
     console = Console()
-    conn = sqlite3.connect(get_db_path(settings.default_account))
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM TRADES WHERE ID = ?", (trade_id,))
-    trade = cursor.fetchone()
+    conn = profiler.connect(get_db_path(settings.default_account))
+    trade = repository.get_trade(conn, trade_id)
     conn.close()
     if trade:
         table = Table(title="Trade Details")
         table.add_column("Field", style="cyan", no_wrap=True)
         table.add_column("Value", style="magenta")
-        fields = ["ID", "Trade Date", "Symbol", "Operation", "Filled Qty", "Price", "Fees", "VAT", "Cost Value", "Profit/Loss", "Position Open"]
-        for field, value in zip(fields, trade):
-            table.add_row(field, str(value))
+        fields = ["ID", "Trade Date", "Symbol", "Operation", "Filled Qty", "Price", "Fees", "VAT", "Cost Value", "Profit/Loss", "Position Open", "Closed Position Price", "Closed Position Amount"]
+        for field, name in zip(fields, repository.columns(repository.Trade)):
+            table.add_row(field, str(getattr(trade, name)))
         console.print(table)
     else:
         console.print(f"No trade found with ID {trade_id}.")
@@ -33,12 +58,13 @@ def buy_trade(trade_date, symbol, filled_qty, price, fees=0.0, vat=0.0, cost_val
     """
     console = Console()
     try:
-        conn = sqlite3.connect(get_db_path(settings.default_account))
+        conn = profiler.connect(get_db_path(settings.default_account))
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO TRADES (trade_date, symbol, opr, filled_qty, price, fees, vat, cost_value, profit_loss, is_position_open)
             VALUES (?, ?, 'buy', ?, ?, ?, ?, ?, 0, 1)
-        """, (trade_date, symbol, filled_qty, price, fees, vat, cost_value))
+        """, (trade_date, symbol, repository.to_shares(filled_qty), repository.to_price(price), repository.to_amount(fees), repository.to_amount(vat), repository.to_amount(cost_value)))
+        journal.record(conn, 'buy', [journal.change(conn, 'TRADES', cursor.lastrowid)])
         conn.commit()
         conn.close()
         console.print("[green]Buy trade saved successfully.[/green]")
@@ -51,26 +77,28 @@ def sell_trade(trade_date, symbol, filled_qty, price, fees=0.0, vat=0.0, cost_va
     """
     console = Console()
     try:
-        conn = sqlite3.connect(get_db_path(settings.default_account))
+        conn = profiler.connect(get_db_path(settings.default_account))
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO TRADES (trade_date, symbol, opr, filled_qty, price, fees, vat, cost_value, profit_loss, is_position_open)
             VALUES (?, ?, 'sell', ?, ?, ?, ?, ?, ?, 0)
-        """, (trade_date, symbol, filled_qty, price, fees, vat, cost_value, profit_loss))
-        conn.commit()
-        conn.close()
-        console.print("[green]Sell trade saved successfully.[/green]")
+        """, (trade_date, symbol, repository.to_shares(filled_qty), repository.to_price(price), repository.to_amount(fees), repository.to_amount(vat),
+              repository.to_amount(cost_value), repository.to_amount(profit_loss)))
+        changes = [journal.change(conn, 'TRADES', cursor.lastrowid)]
         if close_position:
-            # Update the corresponding buy trade to mark position as closed
-            conn = sqlite3.connect(get_db_path(settings.default_account))
-            cursor = conn.cursor()
+            # Update the corresponding buy trade to mark position as closed, one journal entry with the sell
+            before = journal.row(conn, 'TRADES', close_position)
             cursor.execute("""
                 UPDATE TRADES
                 SET is_position_open = 0
                 WHERE ID = ? AND opr = 'buy'
             """, (close_position,))
-            conn.commit()
-            conn.close()
+            changes.append(journal.change(conn, 'TRADES', close_position, before))
+        journal.record(conn, 'sell', changes)
+        conn.commit()
+        conn.close()
+        console.print("[green]Sell trade saved successfully.[/green]")
+        if close_position:
             console.print(f"[yellow]Position for buy trade ID {close_position} closed.[/yellow]")
     except sqlite3.Error as e:
         console.print(f"[red]Error saving sell trade: {e}[/red]")
@@ -81,9 +109,11 @@ def delete_trade(trade_id, settings=Settings()):
     """
     console = Console()
     try:
-        conn = sqlite3.connect(get_db_path(settings.default_account))
+        conn = profiler.connect(get_db_path(settings.default_account))
         cursor = conn.cursor()
+        before = journal.row(conn, 'TRADES', trade_id)
         cursor.execute("DELETE FROM TRADES WHERE ID = ?", (trade_id,))
+        journal.record(conn, 'delete', [journal.change(conn, 'TRADES', trade_id, before)])
         if cursor.rowcount > 0:
             console.print(f"[green]Trade with ID {trade_id} deleted successfully.[/green]")
         else:
@@ -93,14 +123,14 @@ def delete_trade(trade_id, settings=Settings()):
     except sqlite3.Error as e:
         console.print(f"[red]Error deleting trade: {e}[/red]")        
     
-def update_trade(trade_id, trade_date=None, symbol=None, opr=None, filled_qty=None, price=None, fees=None, vat=None, cost_value=None, profit_loss=None, is_position_open=None, settings=Settings()):
+def update_trade(trade_id, trade_date=None, symbol=None, opr=None, filled_qty=None, price=None, fees=None, vat=None, cost_value=None, profit_loss=None, is_position_open=None, settings=Settings(), action='update'):
     """
     Update a trade in the TRADES table by ID.
-    Only non-None parameters will be updated.
+    Only non-None parameters will be updated. action names the change in the journal.
     """
     console = Console()
     try:
-        conn = sqlite3.connect(get_db_path(settings.default_account))
+        conn = profiler.connect(get_db_path(settings.default_account))
         cursor = conn.cursor()
         fields = []
         values = []
@@ -115,29 +145,31 @@ def update_trade(trade_id, trade_date=None, symbol=None, opr=None, filled_qty=No
             values.append(opr)
         if filled_qty is not None:
             fields.append("filled_qty = ?")
-            values.append(filled_qty)
+            values.append(repository.to_shares(filled_qty))
         if price is not None:
             fields.append("price = ?")
-            values.append(price)
+            values.append(repository.to_price(price))
         if fees is not None:
             fields.append("fees = ?")
-            values.append(fees)
+            values.append(repository.to_amount(fees))
         if vat is not None:
             fields.append("vat = ?")
-            values.append(vat)
+            values.append(repository.to_amount(vat))
         if cost_value is not None:
             fields.append("cost_value = ?")
-            values.append(cost_value)
+            values.append(repository.to_amount(cost_value))
         if profit_loss is not None:
             fields.append("profit_loss = ?")
-            values.append(profit_loss)
+            values.append(repository.to_amount(profit_loss))
         if is_position_open is not None:
             fields.append("is_position_open = ?")
             values.append(is_position_open)
         
         values.append(trade_id)
         sql = f"UPDATE TRADES SET {', '.join(fields)} WHERE ID = ?"
+        before = journal.row(conn, 'TRADES', trade_id)
         cursor.execute(sql, values)
+        journal.record(conn, action, [journal.change(conn, 'TRADES', trade_id, before)])
         if cursor.rowcount > 0:
             console.print(f"[green]Trade with ID {trade_id} updated successfully.[/green]")
         else:
@@ -154,12 +186,13 @@ def deposit_funds(fund_date, source, amount_SAR, amount_USD, rate_exchange, sett
     """
     console = Console()
     try:
-        conn = sqlite3.connect(get_db_path(settings.default_account))
+        conn = profiler.connect(get_db_path(settings.default_account))
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO FUNDS (fund_date, opr, source, amount_SAR, amount_USD, rate_exchange)
             VALUES (?, 'deposit', ?, ?, ?, ?)
-        """, (fund_date, source, amount_SAR, amount_USD, rate_exchange))
+        """, (fund_date, source, repository.to_amount(amount_SAR), repository.to_amount(amount_USD), rate_exchange))
+        journal.record(conn, 'deposit', [journal.change(conn, 'FUNDS', cursor.lastrowid)])
         conn.commit()
         conn.close()
         console.print("[green]Funds deposit inserted successfully.[/green]")
@@ -172,12 +205,13 @@ def withdraw_funds(fund_date, source, amount_SAR, amount_USD, rate_exchange, set
     """
     console = Console()
     try:
-        conn = sqlite3.connect(get_db_path(settings.default_account))
+        conn = profiler.connect(get_db_path(settings.default_account))
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO FUNDS (fund_date, opr, source, amount_SAR, amount_USD, rate_exchange)
             VALUES (?, 'withdraw', ?, ?, ?, ?)
-        """, (fund_date, source, amount_SAR, amount_USD, rate_exchange))
+        """, (fund_date, source, repository.to_amount(amount_SAR), repository.to_amount(amount_USD), rate_exchange))
+        journal.record(conn, 'withdraw', [journal.change(conn, 'FUNDS', cursor.lastrowid)])
         conn.commit()
         conn.close()
         console.print("[green]Funds withdraw inserted successfully.[/green]")
@@ -196,9 +230,9 @@ def buy_menu(selected_ticker, current_prices, total_cash, settings=Settings()):
         fees = float(input("Enter Fees (default 1.8) = ").strip() or 1.8)
         vat = float(input("Enter VAT (default 0.27) = ").strip() or 0.27)
         trade_date = input("Enter Trade Date (DD/MM/YYYY) = ").strip() or datetime.today().strftime("%d/%m/%Y")                
-        cost_value = filled_qty * price + fees + vat
+        cost_value = buy_cost(filled_qty, price, fees, vat)
         
-        if cost_value > total_cash:
+        if not can_afford(cost_value, total_cash):
             console.print(f"[red]Error: Insufficient cash to execute this buy trade. Available cash: ${total_cash:,.2f}, Required: ${cost_value:,.2f}[/red]")
             input("Press Enter to continue...")
             return
@@ -237,27 +271,26 @@ def sell_menu(ticker_data, trades, selected_ticker, current_prices, settings=Set
             # Fetch the buy trade details from trades above
             filled_qty = 0
             profit_loss = 0.0
-            buy_trade_details = next((trade for trade in trades if str(trade[0]) == close_position and trade[3].lower() == 'buy'), None)
-            if buy_trade_details:
-                _, _, cp_symbol, _, buy_filled_qty, _, _, _, buy_cost_value, _ = buy_trade_details
-                symbol = cp_symbol
-                filled_qty = buy_filled_qty                                                 
-                profit_loss = ( (price * filled_qty ) - (fees + vat) ) - ( buy_cost_value )
+            buy_lot = next((lot for lot in trades if str(lot.ID) == close_position and lot.is_buy), None)
+            if buy_lot:
+                symbol = buy_lot.symbol
+                filled_qty = buy_lot.filled_qty
+                profit_loss = sell_proceeds(filled_qty, price, fees, vat) - buy_lot.cost_value
         else:                                                                               
             filled_qty = int(input("Enter Quantity = ").strip())
             profit_loss = input("Enter Profit/Loss = ").strip() or 0.0
             profit_loss = float(profit_loss)
             # Check if enough shares to sell from ticker data
-            ticker_info = next((row for row in ticker_data if row[0] == symbol), None)
-            if not ticker_info or ticker_info[1] < filled_qty:
-                console.print(f"[red]Error: Insufficient shares to sell. Available shares for {symbol}: {ticker_info[1] if ticker_info else 0}[/red]")
+            holding = next((row for row in ticker_data if row.symbol == symbol), None)
+            if not holding or not can_sell(filled_qty, holding.net_shares):
+                console.print(f"[red]Error: Insufficient shares to sell. Available shares for {symbol}: {holding.net_shares if holding else 0}[/red]")
                 input("Press Enter to continue...")
                 return
             
                                 
         trade_date = input("Enter Trade Date (DD/MM/YYYY) = ").strip() or datetime.today().strftime("%d/%m/%Y")           
             
-        cost_value = (filled_qty * price) - (fees + vat)
+        cost_value = sell_proceeds(filled_qty, price, fees, vat)
         sell_pl_text = f"[red]${profit_loss:,.2f}[/red]" if profit_loss < 0 else f"[green]${profit_loss:,.2f}[/green]"
         console.print(f"Confirm [red]Sell[/red]: [green]{filled_qty}[/green] shares of [cyan]{symbol}[/cyan] at [yellow]${price:.2f}[/yellow]. Total Value: ${cost_value:.2f} {settings.get_account().exchange_rate_label} {cost_value * settings.get_account().exchange_rate:.2f} | Profit/Loss: {sell_pl_text} {settings.get_account().exchange_rate_label} {profit_loss * settings.get_account().exchange_rate:.2f}")
         console.print(f"[red]No[/red] [dim]to cancel[/dim], Enter to [green]confirm[/green]...")
@@ -0,0 +1,318 @@
+from __future__ import annotations
+from dataclasses import dataclass, replace
+from paging import SortOrder
+from repository import Trade, amount_sql, column_sql, price_sql, select, to_amount, to_price
+from utils import date_key_sql
+
+TRADE_DATE_KEY = date_key_sql('t.trade_date')
+
+# Columns of a listed trade, the projection fetch_page loads into Trade records
+PAGE_COLUMNS = ['ID', 'trade_date', 'symbol', 'opr', 'filled_qty', 'price', 'cost_value', 'profit_loss', 'is_position_open']
+
+TRADE_COLUMNS = ", ".join(column_sql(name, 't') for name in PAGE_COLUMNS[:7])
+
+# Sortable columns of the filtered trade list. Rows are ordered by (expression, ID), in stored units
+SORT_EXPRESSIONS = {
+    'ID': "t.ID",
+    'date': TRADE_DATE_KEY,
+    'symbol': "t.symbol",
+    'qty': "t.filled_qty",
+    'price': "t.price",
+    'cost': "COALESCE(t.cost_value, 0)",
+}
+
+# Trades a filter reads, the archive is only added when the filter asks for history
+TRADES_SOURCE = "TRADES t"
+HISTORY_SOURCE = "(SELECT * FROM TRADES UNION ALL SELECT * FROM TRADES_ARCHIVE) t"
+
+# Open positions are valued at the current price, everything else keeps its realized P/L.
+# Only the sign is compared, so the open (price units) and closed (cents) branches stay unscaled
+EFFECTIVE_PL = "CASE WHEN t.is_position_open = 1 THEN t.filled_qty * (COALESCE(px.price, t.price) - t.price) ELSE COALESCE(t.profit_loss, 0) END"
+
+@dataclass(frozen=True)
+class TradeFilter:
+    """
+    Combinable trade predicates. Every field left as None is not filtered on.
+    Dates are YYYYMMDD keys (see utils.parse_date_key). history adds the archived
+    trades (see archive.py) to the ones searched.
+    """
+    symbol: str | None = None
+    opr: str | None = None
+    date_from: str | None = None
+    date_to: str | None = None
+    price_min: float | None = None
+    price_max: float | None = None
+    is_open: bool | None = None
+    pl_sign: int | None = None
+    history: bool = False
+
+    def update(self, **changes) -> TradeFilter:
+        return replace(self, **changes)
+
+    def has_date(self) -> bool:
+        return self.date_from is not None or self.date_to is not None
+
+    def describe(self) -> str:
+        parts = []
+        if self.symbol:
+            parts.append(f"symbol={self.symbol}")
+        if self.opr:
+            parts.append(f"opr={self.opr}")
+        if self.has_date():
+            parts.append(f"date={self.date_from or '...'}-{self.date_to or '...'}")
+        if self.price_min is not None or self.price_max is not None:
+            parts.append(f"price={self.price_min if self.price_min is not None else '...'}-{self.price_max if self.price_max is not None else '...'}")
+        if self.is_open is not None:
+            parts.append("open" if self.is_open else "closed")
+        if self.pl_sign:
+            parts.append("profit" if self.pl_sign > 0 else "loss")
+        description = ", ".join(parts) or "all trades"
+        return f"{description} with archive" if self.history else description
+
+def prices_cte(current_prices: dict) -> tuple[str, list]:
+    """
+    Builds a CTE carrying the current prices, in stored price units, so open P/L can be computed inside SQLite.
+    """
+    if not current_prices:
+        return "WITH px(symbol, price) AS (SELECT NULL, NULL WHERE 0)", []
+    values = ", ".join("(?, ?)" for _ in current_prices)
+    params = []
+    for symbol, price in current_prices.items():
+        params.extend((symbol, to_price(price)))
+    return f"WITH px(symbol, price) AS (VALUES {values})", params
+
+def build_where(trade_filter: TradeFilter) -> tuple[str, list]:
+    """
+    Translates a TradeFilter into a WHERE clause (without the WHERE keyword) and its parameters.
+    """
+    clauses = []
+    params = []
+    if trade_filter.symbol:
+        clauses.append("t.symbol = ?")
+        params.append(trade_filter.symbol)
+    if trade_filter.opr:
+        clauses.append("t.opr = ?")
+        params.append(trade_filter.opr)
+    if trade_filter.date_from is not None:
+        clauses.append(f"{TRADE_DATE_KEY} >= ?")
+        params.append(trade_filter.date_from)
+    if trade_filter.date_to is not None:
+        clauses.append(f"{TRADE_DATE_KEY} <= ?")
+        params.append(trade_filter.date_to)
+    if trade_filter.price_min is not None:
+        clauses.append("t.price >= ?")
+        params.append(to_price(trade_filter.price_min))
+    if trade_filter.price_max is not None:
+        clauses.append("t.price <= ?")
+        params.append(to_price(trade_filter.price_max))
+    if trade_filter.is_open is not None:
+        clauses.append("t.is_position_open = 1" if trade_filter.is_open else "COALESCE(t.is_position_open, 0) = 0")
+    if trade_filter.pl_sign:
+        clauses.append(f"({EFFECTIVE_PL}) {'>' if trade_filter.pl_sign > 0 else '<'} 0")
+    return " AND ".join(clauses) or "1", params
+
+def _source(trade_filter: TradeFilter, current_prices: dict) -> tuple[str, str, list]:
+    """
+    Returns the CTE prefix, FROM clause and parameters for a filter.
+    Current prices are only joined in when the P/L sign predicate needs them,
+    the archive only when the filter asks for history.
+    """
+    trades = HISTORY_SOURCE if trade_filter.history else TRADES_SOURCE
+    if trade_filter.pl_sign:
+        cte, params = prices_cte(current_prices)
+        return cte, f"{trades} LEFT JOIN px ON px.symbol = t.symbol", params
+    return "", trades, []
+
+def prices_key(trade_filter: TradeFilter, current_prices: dict) -> tuple | None:
+    """
+    The part of the current prices a query result depends on, for use in cache keys.
+    """
+    if trade_filter.pl_sign:
+        return tuple(sorted(current_prices.items()))
+    return None
+
+def sort_value(trade: Trade, column: str):
+    """
+    The value of a listed trade under SORT_EXPRESSIONS[column], for keyset page starts.
+    """
+    if column == 'date':
+        return trade.trade_date[6:10] + trade.trade_date[3:5] + trade.trade_date[0:2]
+    if column == 'cost':
+        return to_amount(trade.cost_value or 0)
+    if column == 'price':
+        return to_price(trade.price)
+    return getattr(trade, {'qty': 'filled_qty'}.get(column, column))
+
+def _order_by(sort: SortOrder) -> tuple[str, str]:
+    """
+    The ORDER BY clause and the keyset comparison operator for a sort order.
+    """
+    expression = SORT_EXPRESSIONS[sort.column]
+    if sort.descending:
+        return f"{expression} DESC, t.ID DESC", "<"
+    return f"{expression}, t.ID", ">"
+
+def fetch_page(cursor, trade_filter: TradeFilter, current_prices: dict, after: tuple | None = None, page_size: int = 50, sort: SortOrder = SortOrder()) -> list:
+    """
+    Returns one page of trades in the sort order (ties by ID), starting after the given (sort value, ID) key.
+    Trades hold the PAGE_COLUMNS only, with the stored profit_loss; use value_rows to price open positions.
+    """
+    cte, source, params = _source(trade_filter, current_prices)
+    where, where_params = build_where(trade_filter)
+    params.extend(where_params)
+    order_by, compare = _order_by(sort)
+    if after is not None:
+        where += f" AND ({SORT_EXPRESSIONS[sort.column]}, t.ID) {compare} (?, ?)"
+        params.extend(after)
+    params.append(page_size)
+    return select(cursor.connection, Trade, f"""
+        {cte}
+        SELECT {TRADE_COLUMNS}, {column_sql('profit_loss', 't')}, t.is_position_open
+        FROM {source}
+        WHERE {where}
+        ORDER BY {order_by}
+        LIMIT ?
+    """, params, PAGE_COLUMNS).fetchall()
+
+def locate(cursor, trade_filter: TradeFilter, current_prices: dict, trade_id: int, page_size: int = 50, sort: SortOrder = SortOrder()) -> list | None:
+    """
+    Page start keys (see TradePager.starts) up to the page holding trade_id,
+    or None when the trade does not match the filter.
+    """
+    cte, source, params = _source(trade_filter, current_prices)
+    where, where_params = build_where(trade_filter)
+    params.extend(where_params)
+    expression = SORT_EXPRESSIONS[sort.column]
+    order_by, compare = _order_by(sort)
+    row = cursor.execute(f"{cte} SELECT {expression} FROM {source} WHERE {where} AND t.ID = ?", params + [trade_id]).fetchone()
+    if row is None:
+        return None
+    # Rows sorted before the trade give its position, every page_size-th of them starts a page
+    cursor.execute(f"""
+        {cte}
+        SELECT key, ID FROM (
+            SELECT {expression} AS key, t.ID AS ID, ROW_NUMBER() OVER (ORDER BY {order_by}) AS rn
+            FROM {source}
+            WHERE {where} AND ({expression}, t.ID) {'>' if compare == '<' else '<'} (?, ?)
+        )
+        WHERE rn % ? = 0
+        ORDER BY rn
+    """, params + [row[0], trade_id, page_size])
+    return [None] + [tuple(start) for start in cursor.fetchall()]
+
+def value_rows(rows: list[Trade], current_prices: dict) -> list[Trade]:
+    """
+    Copies of the trades with profit_loss of open positions at the current price.
+    Cached pages are shared, so they are not modified in place.
+    """
+    valued = []
+    for trade in rows:
+        if trade.is_open:
+            trade = replace(trade, profit_loss=trade.filled_qty * (current_prices.get(trade.symbol, trade.price) - trade.price))
+        elif trade.profit_loss is None:
+            trade = replace(trade, profit_loss=0)
+        valued.append(trade)
+    return valued
+
+def aggregate(cursor, trade_filter: TradeFilter, current_prices: dict) -> dict:
+    """
+    Totals for every trade matching the filter, computed in SQLite.
+    Buys add and sells subtract from qty and cost value. The result does not depend on
+    current prices (unless the filter does): open positions come back as per symbol
+    (qty, cost) lots and are priced by total_pl.
+    """
+    cte, source, params = _source(trade_filter, current_prices)
+    where, where_params = build_where(trade_filter)
+    params.extend(where_params)
+    cursor.execute(f"""
+        {cte}
+        SELECT COUNT(*),
+        COALESCE(SUM(CASE WHEN t.opr = 'buy' THEN t.filled_qty ELSE -t.filled_qty END), 0),
+        {amount_sql("COALESCE(SUM(CASE WHEN t.opr = 'buy' THEN t.cost_value ELSE -t.cost_value END), 0)")},
+        {amount_sql("COALESCE(SUM(CASE WHEN t.is_position_open = 1 THEN 0 ELSE COALESCE(t.profit_loss, 0) END), 0)")},
+        COALESCE(SUM(CASE WHEN t.opr = 'buy' AND t.is_position_open = 1 THEN t.filled_qty ELSE 0 END), 0)
+        FROM {source}
+        WHERE {where}
+    """, params)
+    count, qty, cost_value, closed_pl, open_qty = cursor.fetchone()
+    cursor.execute(f"""
+        {cte}
+        SELECT t.symbol, SUM(t.filled_qty), {price_sql('SUM(t.filled_qty * t.price)')}
+        FROM {source}
+        WHERE {where} AND t.is_position_open = 1
+        GROUP BY t.symbol
+    """, params)
+    open_lots = cursor.fetchall()
+    # Per date sums so totals can be converted at the exchange rate of each trade date
+    cursor.execute(f"""
+        {cte}
+        SELECT CAST({TRADE_DATE_KEY} AS INTEGER),
+        {amount_sql("SUM(CASE WHEN t.opr = 'buy' THEN t.cost_value ELSE -t.cost_value END)")},
+        {amount_sql("SUM(CASE WHEN t.is_position_open = 1 THEN 0 ELSE COALESCE(t.profit_loss, 0) END)")}
+        FROM {source}
+        WHERE {where}
+        GROUP BY 1
+    """, params)
+    by_date = cursor.fetchall()
+    return {'count': count, 'qty': qty, 'cost_value': cost_value, 'closed_pl': closed_pl, 'open_qty': open_qty, 'open_lots': open_lots, 'by_date': by_date}
+
+def total_pl(totals: dict, trade_filter: TradeFilter, current_prices: dict) -> float:
+    """
+    Realized P/L plus open P/L at the current prices. When the filter has a date
+    range only closed positions count, like the old month/year report.
+    """
+    if trade_filter.has_date():
+        return totals['closed_pl']
+    open_pl = sum(qty * current_prices[symbol] - cost for symbol, qty, cost in totals['open_lots'] if symbol in current_prices)
+    return totals['closed_pl'] + open_pl
+
+class TradePager:
+    """
+    Keyset pagination over a filtered trade list.
+    fetch(after, page_size) returns the rows following the (sort value, ID) key, see fetch_page.
+    Keeps the key each visited page started after, so previous pages are cheap too.
+    """
+    def __init__(self, trade_filter: TradeFilter, fetch, page_size: int = 50, sort: SortOrder = SortOrder()):
+        self.trade_filter = trade_filter
+        self.fetch = fetch
+        self.page_size = page_size
+        self.sort = sort
+        self.starts = [None]
+        self.rows = []
+        self.highlight = None
+
+    @property
+    def page(self) -> int:
+        return len(self.starts)
+
+    def load(self) -> list:
+        self.rows = self.fetch(self.starts[-1], self.page_size)
+        return self.rows
+
+    def next(self) -> bool:
+        if len(self.rows) < self.page_size:
+            return False
+        last = self.rows[-1]
+        self.highlight = None
+        self.starts.append((sort_value(last, self.sort.column), last.ID))
+        if not self.load():
+            self.starts.pop()
+            self.load()
+            return False
+        return True
+
+    def previous(self) -> bool:
+        if len(self.starts) == 1:
+            return False
+        self.starts.pop()
+        self.highlight = None
+        self.load()
+        return True
+
+    def jump(self, starts: list, trade_id: int):
+        """
+        Shows the last page of starts (see locate) with trade_id highlighted.
+        """
+        self.starts = starts
+        self.highlight = trade_id
+        self.load()
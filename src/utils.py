@@ -8,4 +8,28 @@ def get_exec_path( name: str ) -> str:
     return os.path.join( name )
 
 def get_db_path( account_name: str ) -> str:
-    return get_exec_path( f'{account_name}.db' )
\ No newline at end of file
+    return get_exec_path( f'{account_name}.db' )
+
+def date_key_sql( column: str ) -> str:
+    """
+    SQL expression turning a DD/MM/YYYY text column into a sortable YYYYMMDD key.
+    The same text is used by the expression indexes in migrate.py, so keep it identical.
+    """
+    return f"(SUBSTR({column}, 7, 4) || SUBSTR({column}, 4, 2) || SUBSTR({column}, 1, 2))"
+
+def parse_date_key( date_str: str, end: bool = False ) -> str:
+    """
+    Converts DD/MM/YYYY, MM/YYYY or YYYY into a YYYYMMDD key.
+    Partial dates resolve to the first day of the period, or the last one when end is True.
+    Raises ValueError for anything else.
+    """
+    parts = date_str.strip().split('/')
+    if len(parts) == 1 and len(parts[0]) == 4 and parts[0].isdigit():
+        return parts[0] + ("1231" if end else "0101")
+    if len(parts) == 2 and len(parts[1]) == 4 and parts[0].isdigit() and parts[1].isdigit() and 1 <= int(parts[0]) <= 12:
+        return f"{parts[1]}{int(parts[0]):02d}" + ("31" if end else "01")
+    if len(parts) == 3 and all(part.isdigit() for part in parts) and len(parts[2]) == 4:
+        day, month, year = int(parts[0]), int(parts[1]), parts[2]
+        if 1 <= month <= 12 and 1 <= day <= 31:
+            return f"{year}{month:02d}{day:02d}"
+    raise ValueError(f"Invalid date '{date_str}', expected DD/MM/YYYY, MM/YYYY or YYYY")
@@ -0,0 +1,137 @@
+"""
+Bulk P/L computation for the dashboard. Open lots and holdings are held as NumPy arrays,
+so re-pricing after a quote refresh is a handful of vector operations and the tables
+in dashboard.py only format the results.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import numpy as np
+from paging import SortOrder
+from repository import Holding, Lot
+
+@dataclass
+class LotValues:
+    """
+    Per-lot columns (arrays aligned with LotBook.lots) and their totals at one set of prices.
+    """
+    current_price: np.ndarray
+    pl: np.ndarray
+    pl_percent: np.ndarray
+    pl_sec: np.ndarray
+    cost_price: np.ndarray
+    total_qty: float
+    total_cost_value: float
+    total_pl: float
+    total_pl_percent: float
+    total_pl_sec: float
+    avg_price: float
+
+class LotBook:
+    """
+    Open lots as column arrays, built once per snapshot and re-priced on every redraw.
+    """
+    SORT_COLUMNS = ['ID', 'date', 'symbol', 'qty', 'price', 'cost', 'pl']
+
+    def __init__(self, lots: list[Lot]):
+        self.lots = lots
+        count = len(lots)
+        self.ids = np.fromiter((lot.ID for lot in lots), dtype=np.int64, count=count)
+        self.date_keys = np.fromiter((int(lot.trade_date[6:10] + lot.trade_date[3:5] + lot.trade_date[0:2]) for lot in lots), dtype=np.int64, count=count)
+        self.qty = np.fromiter((lot.filled_qty for lot in lots), dtype=np.float64, count=count)
+        self.price = np.fromiter((lot.price for lot in lots), dtype=np.float64, count=count)
+        self.cost_value = np.fromiter((lot.cost_value or 0 for lot in lots), dtype=np.float64, count=count)
+        self.stored_pl = np.fromiter((lot.profit_loss or 0 for lot in lots), dtype=np.float64, count=count)
+        self.is_buy = np.fromiter((lot.is_buy for lot in lots), dtype=bool, count=count)
+        self.symbols, self.symbol_index = np.unique([lot.symbol for lot in lots], return_inverse=True)
+
+    def __len__(self) -> int:
+        return len(self.lots)
+
+    def current_prices(self, current_prices: dict) -> np.ndarray:
+        """
+        The current price of every lot; symbols without a quote use the lot's own price.
+        """
+        quoted = np.array([current_prices.get(symbol, np.nan) for symbol in self.symbols.tolist()], dtype=np.float64)
+        current = quoted[self.symbol_index] if len(self.lots) else np.empty(0)
+        return np.where(np.isnan(current), self.price, current)
+
+    def value(self, current_prices: dict, fees_usd: float, rate: float) -> LotValues:
+        """
+        Open buys are valued at the current price less a round trip of fees,
+        anything else keeps its stored profit_loss.
+        """
+        current = self.current_prices(current_prices)
+        pl = np.where(self.is_buy, (current - self.price) * self.qty - fees_usd * 2, self.stored_pl)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pl_percent = np.where(self.cost_value != 0, pl / self.cost_value, 0.0)
+            cost_price = (self.qty * self.price + fees_usd) / self.qty
+        total_qty = float(self.qty.sum())
+        total_cost_value = float(self.cost_value.sum())
+        total_pl = float(pl.sum())
+        return LotValues(
+            current_price=current,
+            pl=pl,
+            pl_percent=pl_percent,
+            pl_sec=pl * rate,
+            cost_price=cost_price,
+            total_qty=total_qty,
+            total_cost_value=total_cost_value,
+            total_pl=total_pl,
+            total_pl_percent=total_pl / total_cost_value if total_cost_value != 0 else 0,
+            total_pl_sec=total_pl * rate,
+            avg_price=total_cost_value / total_qty if total_qty else 0,
+        )
+
+    def order(self, values: LotValues, sort: SortOrder) -> np.ndarray:
+        """
+        Lot indexes in display order, ties broken by ID.
+        """
+        keys = {
+            'ID': self.ids,
+            'date': self.date_keys,
+            'symbol': self.symbol_index,
+            'qty': self.qty,
+            'price': self.price,
+            'cost': self.cost_value,
+            'pl': values.pl,
+        }[sort.column]
+        if sort.descending:
+            return np.lexsort((-self.ids, -keys))
+        return np.lexsort((self.ids, keys))
+
+@dataclass
+class HoldingValues:
+    """
+    Per-symbol columns aligned with the holdings list, plus the market value total.
+    """
+    market_value: np.ndarray
+    unrealized_pl: np.ndarray
+    funds_percent: np.ndarray
+    realized_sec: np.ndarray
+    avg_cost: np.ndarray
+    total_market_value: float
+
+def value_holdings(holdings: list[Holding], total_funds: float, rate: float, realized_sec: dict) -> HoldingValues:
+    """
+    Values holdings already priced at the current prices (see dashboard.get_ticker_data).
+    Realized P/L in the secondary currency comes from the as-of conversion when known.
+    """
+    count = len(holdings)
+    net_shares = np.fromiter((holding.net_shares for holding in holdings), dtype=np.float64, count=count)
+    total_cost = np.fromiter((holding.total_cost for holding in holdings), dtype=np.float64, count=count)
+    price = np.fromiter((holding.price for holding in holdings), dtype=np.float64, count=count)
+    profit = np.fromiter((holding.profit for holding in holdings), dtype=np.float64, count=count)
+    converted = np.array([realized_sec.get(holding.symbol, np.nan) for holding in holdings], dtype=np.float64)
+
+    market_value = net_shares * price
+    unrealized_pl = market_value - total_cost
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_cost = total_cost / net_shares
+    return HoldingValues(
+        market_value=market_value,
+        unrealized_pl=unrealized_pl,
+        funds_percent=unrealized_pl / total_funds if total_funds else np.zeros(count),
+        realized_sec=np.where(np.isnan(converted), profit * rate, converted),
+        avg_cost=avg_cost,
+        total_market_value=float(market_value.sum()),
+    )
@@ -0,0 +1,27 @@
+import os
+import sqlite3
+import sys
+import pytest
+
+# The modules import each other by name, as when run from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import migrate
+import repository
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    migrate.create_schema(conn)
+    yield conn
+    conn.close()
+
+def add_trade(conn: sqlite3.Connection, opr: str, symbol: str, filled_qty: int, price: float, cost_value: float,
+              profit_loss: float = 0.0, trade_date: str = "01/02/2025") -> int:
+    cursor = conn.execute("""
+        INSERT INTO TRADES (trade_date, symbol, opr, filled_qty, price, fees, vat, cost_value, profit_loss, is_position_open)
+        VALUES (?, ?, ?, ?, ?, 0, 0, ?, ?, ?)
+    """, (trade_date, symbol, opr, filled_qty, repository.to_price(price), repository.to_amount(cost_value),
+          repository.to_amount(profit_loss), 1 if opr == 'buy' else 0))
+    conn.commit()
+    return cursor.lastrowid
@@ -0,0 +1,27 @@
+import pytest
+import batch_entry
+import repository
+from conftest import add_trade
+
+def test_plain_sell_after_a_sell_is_against_the_buy_cost(conn):
+    add_trade(conn, 'buy', '$X', 10, 100, 1000)
+    add_trade(conn, 'sell', '$X', 5, 150, 750, profit_loss=250)
+    holding, = repository.holdings(conn)
+    assert (holding.net_shares, holding.total_cost) == (5, 250)
+    trades, errors = batch_entry.parse_batch(["s $X 5 150 0 0"])
+    cash, errors = batch_entry.validate(trades, 0.0, [holding])
+    assert errors == []
+    assert trades[0].profit_loss == pytest.approx(250)
+    assert cash == pytest.approx(750)
+
+def test_batch_buys_count_in_the_basis(conn):
+    add_trade(conn, 'buy', '$X', 10, 100, 1000)
+    trades, _ = batch_entry.parse_batch(["b $X 10 200 0 0", "s $X 10 180 0 0"])
+    _, errors = batch_entry.validate(trades, 5000.0, repository.holdings(conn))
+    assert errors == []
+    assert trades[1].profit_loss == pytest.approx(1800 - 1500)
+
+def test_dates_are_stored_zero_padded():
+    trades, errors = batch_entry.parse_batch(["b $X 1 10 0 0 1/2/2025", "b $X 1 10 0 0 31/2/2025"])
+    assert [trade.trade_date for trade in trades] == ["01/02/2025"]
+    assert len(errors) == 1 and errors[0].startswith("Line 2:")
@@ -0,0 +1,17 @@
+import sqlite3
+import migrate
+import session
+from settings import Settings
+
+def test_database_without_funds_gets_the_full_schema(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    conn = sqlite3.connect("traders.db")
+    conn.executescript(migrate.schema_trades_sql)
+    conn.close()
+    sessions = session.SessionManager()
+    account = sessions.get(Settings())
+    try:
+        account.refresh(1.0)
+        assert account.conn.execute("SELECT COUNT(*) FROM SYMBOL_ROLLUP").fetchone() == (0,)
+    finally:
+        account.close()
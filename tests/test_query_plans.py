@@ -0,0 +1,22 @@
+import pytest
+import profiler
+import query_plans
+
+def test_index_walks_without_a_limit_read_the_table_whole():
+    assert query_plans.full_scans("SELECT * FROM TRADES", "SCAN TRADES") == {'TRADES'}
+    assert query_plans.full_scans("SELECT symbol FROM TRADES", "SCAN TRADES USING COVERING INDEX idx_trades_symbol_opr_price") == {'TRADES'}
+    assert query_plans.full_scans("SELECT * FROM FUNDS f", "SCAN acc0.FUNDS; SCAN f USING INDEX idx_funds_source") == {'FUNDS'}
+    assert query_plans.full_scans("SELECT * FROM TRADES t WHERE symbol = ?", "SEARCH t USING INDEX idx_trades_symbol (symbol=?)") == set()
+
+def test_a_limit_bounds_the_walk_unless_it_sorts_first():
+    assert query_plans.full_scans("SELECT * FROM TRADES t ORDER BY price LIMIT 50", "SCAN t USING INDEX idx_trades_price") == set()
+    assert query_plans.full_scans("SELECT * FROM TRADES t ORDER BY vat LIMIT 50", "SCAN t; USE TEMP B-TREE FOR ORDER BY") == {'TRADES'}
+
+def test_application_queries_keep_their_indexes(monkeypatch):
+    # The guard captures every plan, put the profiler back for the other tests
+    monkeypatch.setattr(profiler, '_enabled', profiler._enabled)
+    monkeypatch.setattr(profiler, '_slow_ms', profiler._slow_ms)
+    with query_plans.generated(trades=20_000, funds=1_000) as ctx:
+        results = query_plans.check(ctx)
+    failures = {query.name: scanned for query, _, scanned in results if scanned}
+    assert failures == {}
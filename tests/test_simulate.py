@@ -0,0 +1,25 @@
+import pytest
+import snapshot
+import simulate
+from batch_entry import parse_batch
+from conftest import add_trade
+
+def scenario(conn):
+    add_trade(conn, 'buy', '$X', 10, 100, 1000)
+    add_trade(conn, 'sell', '$X', 5, 150, 750, profit_loss=250)
+    return simulate.Scenario(snapshot.load_snapshot(conn.cursor()), {'$X': 150.0}, fees_usd=0.0)
+
+def test_sell_after_a_sell_is_against_the_buy_cost(conn):
+    sim = scenario(conn)
+    (trade,), _ = parse_batch(["s $X 2 150 0 0"])
+    assert sim.apply(trade) is None
+    assert trade.profit_loss == pytest.approx(100)
+    holding = sim.holdings['$X']
+    assert (holding.net_shares, holding.total_cost) == (3, pytest.approx(50))
+    (trade,), _ = parse_batch(["s $X 3 150 0 0"])
+    assert sim.apply(trade) is None
+    assert trade.profit_loss == pytest.approx(150)
+
+def test_grid_sell_uses_the_buy_cost(conn):
+    grid = scenario(conn).grid('sell', '$X', [1, 5], [150])
+    assert grid.realized_pl[:, 0] == pytest.approx([50, 250])
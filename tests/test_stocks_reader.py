@@ -0,0 +1,20 @@
+import sqlite3
+import pandas as pd
+import journal
+import migrate
+from settings import Settings
+from stocks_reader import read_and_print_rows
+
+def test_import_is_one_journal_entry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    conn = sqlite3.connect("traders.db")
+    migrate.create_schema(conn)
+    frame = pd.DataFrame([[1, None, "03/02/2025", "$X", 10, 100.0, 1.8, 0.27, None, 1002.07, None],
+                          [1, None, "04/02/2025", "$Y", 5, 20.0, 1.8, 0.27, None, 102.07, None],
+                          [1, None, "05/02/2025", "$Z", "ten", 20.0, 1.8, 0.27, None, 102.07, None]])
+    read_and_print_rows(frame, 'buy', [1, 2, 3], quiet=True, settings=Settings())
+    assert conn.execute("SELECT COUNT(*) FROM TRADES").fetchone() == (2,)
+    assert [entry.action for entry in journal.entries(conn)] == ['import']
+    journal.undo(conn)
+    assert conn.execute("SELECT COUNT(*) FROM TRADES").fetchone() == (0,)
+    conn.close()